@@ -1,8 +1,16 @@
-from flask import Flask, request, render_template, redirect, url_for, send_from_directory
+from flask import Flask, request, render_template, redirect, url_for, send_from_directory, jsonify, abort
 import os
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from scanner import BetSlipScanner
+from scanner import BetSlipScanner, DEFAULT_SPORTSBOOK
+from vocabulary import sportsbooks
+from retention import RetentionWorker, touch_access
+from warmup import WarmUp
+from jobqueue import QUEUE_URL, open_queue
+from deadline import scan_metrics
+from ocrpool import OCR_WORKERS, OcrPool
+from search import PER_PAGE, SearchIndex
+from scheduler import bulk_paused, pause_bulk, resume_bulk
 from datetime import datetime
 
 app = Flask(__name__)
@@ -14,15 +22,92 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+# With CAPPING_QUEUE_URL set, uploads are scanned by `scanner.py worker`
+# processes (see jobqueue.py) instead of in the web process.
+scan_queue = open_queue(QUEUE_URL) if QUEUE_URL else None
+SCAN_WAIT_TIMEOUT = float(os.environ.get('CAPPING_SCAN_WAIT_S', 120))
+
+# Pools and background threads belong to the process that serves requests:
+# the module imported by a WSGI server or `flask run`, or the debug
+# reloader's child. Not the reloader's watcher process, and not OCR pool
+# workers, which re-import this module as __mp_main__ when it is run as a script.
+SERVING = __name__ != '__mp_main__' and (__name__ == 'app' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+
+# With CAPPING_OCR_WORKERS set (and no queue), OCR runs in a process pool
+# that receives decoded images through shared memory
+ocr_pool = OcrPool(OCR_WORKERS) if OCR_WORKERS and scan_queue is None and SERVING else None
+
+# Width the upload page shrinks screenshots to before sending them
+UPLOAD_WIDTH = int(os.environ.get('CAPPING_UPLOAD_WIDTH', 1080))
+
+# Warm the scan pipeline, and compact and evict archived uploads, in the background
+warmup = WarmUp(app, DEFAULT_SPORTSBOOK, ocr=scan_queue is None, ocr_pool=ocr_pool)
+if SERVING:
+   warmup.start()
+   RetentionWorker(app.config['UPLOAD_FOLDER']).start()
+
 def allowed_file(filename):
    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/')
 def index():
-   return render_template('index.html')
+   return render_template('index.html', sportsbooks=sportsbooks(), default_sportsbook=DEFAULT_SPORTSBOOK,
+                          upload_width=UPLOAD_WIDTH)
+
+def original_size():
+   """(width, height) of the screenshot before the upload page shrank it, if it did."""
+   try:
+       width = int(request.form.get('original_width', ''))
+       height = int(request.form.get('original_height', ''))
+   except ValueError:
+       return None
+   return (width, height) if width > 0 and height > 0 else None
+
+@app.route('/ready')
+def ready():
+   status = warmup.status()
+   return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics():
+   # Scans done in this process; queue workers archive their latency with each scan
+   metrics = scan_metrics.snapshot()
+   if ocr_pool is not None:
+       metrics['ocr_pool'] = ocr_pool.stats()
+   if scan_queue is not None:
+       # Queued jobs and queue wait per priority class, across all workers
+       metrics['queue'] = scan_queue.stats()
+   return jsonify(metrics)
+
+@app.route('/search')
+def search():
+   # ?q=lebron "made threes"&page=2&sort=relevance -- words, "phrases", prefix* and player:/prop:/text: terms
+   page = request.args.get('page', 1, type=int)
+   per_page = request.args.get('per_page', PER_PAGE, type=int)
+   index = SearchIndex()
+   try:
+       return jsonify(index.search(request.args.get('q', ''), page=page, per_page=per_page,
+                                   sort=request.args.get('sort', 'recent')))
+   finally:
+       index.close()
+
+@app.route('/bulk/<action>', methods=['POST'])
+def bulk(action):
+   # Pauses or resumes bulk jobs on the queue workers and `scanner.py scan-dir` runs on this data directory
+   if action == 'pause':
+       pause_bulk()
+   elif action == 'resume':
+       resume_bulk()
+   else:
+       return jsonify({'error': f"unknown action {action!r}"}), 404
+   return jsonify({'paused': bulk_paused()})
 
 @app.route('/images/<filename>')
 def uploaded_file(filename):
+   # Only the images themselves: the .ocr.json sidecars next to them stay private
+   if not allowed_file(filename):
+      abort(404)
+   touch_access(Path(app.config['UPLOAD_FOLDER']) / secure_filename(filename))
    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/upload', methods=['POST'])
@@ -39,12 +124,34 @@ def upload_file():
        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
        file.save(filepath)
        
-       scanner = BetSlipScanner()
-       result = scanner.scan_image(Path(filepath))
+       sportsbook = request.form.get('sportsbook', DEFAULT_SPORTSBOOK)
+       if sportsbook not in sportsbooks():
+           sportsbook = DEFAULT_SPORTSBOOK
+       # reuse=0 always OCRs, and archive=0 scans without archiving or indexing
+       # the upload and deletes it afterwards (loadtest.py sets both, to
+       # measure tesseract without filling the archive with copies)
+       incremental = request.form.get('reuse', '1') != '0'
+       archive = request.form.get('archive', '1') != '0'
+       try:
+           if scan_queue is not None:
+               job_id = scan_queue.enqueue({'image': str(Path(filepath).resolve()), 'sportsbook': sportsbook,
+                                            'original_size': original_size(), 'incremental': incremental,
+                                            'archive': archive})
+               job = scan_queue.wait(job_id, SCAN_WAIT_TIMEOUT)
+               if job is None:
+                   return "Scan is taking too long, please try again shortly", 504
+               results = job['result'] if job['status'] == 'done' else None
+           else:
+               scanner = BetSlipScanner(archive=archive, sportsbook=sportsbook, ocr_pool=ocr_pool)
+               results = scanner.scan_slips(Path(filepath), incremental=incremental,
+                                            original_size=original_size())
+       finally:
+           if not archive:
+               os.remove(filepath)
        
-       if result:
+       if results:
            return render_template('result.html', 
-                               result=result, 
+                               results=results, 
                                filename=filename,
                                datetime=datetime)
        else:
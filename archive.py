@@ -0,0 +1,121 @@
+"""Raw OCR text archive and parallel reparse.
+
+Each scanned image gets a sidecar `<image>.ocr.json` holding the raw
+tesseract output, the engine/config it came from, the parser version and
+the parsed result. `reparse_records` streams those sidecars through the
+current parser across all cores, so parser upgrades never need re-OCR.
+"""
+import json
+import os
+from datetime import datetime
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+ARCHIVE_SUFFIX = '.ocr.json'
+
+
+def archive_path(image_path: Path) -> Path:
+    return image_path.with_name(image_path.name + ARCHIVE_SUFFIX)
+
+
+def load_record(path: Path) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_record(path: Path, record: Dict):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def save_record(image_path: Path, slips: List[Dict], engine: str,
+                engine_version: Optional[str], ocr_config: str, parser_version: str,
+                **extra) -> Path:
+    """Archive a scan; `slips` holds one {'box', 'text', 'result'} per bet card."""
+    path = archive_path(image_path)
+    write_record(path, {
+        **extra,
+        'image': image_path.name,
+        'engine': engine,
+        'engine_version': engine_version,
+        'ocr_config': ocr_config,
+        'parser_version': parser_version,
+        'scanned_at': datetime.now().isoformat(timespec='seconds'),
+        'slips': slips,
+    })
+    return path
+
+
+def record_slips(record: Dict) -> List[Dict]:
+    """Slips of a record, including records written before card segmentation."""
+    if 'slips' in record:
+        return record['slips']
+    return [{'box': None, 'text': record['text'], 'result': record.get('result')}]
+
+
+def iter_records(root: Path) -> Iterator[Path]:
+    """Yield every archive sidecar under `root` without listing it all up front."""
+    root = Path(root)
+    if root.is_file():
+        yield root
+        return
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(ARCHIVE_SUFFIX):
+                yield Path(dirpath) / filename
+
+
+_worker_scanner = None
+
+
+def _init_worker():
+    global _worker_scanner
+    from scanner import BetSlipScanner
+    _worker_scanner = BetSlipScanner(verbose=False)
+
+
+def _reparse_one(job: Tuple[str, bool]) -> Tuple[str, str, List[Dict]]:
+    path, force = job
+    from scanner import PARSER_VERSION
+    try:
+        record = load_record(Path(path))
+        slips = record_slips(record)
+        if not force and record.get('parser_version') == PARSER_VERSION:
+            return path, 'current', [slip['result'] for slip in slips]
+        from bets import fingerprint
+        changed = False
+        for idx, slip in enumerate(slips, 1):
+            result = _worker_scanner.extract_legs(slip['text'])
+            if len(slips) > 1:
+                result['slip_index'] = idx
+            changed = changed or result != slip['result']
+            slip['result'] = result
+            slip['fingerprint'] = fingerprint(result)
+        record.pop('text', None)
+        record.pop('result', None)
+        record['slips'] = slips
+        record['parser_version'] = PARSER_VERSION
+        record['reparsed_at'] = datetime.now().isoformat(timespec='seconds')
+        write_record(Path(path), record)
+        return path, 'changed' if changed else 'unchanged', [slip['result'] for slip in slips]
+    except Exception as e:
+        return path, f"error: {e}", []
+
+
+def reparse_records(paths: Iterable[Path], workers: Optional[int] = None,
+                    force: bool = False, chunksize: int = 64) -> Iterator[Tuple[str, str, List[Dict]]]:
+    """Reparse archived OCR text in parallel, rewriting each sidecar in place.
+
+    Yields (path, status, results) as records complete; status is one of
+    'current', 'changed', 'unchanged' or 'error: ...'.
+    """
+    jobs = ((str(path), force) for path in paths)
+    if workers == 1:
+        _init_worker()
+        yield from map(_reparse_one, jobs)
+        return
+    with Pool(processes=workers, initializer=_init_worker) as pool:
+        yield from pool.imap_unordered(_reparse_one, jobs, chunksize=chunksize)
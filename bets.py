@@ -0,0 +1,146 @@
+"""Canonical bet records keyed by a fingerprint of the slip's content.
+
+The same bet is usually scanned while open and again once it shows
+"WON ON FANDUEL". Both scans produce the same fingerprint (normalized legs,
+bet type and wager), so at ingest time the second scan updates the
+existing bet instead of creating a duplicate. The open scan supplies
+`potential_payout` and the settled one supplies `won_amount`.
+
+Each scan is stored once in `bet_scans`, keyed by its archive record and
+slip index. Its bet's aggregate row in `bets` is recomputed from the
+linked scans, so ingesting again (after a reparse, or an index rebuild) is
+idempotent.
+
+Failed parses (no legs or no wager) are not ingested: they would all
+share one fingerprint and be merged into a single bogus bet.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from scanner import DATA_DIR
+
+BETS_DB = DATA_DIR / 'bets.db'
+
+
+def normalize_leg(leg: Dict) -> str:
+    position = re.sub(r'[^a-z0-9 ]', '', leg.get('position', '').lower())
+    details = re.sub(r'[^A-Z0-9+. ]', '', leg.get('details', '').upper())
+    return f"{' '.join(position.split())}|{' '.join(details.split())}"
+
+
+def bet_legs(result: Dict) -> List[str]:
+    return sorted(normalize_leg(leg) for game in result.get('games', []) for leg in game['positions'])
+
+
+def is_bet(result: Dict) -> bool:
+    """Whether a parse read enough of the slip (legs and a wager) to identify its bet."""
+    return bool(bet_legs(result)) and (result.get('total_wager') or 0) > 0
+
+
+def fingerprint(result: Dict) -> str:
+    """Stable id of a bet: legs, bet type and wager, independent of status."""
+    canonical = json.dumps({
+        'bet_type': result.get('bet_type', '').lower(),
+        'wager_cents': int(round((result.get('total_wager') or 0) * 100)),
+        'legs': bet_legs(result),
+    }, sort_keys=True)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class BetIndex:
+    def __init__(self, path: Path = BETS_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS bets (
+                fingerprint TEXT PRIMARY KEY,
+                bet_type TEXT,
+                wager REAL,
+                legs TEXT,
+                potential_payout REAL,
+                won_amount REAL,
+                bet_finished INTEGER,
+                status TEXT,
+                scans INTEGER,
+                first_seen TEXT,
+                last_seen TEXT
+            );
+            CREATE TABLE IF NOT EXISTS bet_scans (
+                source TEXT NOT NULL,
+                slip_index INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                scanned_at TEXT,
+                potential_payout REAL,
+                won_amount REAL,
+                bet_finished INTEGER,
+                PRIMARY KEY (source, slip_index)
+            );
+            CREATE INDEX IF NOT EXISTS bet_scans_fingerprint ON bet_scans (fingerprint);
+        ''')
+        self.db.commit()
+
+    def ingest(self, result: Dict, source: Path, slip_index: int = 1,
+               scanned_at: Optional[str] = None) -> Tuple[Optional[str], bool]:
+        """Link a scan to its bet; returns (fingerprint, whether the bet is new).
+
+        A scan that is not a bet (see `is_bet`) is unlinked from any bet it
+        was ingested as before, and (None, False) is returned.
+        """
+        source = str(Path(source).resolve())
+        scanned_at = scanned_at or datetime.now().isoformat(timespec='seconds')
+        with self.db:
+            previous = self.db.execute(
+                'SELECT fingerprint FROM bet_scans WHERE source = ? AND slip_index = ?',
+                (source, slip_index)).fetchone()
+            if not is_bet(result):
+                if previous:
+                    self.db.execute('DELETE FROM bet_scans WHERE source = ? AND slip_index = ?',
+                                    (source, slip_index))
+                    self._refresh(previous['fingerprint'])
+                return None, False
+            fp = fingerprint(result)
+            is_new = self.db.execute('SELECT 1 FROM bets WHERE fingerprint = ?', (fp,)).fetchone() is None
+            self.db.execute(
+                'INSERT OR REPLACE INTO bet_scans VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (source, slip_index, fp, scanned_at, result.get('total_payout') or 0.0,
+                 result.get('won_amount') or 0.0, int(bool(result.get('bet_finished')))))
+            self._refresh(fp, result)
+            if previous and previous['fingerprint'] != fp:
+                # A reparse changed what this scan says; detach it from the old bet
+                self._refresh(previous['fingerprint'])
+        return fp, is_new
+
+    def _refresh(self, fp: str, result: Optional[Dict] = None):
+        summary = self.db.execute('''
+            SELECT COUNT(*) AS scans, MAX(potential_payout) AS potential_payout,
+                   MAX(won_amount) AS won_amount, MAX(bet_finished) AS bet_finished,
+                   MIN(scanned_at) AS first_seen, MAX(scanned_at) AS last_seen
+            FROM bet_scans WHERE fingerprint = ?''', (fp,)).fetchone()
+        if not summary['scans']:
+            self.db.execute('DELETE FROM bets WHERE fingerprint = ?', (fp,))
+            return
+        status = 'settled' if summary['bet_finished'] else 'open'
+        if result is not None:
+            self.db.execute(
+                'INSERT OR REPLACE INTO bets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (fp, result.get('bet_type'), result.get('total_wager') or 0.0,
+                 json.dumps(bet_legs(result)), summary['potential_payout'], summary['won_amount'],
+                 summary['bet_finished'], status, summary['scans'],
+                 summary['first_seen'], summary['last_seen']))
+        else:
+            self.db.execute('''
+                UPDATE bets SET potential_payout = ?, won_amount = ?, bet_finished = ?, status = ?,
+                                scans = ?, first_seen = ?, last_seen = ?
+                WHERE fingerprint = ?''',
+                (summary['potential_payout'], summary['won_amount'], summary['bet_finished'], status,
+                 summary['scans'], summary['first_seen'], summary['last_seen'], fp))
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,502 @@
+"""Command-line entry point for the bet slip scanner.
+
+Subcommands import only what they need: `reparse` and `bench` never touch
+pytesseract or PIL, so they (and `--help`) start in milliseconds.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_IMAGES_DIR = Path(__file__).parent / "images"
+
+
+def print_summary(results: Iterable[Dict]):
+    print("\nSummary:")
+    print("="*50)
+    for result in results:
+        print(f"\nFile: {result['file']}")
+        print(f"Type: {result['bet_type']}")
+        print(f"Expected/Found Legs: {result['expected_legs']}/{result['found_legs']}")
+        print(f"Wager/Payout: ${result['total_wager']:.2f}/${result['total_payout']:.2f}")
+
+
+def emit(results: List[Dict], as_json: bool):
+    if as_json:
+        for result in results:
+            print(json.dumps(result))
+    else:
+        print_summary(results)
+
+
+def read_texts(paths: List[str]) -> Iterable[tuple]:
+    """Yield (name, text) pairs; '-' reads a single text from stdin."""
+    for path in paths:
+        if path == '-':
+            yield '<stdin>', sys.stdin.read()
+        else:
+            yield Path(path).name, Path(path).read_text()
+
+
+def cmd_scan(args) -> int:
+    from scanner import BetSlipScanner
+    scanner = BetSlipScanner(verbose=args.verbose, archive=not args.no_archive,
+                             sportsbook=args.sportsbook)
+    results = []
+    failed = 0
+    for path in args.files:
+        image_path = Path(path)
+        slips = scanner.scan_slips(image_path)
+        results.extend({'file': image_path.name, **result} for result in slips)
+        if not slips:
+            failed += 1
+    emit(results, args.json)
+    return 1 if failed else 0
+
+
+def cmd_scan_dir(args) -> int:
+    from scanner import BetSlipScanner
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"Not a directory: {directory}", file=sys.stderr)
+        return 2
+    queue = None
+    if args.queue is not None:
+        from jobqueue import open_queue
+        try:
+            queue = open_queue(args.queue)
+        except (ValueError, RuntimeError) as e:
+            print(f"Cannot open queue: {e}", file=sys.stderr)
+            return 2
+    ocr_pool = None
+    if args.workers and not args.out and queue is None:
+        from ocrpool import OcrPool
+        ocr_pool = OcrPool(args.workers)
+    scanner = BetSlipScanner(verbose=args.verbose, archive=not args.no_archive,
+                             sportsbook=args.sportsbook, ocr_pool=ocr_pool)
+    if args.out:
+        from export import export_directory
+        try:
+            stats = export_directory(scanner, directory, Path(args.out), queue=queue, fmt=args.format,
+                                     legs=args.legs, checkpoint_every=args.checkpoint_every,
+                                     resume=not args.restart)
+        except (ValueError, RuntimeError) as e:
+            print(f"Export failed: {e}", file=sys.stderr)
+            return 2
+        finally:
+            if queue is not None:
+                queue.close()
+        return 1 if stats['failed'] else 0
+    if queue is not None:
+        from jobqueue import scan_queued
+        try:
+            emit([{'file': image_path.name, **result}
+                  for image_path, slips in scan_queued(queue, scanner.iter_images(directory),
+                                                       {'sportsbook': args.sportsbook})
+                  for result in slips], args.json)
+        finally:
+            queue.close()
+        return 0
+    try:
+        emit(scanner.process_directory(directory), args.json)
+    finally:
+        if ocr_pool is not None:
+            stats = ocr_pool.stats()
+            ocr_pool.shutdown()
+            if stats['crashes']:
+                print(f"OCR workers: {stats['crashes']} crashes, {stats['quarantined']} images quarantined",
+                      file=sys.stderr)
+    return 0
+
+
+def cmd_reparse(args) -> int:
+    from archive import ARCHIVE_SUFFIX, iter_records, load_record, record_slips, reparse_records
+
+    # Plain text files and stdin are parsed and printed; archive sidecars
+    # (or directories of them) are reparsed in parallel and updated in place.
+    texts = [path for path in args.texts
+             if path == '-' or (Path(path).is_file() and not path.endswith(ARCHIVE_SUFFIX))]
+    archives = [path for path in args.texts if path not in texts]
+
+    if texts:
+        from scanner import BetSlipScanner
+        scanner = BetSlipScanner(verbose=args.verbose)
+        emit([{'file': name, **scanner.extract_legs(text)}
+              for name, text in read_texts(texts)], args.json)
+
+    if not archives:
+        return 0
+
+    def records():
+        for root in archives:
+            yield from iter_records(Path(root))
+
+    from bets import BetIndex
+    from search import SearchIndex
+    bet_index = BetIndex()
+    search_index = SearchIndex()
+    counts = {}
+    start = time.perf_counter()
+    for path, status, results in reparse_records(records(), workers=args.workers, force=args.force):
+        key = 'error' if status.startswith('error') else status
+        counts[key] = counts.get(key, 0) + 1
+        if key == 'error':
+            print(f"{path}: {status}", file=sys.stderr)
+            continue
+        if status == 'changed':
+            record = load_record(Path(path))
+            for idx, (result, slip) in enumerate(zip(results, record_slips(record)), 1):
+                bet_index.ingest(result, Path(path), idx)
+                search_index.add(result, slip['text'], Path(path), idx, record.get('scanned_at'),
+                                 slip.get('fingerprint'))
+        if args.json and status != 'current':
+            for result in results:
+                print(json.dumps({'file': path, 'status': status, **result}))
+    bet_index.close()
+    search_index.close()
+    elapsed = time.perf_counter() - start
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"Reparsed {sum(counts.values())} archived scans in {elapsed:.2f}s ({summary or 'none found'})",
+          file=sys.stderr)
+    return 1 if counts.get('error') else 0
+
+
+def cmd_validate(args) -> int:
+    from archive import ARCHIVE_SUFFIX, iter_records
+    from odds import validate_store
+
+    def records():
+        for root in args.paths:
+            yield from iter_records(Path(root))
+
+    suspects = list(validate_store(records()))
+
+    if args.rescan and suspects:
+        from scanner import BetSlipScanner, RETRY_OCR_CONFIG
+        scanner = BetSlipScanner(verbose=args.verbose, archive=True, ocr_config=RETRY_OCR_CONFIG)
+        record_paths = sorted({row['record'] for row in suspects})
+        for record_path in record_paths:
+            image_path = Path(record_path[:-len(ARCHIVE_SUFFIX)])
+            if image_path.exists():
+                scanner.scan_slips(image_path, incremental=False, priority='bulk')
+        still_suspect = list(validate_store(Path(path) for path in record_paths))
+        print(f"Re-OCR'd {len(record_paths)} images: "
+              f"{len(suspects) - len(still_suspect)} of {len(suspects)} suspect slips now check out",
+              file=sys.stderr)
+        suspects = still_suspect
+
+    for row in suspects:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            expected = '?' if row['expected_payout'] is None else f"${row['expected_payout']:.2f}"
+            odds = row['odds'] if row['odds_from'] != 'legs' else f"{row['odds']} from legs {row['leg_odds']}"
+            implied = '' if row['implied_probability'] is None else f" ({row['implied_probability']:.1%} implied)"
+            print(f"{row['image']} #{row['slip_index']}: {row['reason']} "
+                  f"(wager ${row['wager']:.2f}, odds {odds}{implied}, payout ${row['payout']:.2f}, "
+                  f"expected {expected})")
+    return 1 if suspects else 0
+
+
+def cmd_vocab(args) -> int:
+    from vocabulary import ROSTER_FILE, harvest_roster, load_roster, vocabulary_files
+    from archive import iter_records
+
+    if args.harvest:
+        added = sum(harvest_roster(iter_records(Path(root))) for root in args.harvest)
+        print(f"Added {added} player names to {ROSTER_FILE}", file=sys.stderr)
+
+    words_path, patterns_path = vocabulary_files(args.sportsbook)
+    print(f"Roster:   {ROSTER_FILE} ({len(load_roster())} names)")
+    print(f"Words:    {words_path} ({len(words_path.read_text().split())} words)")
+    print(f"Patterns: {patterns_path}")
+    return 0
+
+
+def cmd_index(args) -> int:
+    from archive import ARCHIVE_SUFFIX, iter_records, load_record, record_slips
+    from bets import BetIndex
+    from phash import PhashIndex, dhash
+    from scanner import BetSlipScanner
+    from search import SearchIndex
+    scanner = BetSlipScanner(verbose=False)
+
+    index = PhashIndex()
+    bet_index = BetIndex()
+    search_index = SearchIndex()
+    indexed = 0
+    for root in args.paths:
+        for record_path in iter_records(Path(root)):
+            image_path = Path(str(record_path)[:-len(ARCHIVE_SUFFIX)])
+            try:
+                record = load_record(record_path)
+                value = int(record['phash'], 16) if record.get('phash') else dhash(scanner.load_image(image_path))
+            except (OSError, ValueError) as e:
+                print(f"{record_path}: {e}", file=sys.stderr)
+                continue
+            index.add(value, record_path, image_path.name)
+            for idx, slip in enumerate(record_slips(record), 1):
+                if slip.get('result'):
+                    bet_index.ingest(slip['result'], record_path, idx, record.get('scanned_at'))
+                    search_index.add(slip['result'], slip['text'], record_path, idx, record.get('scanned_at'),
+                                     slip.get('fingerprint'))
+            indexed += 1
+    index.close()
+    bet_index.close()
+    search_index.optimize()
+    search_index.close()
+    print(f"Indexed {indexed} archived scans", file=sys.stderr)
+    return 0
+
+
+def cmd_search(args) -> int:
+    from search import SearchIndex
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    page = index.search(args.query, page=args.page, per_page=args.per_page, sort=args.sort)
+    elapsed = time.perf_counter() - start
+    index.close()
+    for hit in page['results']:
+        if args.json:
+            print(json.dumps(hit))
+        else:
+            print(f"{hit['image']} #{hit['slip_index']} {hit['bet_type']} ${hit['wager']:.2f}: "
+                  f"{' '.join(hit['snippet'].split())}")
+    shown = len(page['results'])
+    first = (page['page'] - 1) * page['per_page'] + 1
+    print(f"{page['total']}{'' if page['total_exact'] else '+'} matching slips" + (f", showing {first}-{first + shown - 1}" if shown else '')
+          + f" ({elapsed * 1000:.1f}ms)", file=sys.stderr)
+    return 0 if page['total'] else 1
+
+
+def cmd_worker(args) -> int:
+    from jobqueue import open_queue, work
+    from scanner import BetSlipScanner, DEFAULT_SPORTSBOOK
+    from scheduler import Scheduler
+    from warmup import WarmUp
+
+    scanners = {}
+
+    def scan(payload: Dict) -> List[Dict]:
+        sportsbook = payload.get('sportsbook')
+        archive = payload.get('archive', True)
+        key = (sportsbook, archive)
+        if key not in scanners:
+            scanners[key] = BetSlipScanner(verbose=args.verbose, archive=archive, sportsbook=sportsbook)
+        image_path = Path(payload['image'])
+        if not image_path.exists():
+            raise FileNotFoundError(f"{image_path} is not visible to this worker")
+        results = scanners[key].scan_slips(image_path, incremental=payload.get('incremental', True),
+                                           original_size=payload.get('original_size'))
+        if not results:
+            # scan_slips logs and swallows its errors; fail the job so the queue
+            # retries it and marks it failed after max_attempts
+            raise RuntimeError(f"no slips read from {image_path.name}")
+        return results
+
+    try:
+        queue = open_queue(args.queue)
+    except (ValueError, RuntimeError) as e:
+        print(f"Cannot open queue: {e}", file=sys.stderr)
+        return 2
+    try:
+        # Pay for tesseract and vocabulary loading before the first lease, not in it
+        WarmUp(None, DEFAULT_SPORTSBOOK).run()
+        print(f"Worker waiting for {'interactive' if args.interactive_only else 'scan'} jobs "
+              f"on {args.queue or 'the default queue file'}", file=sys.stderr)
+        handled = work(queue, scan, visibility_timeout=args.visibility_timeout, max_jobs=args.max_jobs,
+                       scheduler=Scheduler(bulk=not args.interactive_only))
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        queue.close()
+    print(f"Handled {handled} jobs", file=sys.stderr)
+    return 0
+
+
+def cmd_compact(args) -> int:
+    from retention import enforce_retention
+
+    stats = enforce_retention(Path(args.directory), budget_mb=args.budget_mb, policy=args.policy,
+                              max_age_days=args.max_age_days, compact_after_min=args.after_min)
+    print(f"Compacted {stats['compacted']} images (saved {stats['saved_bytes'] / 1e6:.1f}MB), "
+          f"evicted {stats['evicted']} ({stats['evicted_bytes'] / 1e6:.1f}MB)", file=sys.stderr)
+    return 0
+
+
+def cmd_bulk(args) -> int:
+    from scheduler import PAUSE_FILE, bulk_paused, pause_bulk, resume_bulk
+
+    if args.action == 'pause':
+        pause_bulk()
+    elif args.action == 'resume':
+        resume_bulk()
+    print(f"Bulk scanning is {'paused' if bulk_paused() else 'running'} ({PAUSE_FILE})")
+    return 0
+
+
+def cmd_bench(args) -> int:
+    from scanner import BetSlipScanner, find_tesseract, tesseract_version
+    scanner = BetSlipScanner(verbose=False)
+
+    if args.texts:
+        texts = [text for _, text in read_texts(args.texts)]
+    else:
+        from samples import SAMPLE_SLIP_TEXT
+        texts = [SAMPLE_SLIP_TEXT]
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for text in texts:
+            scanner.extract_legs(text)
+    parse_elapsed = time.perf_counter() - start
+    parses = args.iterations * len(texts)
+    print(f"Parse: {parses} slips in {parse_elapsed:.3f}s "
+          f"({parses / parse_elapsed:.0f} slips/s)")
+
+    if args.images:
+        print(f"Tesseract: {find_tesseract()} (version {tesseract_version()})")
+        timings = []
+        for path in args.images:
+            image_path = Path(path)
+            start = time.perf_counter()
+            text = scanner.ocr_image(scanner.load_image(image_path))
+            scanner.extract_legs(text)
+            timings.append(time.perf_counter() - start)
+            print(f"OCR: {image_path.name} {timings[-1]:.3f}s")
+        print(f"OCR: {len(timings)} images, mean {sum(timings) / len(timings):.3f}s")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='scanner', description='Bet slip scanner')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    from jobqueue import QUEUE_URL, VISIBILITY_TIMEOUT
+    from scanner import DEFAULT_SPORTSBOOK
+    from vocabulary import sportsbooks
+
+    def add_sportsbook(sub):
+        sub.add_argument('--sportsbook', choices=sportsbooks(), default=DEFAULT_SPORTSBOOK,
+                         help='vocabulary passed to tesseract (default: %(default)s)')
+        sub.add_argument('--no-vocab', dest='sportsbook', action='store_const', const=None,
+                         help='run tesseract without sportsbook vocabulary')
+
+    def add_common(sub):
+        sub.add_argument('--json', action='store_true', help='emit one JSON object per slip')
+        sub.add_argument('-v', '--verbose', action='store_true', help='print OCR and parse debugging output')
+
+    scan = subparsers.add_parser('scan', help='scan one or more slip images')
+    scan.add_argument('files', nargs='+')
+    scan.add_argument('--no-archive', action='store_true', help='do not save raw OCR text next to the image')
+    add_sportsbook(scan)
+    add_common(scan)
+    scan.set_defaults(func=cmd_scan)
+
+    scan_dir = subparsers.add_parser('scan-dir', help='scan every slip image in a directory')
+    scan_dir.add_argument('directory', nargs='?', default=str(DEFAULT_IMAGES_DIR))
+    scan_dir.add_argument('-o', '--out', help='stream results to a .jsonl, .csv or .parquet output')
+    scan_dir.add_argument('--format', choices=['jsonl', 'csv', 'parquet'], help='output format (default: from --out suffix)')
+    scan_dir.add_argument('--legs', action='store_true', help='write one row per leg instead of per slip')
+    scan_dir.add_argument('--checkpoint-every', type=int, default=100, metavar='N', help='checkpoint after every N images')
+    scan_dir.add_argument('--restart', action='store_true', help='ignore any checkpoint and start over')
+    scan_dir.add_argument('--no-archive', action='store_true', help='do not save raw OCR text next to each image')
+    scan_dir.add_argument('-j', '--workers', type=int, default=0,
+                          help='supervised OCR worker processes, fed through shared memory (ignored with --out or --queue)')
+    scan_dir.add_argument('--queue', nargs='?', const=QUEUE_URL, metavar='URL',
+                          help='queue the images as bulk jobs for `worker` processes, which archive every scan '
+                               '(default URL: $CAPPING_QUEUE_URL, else data/queue.db)')
+    add_sportsbook(scan_dir)
+    add_common(scan_dir)
+    scan_dir.set_defaults(func=cmd_scan_dir)
+
+    reparse = subparsers.add_parser('reparse', help='rerun the current parser over archived OCR text')
+    reparse.add_argument('texts', nargs='*', default=[str(DEFAULT_IMAGES_DIR)],
+                         help="archive directories or .ocr.json files (updated in place), "
+                              "plain text files, or '-' for stdin")
+    reparse.add_argument('-j', '--workers', type=int, help='parser processes (default: all cores)')
+    reparse.add_argument('--force', action='store_true', help='reparse records already at the current parser version')
+    add_common(reparse)
+    reparse.set_defaults(func=cmd_reparse)
+
+    validate = subparsers.add_parser('validate', help='check archived payouts against wager and odds')
+    validate.add_argument('paths', nargs='*', default=[str(DEFAULT_IMAGES_DIR)],
+                          help='archive directories or .ocr.json files')
+    validate.add_argument('--rescan', action='store_true', help='re-OCR suspect slips and check them again')
+    add_common(validate)
+    validate.set_defaults(func=cmd_validate)
+
+    vocab = subparsers.add_parser('vocab', help='build and show the tesseract vocabulary files')
+    vocab.add_argument('--sportsbook', choices=sportsbooks(), default=DEFAULT_SPORTSBOOK)
+    vocab.add_argument('--harvest', nargs='+', metavar='PATH',
+                       help='add player names found in these archives to the roster')
+    vocab.set_defaults(func=cmd_vocab)
+
+    index = subparsers.add_parser('index', help='rebuild the lookup indexes from archived scans')
+    index.add_argument('paths', nargs='*', default=[str(DEFAULT_IMAGES_DIR)],
+                       help='archive directories or .ocr.json files')
+    index.set_defaults(func=cmd_index)
+
+    from search import PER_PAGE
+    search = subparsers.add_parser('search', help='full-text search over indexed slips')
+    search.add_argument('query', help='words, "phrases", prefix* terms, player:/prop:/text: filters')
+    search.add_argument('--page', type=int, default=1)
+    search.add_argument('--per-page', type=int, default=PER_PAGE)
+    search.add_argument('--sort', choices=['recent', 'relevance'], default='recent',
+                        help='newest first, or best match first (slower for common terms)')
+    search.add_argument('--json', action='store_true', help='emit one JSON object per slip')
+    search.set_defaults(func=cmd_search)
+
+    worker = subparsers.add_parser('worker', help='scan images from the shared job queue')
+    worker.add_argument('--queue', default=QUEUE_URL,
+                        help='redis:// or sqlite:/// queue URL (default: $CAPPING_QUEUE_URL, else data/queue.db)')
+    worker.add_argument('--visibility-timeout', type=float, default=VISIBILITY_TIMEOUT,
+                        help='seconds before a dead worker\'s job is retried (default: %(default)s)')
+    worker.add_argument('--max-jobs', type=int, help='exit after this many jobs')
+    worker.add_argument('--interactive-only', action='store_true',
+                        help='never take bulk jobs, keeping this worker free for uploads')
+    worker.add_argument('-v', '--verbose', action='store_true', help='print OCR and parse debugging output')
+    worker.set_defaults(func=cmd_worker)
+
+    from retention import COMPACT_AFTER_MIN, DISK_BUDGET_MB, MAX_AGE_DAYS, RETENTION_POLICY
+    compact = subparsers.add_parser('compact', help='shrink archived images and evict over the disk budget')
+    compact.add_argument('directory', nargs='?', default=str(DEFAULT_IMAGES_DIR))
+    compact.add_argument('--budget-mb', type=float, default=DISK_BUDGET_MB,
+                         help='disk budget for images, 0 for none (default: %(default)s)')
+    compact.add_argument('--policy', choices=['lru', 'age'], default=RETENTION_POLICY,
+                         help='which images to evict first when over budget (default: %(default)s)')
+    compact.add_argument('--max-age-days', type=float, default=MAX_AGE_DAYS,
+                         help='evict images older than this regardless of budget, 0 for never')
+    compact.add_argument('--after-min', type=float, default=COMPACT_AFTER_MIN,
+                         help='only compact images scanned at least this long ago (default: %(default)s)')
+    compact.set_defaults(func=cmd_compact)
+
+    bulk = subparsers.add_parser('bulk', help='pause or resume bulk scans (scan-dir, validate --rescan)')
+    bulk.add_argument('action', choices=['pause', 'resume', 'status'], nargs='?', default='status')
+    bulk.set_defaults(func=cmd_bulk)
+
+    bench = subparsers.add_parser('bench', help='benchmark parsing (and optionally OCR)')
+    bench.add_argument('texts', nargs='*', help='OCR text files to parse (default: built-in sample)')
+    bench.add_argument('-n', '--iterations', type=int, default=1000)
+    bench.add_argument('--images', nargs='+', help='also time OCR + parse on these images')
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # Downstream closed the pipe (e.g. `| head`); exit quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
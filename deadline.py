@@ -0,0 +1,127 @@
+"""Per-scan deadlines and stage timings.
+
+A few pathological screenshots make tesseract run for tens of seconds.
+Each scan gets a `Deadline`: every stage (decode, preprocess, OCR, parse)
+checks it before starting, and every tesseract call gets the remaining
+time as its timeout, so pytesseract kills the process when the scan runs
+out of time. The same object records how long each stage (and archiving)
+took, which stages timed out and whether the hedged fallback OCR was
+used. `scan_metrics` aggregates that over all scans in the process.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+SCAN_DEADLINE_S = float(os.environ.get('CAPPING_SCAN_DEADLINE_S', 30))   # 0 disables
+HEDGE_AFTER_S = float(os.environ.get('CAPPING_HEDGE_AFTER_S', 8))       # 0 disables the fallback
+FALLBACK_SCALE = 0.6           # fallback OCR runs on the image resized by this factor
+FALLBACK_OCR_CONFIG = '--psm 6'  # one uniform block: skips tesseract's layout analysis
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"scan deadline exceeded during {stage}")
+        self.stage = stage
+
+    def __reduce__(self):
+        # Raised in OCR pool workers and re-raised in the parent
+        return DeadlineExceeded, (self.stage,)
+
+
+class Deadline:
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds or None
+        self.start = time.monotonic()
+        self.timings = {}
+        self.timed_out = []
+        self.hedged = False      # the fallback OCR was started
+        self.fallback = False    # ... and its result was used
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        if self.seconds is None:
+            return None
+        return self.seconds - (time.monotonic() - self.start)
+
+    def check(self, stage: str):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.timeout(stage)
+
+    def timeout(self, stage: str):
+        with self._lock:
+            if stage not in self.timed_out:
+                self.timed_out.append(stage)
+        raise DeadlineExceeded(stage)
+
+    def tesseract_timeout(self, stage: str = 'ocr') -> float:
+        """Timeout for one tesseract call (0 means none, as in pytesseract)."""
+        self.check(stage)
+        remaining = self.remaining()
+        return 0 if remaining is None else remaining
+
+    @contextmanager
+    def stage(self, name: str):
+        self.check(name)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.timings[name] = round(self.timings.get(name, 0) + time.monotonic() - start, 3)
+
+    def report(self) -> Dict:
+        return {'timings': dict(self.timings),
+                'total': round(time.monotonic() - self.start, 3),
+                'timed_out': list(self.timed_out),
+                'hedged': self.hedged,
+                'fallback': self.fallback}
+
+
+class ScanMetrics:
+    """Process-wide scan latency, timeout and fallback counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.scans = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.fallbacks = 0
+        self.stage_totals = {}
+        self.stage_max = {}
+        self.timeouts_by_stage = {}
+
+    def record(self, deadline: Deadline):
+        with self.lock:
+            self.scans += 1
+            if deadline.timed_out:
+                self.timeouts += 1
+            for stage in deadline.timed_out:
+                self.timeouts_by_stage[stage] = self.timeouts_by_stage.get(stage, 0) + 1
+            self.hedges += deadline.hedged
+            self.fallbacks += deadline.fallback
+            for stage, seconds in deadline.timings.items():
+                self.stage_totals[stage] = self.stage_totals.get(stage, 0) + seconds
+                self.stage_max[stage] = max(self.stage_max.get(stage, 0), seconds)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                'scans': self.scans,
+                'timeouts': self.timeouts,
+                'timeouts_by_stage': dict(self.timeouts_by_stage),
+                'hedges': self.hedges,
+                'fallbacks': self.fallbacks,
+                'stage_mean_s': {stage: round(total / self.scans, 3) for stage, total in self.stage_totals.items()},
+                'stage_max_s': {stage: round(seconds, 3) for stage, seconds in self.stage_max.items()},
+            }
+
+
+scan_metrics = ScanMetrics()
+
+
+def is_tesseract_timeout(error: Exception) -> bool:
+    # pytesseract kills the process and raises RuntimeError on timeout
+    return isinstance(error, RuntimeError) and 'timeout' in str(error).lower()
@@ -0,0 +1,272 @@
+"""Streaming, checkpointed export of scan results.
+
+Results are written as they are produced, one row per slip or (with
+`legs=True`) one row per leg. Every `checkpoint_every` inputs the output is
+flushed and a checkpoint records how far it got, so an interrupted run can
+resume exactly where it stopped:
+
+    <out>.checkpoint.json   output offset / committed parquet parts
+    <out>.done              append-only log of finished input names
+
+On resume, anything written after the last checkpoint is truncated away
+and those inputs are scanned again, so rows are never duplicated.
+"""
+import csv
+import io
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+FORMATS = ('jsonl', 'csv', 'parquet')
+
+SLIP_FIELDS = [
+    'file', 'slip_index', 'bet_type', 'expected_legs', 'found_legs',
+    'total_wager', 'total_payout', 'won_amount', 'bet_finished', 'odds',
+]
+LEG_FIELDS = SLIP_FIELDS + ['game', 'leg_index', 'position', 'details']
+# Files a ParquetWriter owns in its directory: parts and their temporaries
+PART_FILE = re.compile(r'(part-\d{5}\.parquet|\.part-\d{5}\.parquet\.tmp)')
+
+
+def guess_format(path: Path) -> str:
+    suffix = path.suffix.lstrip('.').lower()
+    if suffix in FORMATS:
+        return suffix
+    raise ValueError(f"Cannot infer export format from '{path.name}'; use one of {', '.join(FORMATS)}")
+
+
+def slip_row(name: str, result: Dict) -> Dict:
+    row = {field: result.get(field) for field in SLIP_FIELDS}
+    row['file'] = name
+    row['games'] = json.dumps(result.get('games', []))
+    return row
+
+
+def leg_rows(name: str, result: Dict) -> List[Dict]:
+    base = {field: result.get(field) for field in SLIP_FIELDS}
+    base['file'] = name
+    rows = []
+    for game in result.get('games', []):
+        for idx, leg in enumerate(game['positions'], 1):
+            rows.append({**base,
+                         'game': game['game'],
+                         'leg_index': idx,
+                         'position': leg['position'],
+                         'details': leg['details']})
+    if not rows:
+        # Keep slips without legs visible in leg-level exports
+        rows.append({**base, 'game': None, 'leg_index': None, 'position': None, 'details': None})
+    return rows
+
+
+class JsonlWriter:
+    """Append JSON lines; truncates back to the checkpointed offset on resume."""
+
+    def __init__(self, path: Path, legs: bool, offset: int = 0):
+        self.path = path
+        self.legs = legs
+        self.file = open(path, 'a+b')
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, name: str, result: Dict):
+        rows = leg_rows(name, result) if self.legs else [{'file': name, **result}]
+        for row in rows:
+            self.file.write(json.dumps(row).encode('utf-8') + b'\n')
+
+    def commit(self) -> Dict:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'offset': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter(JsonlWriter):
+    def __init__(self, path: Path, legs: bool, offset: int = 0):
+        super().__init__(path, legs, offset)
+        self.fields = LEG_FIELDS if legs else SLIP_FIELDS + ['games']
+        self.buffer = io.StringIO()
+        self.writer = csv.DictWriter(self.buffer, fieldnames=self.fields)
+        if offset == 0:
+            self.writer.writeheader()
+            self._drain()
+
+    def _drain(self):
+        self.file.write(self.buffer.getvalue().encode('utf-8'))
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def write(self, name: str, result: Dict):
+        rows = leg_rows(name, result) if self.legs else [slip_row(name, result)]
+        self.writer.writerows(rows)
+        self._drain()
+
+
+class ParquetWriter:
+    """Write a directory of parquet part files, one per checkpoint.
+
+    Parts are written to a temporary name and renamed into place, and only
+    parts listed in the checkpoint survive a resume. Other files in the
+    directory are left alone.
+    """
+
+    def __init__(self, path: Path, legs: bool, parts: Optional[List[str]] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.legs = legs
+        self.parts = list(parts or [])
+        self.rows = []
+        path.mkdir(parents=True, exist_ok=True)
+        for stale in path.iterdir():
+            if PART_FILE.fullmatch(stale.name) and stale.name not in self.parts and stale.is_file():
+                stale.unlink()
+
+    def write(self, name: str, result: Dict):
+        self.rows.extend(leg_rows(name, result) if self.legs else [slip_row(name, result)])
+
+    def commit(self) -> Dict:
+        if self.rows:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            part_name = f"part-{len(self.parts):05d}.parquet"
+            tmp_path = self.path / f".{part_name}.tmp"
+            pq.write_table(pa.Table.from_pylist(self.rows), tmp_path)
+            os.replace(tmp_path, self.path / part_name)
+            self.parts.append(part_name)
+            self.rows = []
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+
+class Checkpoint:
+    def __init__(self, out_path: Path):
+        self.path = out_path.with_name(out_path.name + '.checkpoint.json')
+        self.done_path = out_path.with_name(out_path.name + '.done')
+        self.state = {}
+        self.done = set()
+
+    def load(self) -> Dict:
+        """Load the last checkpoint and the set of inputs it covers."""
+        try:
+            self.state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.state = {}
+        done_offset = self.state.get('done_offset', 0)
+        with open(self.done_path, 'a+b') as done_file:
+            done_file.truncate(done_offset)
+            done_file.seek(0)
+            self.done = {line.decode('utf-8').rstrip('\n') for line in done_file if line.strip()}
+        return self.state
+
+    def reset(self):
+        for path in (self.path, self.done_path):
+            if path.exists():
+                path.unlink()
+        self.state = {}
+        self.done = set()
+
+    def save(self, names: List[str], writer_state: Dict, **extra):
+        with open(self.done_path, 'ab') as done_file:
+            for name in names:
+                done_file.write(name.encode('utf-8') + b'\n')
+            done_file.flush()
+            os.fsync(done_file.fileno())
+            done_offset = done_file.tell()
+        self.done.update(names)
+        self.state = {**extra, **writer_state, 'done_offset': done_offset}
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(json.dumps(self.state))
+        os.replace(tmp_path, self.path)
+
+
+def open_writer(out_path: Path, fmt: str, legs: bool, state: Dict):
+    if fmt == 'jsonl':
+        return JsonlWriter(out_path, legs, state.get('offset', 0))
+    if fmt == 'csv':
+        return CsvWriter(out_path, legs, state.get('offset', 0))
+    if fmt == 'parquet':
+        return ParquetWriter(out_path, legs, state.get('parts'))
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_results(items: Iterable, out_path: Path, scan=None, fmt: Optional[str] = None,
+                   legs: bool = False, checkpoint_every: int = 100,
+                   resume: bool = True, scan_all=None) -> Dict[str, int]:
+    """Scan `items` with `scan(item) -> (name, results)` and stream results out.
+
+    Each item is skipped if its name (`Path(item).name`) is already in the
+    checkpoint. An item with no results counts as failed and is left out
+    of the checkpoint, so a resumed export retries it.
+
+    `scan_all(items) -> iterable of (name, results)`, in order, can take
+    the place of `scan` to scan several remaining items at once.
+    """
+    out_path = Path(out_path)
+    fmt = fmt or guess_format(out_path)
+    checkpoint = Checkpoint(out_path)
+    if resume:
+        state = checkpoint.load()
+        if state and (state.get('format'), state.get('legs')) != (fmt, legs):
+            raise ValueError(f"Checkpoint for {out_path} was written as "
+                             f"{state.get('format')} (legs={state.get('legs')}); use --restart")
+    else:
+        checkpoint.reset()
+        if out_path.is_file():
+            out_path.unlink()
+        state = {}
+
+    writer = open_writer(out_path, fmt, legs, state)
+    stats = {'scanned': 0, 'skipped': 0, 'failed': 0}
+    pending = []
+
+    def remaining():
+        for item in items:
+            if Path(item).name in checkpoint.done:
+                stats['skipped'] += 1
+                continue
+            yield item
+
+    scanned = scan_all(remaining()) if scan_all is not None else map(scan, remaining())
+    try:
+        for name, results in scanned:
+            for result in results:
+                writer.write(name, result)
+            if not results:
+                stats['failed'] += 1
+                continue
+            stats['scanned'] += 1
+            pending.append(name)
+            if len(pending) >= checkpoint_every:
+                checkpoint.save(pending, writer.commit(), format=fmt, legs=legs)
+                pending = []
+        checkpoint.save(pending, writer.commit(), format=fmt, legs=legs)
+    finally:
+        writer.close()
+    return stats
+
+
+def export_directory(scanner, directory: Path, out_path: Path, queue=None, **kwargs) -> Dict[str, int]:
+    """Export a directory's scans; with a jobqueue `queue`, its workers scan them as bulk jobs."""
+    def scan(image_path):
+        return image_path.name, scanner.scan_slips(image_path, priority='bulk')
+
+    def scan_all(image_paths):
+        from jobqueue import scan_queued
+        for image_path, results in scan_queued(queue, image_paths, {'sportsbook': scanner.sportsbook}):
+            yield image_path.name, results
+
+    stats = export_results(scanner.iter_images(Path(directory)), out_path, scan,
+                           scan_all=scan_all if queue is not None else None, **kwargs)
+    print(f"Exported {stats['scanned']} images to {out_path} "
+          f"({stats['skipped']} already done, {stats['failed']} failed)", file=sys.stderr)
+    return stats
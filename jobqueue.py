@@ -0,0 +1,470 @@
+"""Scan job queue shared by the web app and scan workers.
+
+The web app enqueues an uploaded image and waits for its result; any
+number of `scanner.py worker` processes lease jobs, scan them and write
+the results back. Two backends have the same interface:
+
+    sqlite:///data/queue.db    a single-host queue file (relative path;
+                               sqlite:////abs/path for an absolute one)
+    redis://redis:6379/0       a Redis broker shared between containers
+
+With no URL the queue file is data/queue.db.
+
+Jobs are queued in a priority class, `interactive` (uploads) or `bulk`
+(backfills), and a worker leases from the classes in the order its
+scheduler gives (see scheduler.py). The first lease of each job records
+how long it waited, and `stats()` reports that per class.
+
+A leased job is invisible to other workers until its lease expires. A
+worker that dies mid-scan therefore loses the job only for the visibility
+timeout, after which another worker retries it. Failed jobs are retried
+up to `max_attempts` times, each after a longer delay (RETRY_BACKOFF
+doubled per attempt), before they are marked failed.
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from scanner import DATA_DIR
+from scheduler import BULK, INTERACTIVE, PRIORITIES, WAIT_SAMPLES, Scheduler, WaitStats
+
+QUEUE_URL = os.environ.get('CAPPING_QUEUE_URL', '')
+QUEUE_DB = DATA_DIR / 'queue.db'
+VISIBILITY_TIMEOUT = 120       # seconds a leased job stays invisible
+MAX_ATTEMPTS = 3
+RESULT_TTL = 24 * 3600         # seconds finished jobs are kept
+POLL_INTERVAL = 0.2
+RETRY_BACKOFF = 5              # seconds before the first retry of a failed job
+BULK_WINDOW = 64               # bulk jobs a backfill keeps queued at once
+
+
+class Job:
+    def __init__(self, id: str, payload: Dict, attempts: int, priority: str = INTERACTIVE):
+        self.id = id
+        self.payload = payload
+        self.attempts = attempts
+        self.priority = priority
+
+    def __repr__(self):
+        return f"Job({self.id!r}, attempts={self.attempts}, priority={self.priority!r})"
+
+
+def check_priority(priority: str):
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown priority class {priority!r}")
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds a job that failed its `attempts`th attempt waits before the next."""
+    return RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+
+
+class JobQueue(ABC):
+    """Interface shared by the queue backends."""
+
+    @abstractmethod
+    def enqueue(self, payload: Dict, max_attempts: int = MAX_ATTEMPTS, priority: str = INTERACTIVE) -> str:
+        """Queue a job in class `priority`; returns its id."""
+
+    @abstractmethod
+    def lease(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT,
+              priorities: Sequence[str] = PRIORITIES) -> Optional[Job]:
+        """Take the oldest visible job of the first class in `priorities` that has one.
+
+        Returns None when none of them has a job waiting.
+        """
+
+    @abstractmethod
+    def extend(self, job_id: str, visibility_timeout: float = VISIBILITY_TIMEOUT):
+        """Push a leased job's lease out while it is still being worked on."""
+
+    @abstractmethod
+    def complete(self, job_id: str, result):
+        """Store a job's result and mark it done."""
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str) -> bool:
+        """Record a failed attempt; returns True if the job will be retried."""
+
+    @abstractmethod
+    def status(self, job_id: str) -> Optional[Dict]:
+        """{'status', 'attempts', 'result', 'error'} of a job."""
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Job counts, plus each class's queued jobs and queue wait (mean, p50, p95, max)."""
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Poll until the job is done or failed; None if it timed out.
+
+        A job that no longer exists (expired, or the broker lost it) counts
+        as failed.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None:
+                return {'status': 'failed', 'attempts': 0, 'result': None, 'error': 'job not found'}
+            if status['status'] in ('done', 'failed'):
+                return status
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def close(self):
+        pass
+
+
+class SqliteQueue(JobQueue):
+    def __init__(self, path: Path = QUEUE_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            lease_until REAL,
+            worker TEXT,
+            result TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL,
+            priority TEXT NOT NULL DEFAULT 'interactive',
+            started REAL,
+            not_before REAL)''')
+        columns = {row['name'] for row in self.db.execute('PRAGMA table_info(jobs)')}
+        # Queue files from before priority classes and retry backoff
+        if 'priority' not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'interactive'")
+        if 'started' not in columns:
+            self.db.execute('ALTER TABLE jobs ADD COLUMN started REAL')
+        if 'not_before' not in columns:
+            self.db.execute('ALTER TABLE jobs ADD COLUMN not_before REAL')
+        self.db.execute('DROP INDEX IF EXISTS jobs_pending')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_class ON jobs (priority, status, created)')
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # One connection per thread: request threads in the app and a worker's heartbeat
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+        return db
+
+    def enqueue(self, payload: Dict, max_attempts: int = MAX_ATTEMPTS, priority: str = INTERACTIVE) -> str:
+        check_priority(priority)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.db.execute('INSERT INTO jobs (id, payload, status, max_attempts, priority, created, updated) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (job_id, json.dumps(payload), 'queued', max_attempts, priority, now, now))
+        return job_id
+
+    def lease(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT,
+              priorities: Sequence[str] = PRIORITIES) -> Optional[Job]:
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock, so two workers never lease the same job
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute("UPDATE jobs SET status = 'failed', error = 'lease expired', updated = ? "
+                            "WHERE status = 'leased' AND lease_until < ? AND attempts >= max_attempts",
+                            (now, now))
+            self.db.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?',
+                            ('done', 'failed', now - RESULT_TTL))
+            row = None
+            for priority in priorities:
+                row = self.db.execute(
+                    "SELECT id, payload, attempts, priority FROM jobs "
+                    "WHERE priority = ? AND ((status = 'queued' AND (not_before IS NULL OR not_before <= ?)) "
+                    "OR (status = 'leased' AND lease_until < ?)) "
+                    "ORDER BY created LIMIT 1", (priority, now, now)).fetchone()
+                if row is not None:
+                    break
+            if row is None:
+                self.db.execute('COMMIT')
+                return None
+            self.db.execute("UPDATE jobs SET status = 'leased', attempts = attempts + 1, "
+                            "lease_until = ?, worker = ?, started = COALESCE(started, ?), updated = ? "
+                            "WHERE id = ?",
+                            (now + visibility_timeout, worker, now, now, row['id']))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return Job(row['id'], json.loads(row['payload']), row['attempts'] + 1, row['priority'])
+
+    def extend(self, job_id: str, visibility_timeout: float = VISIBILITY_TIMEOUT):
+        self.db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'leased'",
+                        (time.time() + visibility_timeout, job_id))
+
+    def complete(self, job_id: str, result):
+        self.db.execute("UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL, "
+                        "updated = ? WHERE id = ?", (json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> bool:
+        row = self.db.execute('SELECT attempts, max_attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return False
+        retry = row['attempts'] < row['max_attempts']
+        now = time.time()
+        self.db.execute('UPDATE jobs SET status = ?, error = ?, lease_until = NULL, not_before = ?, updated = ? '
+                        'WHERE id = ?',
+                        ('queued' if retry else 'failed', error,
+                         now + retry_delay(row['attempts']) if retry else None, now, job_id))
+        return retry
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        row = self.db.execute('SELECT status, attempts, result, error FROM jobs WHERE id = ?',
+                              (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row['status'], 'attempts': row['attempts'],
+                'result': json.loads(row['result']) if row['result'] else None, 'error': row['error']}
+
+    def stats(self) -> Dict:
+        stats = {status: count for status, count in
+                 self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')}
+        stats['classes'] = {}
+        for priority in PRIORITIES:
+            queued = self.db.execute("SELECT COUNT(*) FROM jobs WHERE priority = ? AND status = 'queued'",
+                                     (priority,)).fetchone()[0]
+            waits = [wait for wait, in self.db.execute(
+                'SELECT started - created FROM jobs WHERE priority = ? AND started IS NOT NULL '
+                'ORDER BY started DESC LIMIT ?', (priority, WAIT_SAMPLES))]
+            stats['classes'][priority] = {'queued': queued, 'wait': WaitStats(waits).snapshot()}
+        return stats
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+# Moves expired leases back to their class's queue (or to failed once out of
+# attempts) and failed jobs whose retry delay is up from the delayed set
+# back to theirs, then leases the next job from the first class in ARGV[6..]
+# that has one, atomically on the Redis server. A job's first lease records its
+# queue wait in the class's capped list of recent waits.
+_REDIS_LEASE = """
+local now = tonumber(ARGV[1])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], id)
+    local job = KEYS[3] .. id
+    if tonumber(redis.call('HGET', job, 'attempts')) >= tonumber(redis.call('HGET', job, 'max_attempts')) then
+        redis.call('HSET', job, 'status', 'failed', 'error', 'lease expired')
+        redis.call('EXPIRE', job, tonumber(ARGV[4]))
+    else
+        redis.call('HSET', job, 'status', 'queued')
+        redis.call('RPUSH', redis.call('HGET', job, 'pending') or KEYS[1], id)
+    end
+end
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', now)) do
+    redis.call('ZREM', KEYS[5], id)
+    redis.call('RPUSH', redis.call('HGET', KEYS[3] .. id, 'pending') or KEYS[1], id)
+end
+for i = 6, #ARGV, 2 do
+    local id = redis.call('RPOP', ARGV[i])
+    if id then
+        local job = KEYS[3] .. id
+        redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), id)
+        local attempts = redis.call('HINCRBY', job, 'attempts', 1)
+        redis.call('HSET', job, 'status', 'leased', 'worker', ARGV[3])
+        local created = redis.call('HGET', job, 'created')
+        if created and redis.call('HSETNX', job, 'started', now) == 1 then
+            local waits = KEYS[4] .. ARGV[i + 1]
+            redis.call('LPUSH', waits, now - tonumber(created))
+            redis.call('LTRIM', waits, 0, tonumber(ARGV[5]) - 1)
+        end
+        return {id, redis.call('HGET', job, 'payload'), attempts, ARGV[i + 1]}
+    end
+end
+return nil
+"""
+
+
+class RedisQueue(JobQueue):
+    def __init__(self, url: str, prefix: str = 'capping:scan'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("The redis package is required for a redis:// queue (pip install redis)") from e
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        # One list per class; interactive keeps the name from before there were classes
+        self.pending = {priority: f'{prefix}:pending' if priority == INTERACTIVE else f'{prefix}:pending:{priority}'
+                        for priority in PRIORITIES}
+        self.leased = f'{prefix}:leased'
+        self.delayed = f'{prefix}:delayed'     # failed jobs waiting out their retry delay
+        self.job_prefix = f'{prefix}:job:'
+        self.waits_prefix = f'{prefix}:waits:'
+        self._lease = self.redis.register_script(_REDIS_LEASE)
+
+    def enqueue(self, payload: Dict, max_attempts: int = MAX_ATTEMPTS, priority: str = INTERACTIVE) -> str:
+        check_priority(priority)
+        job_id = uuid.uuid4().hex
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self.job_prefix + job_id, mapping={
+                'payload': json.dumps(payload), 'status': 'queued',
+                'attempts': 0, 'max_attempts': max_attempts,
+                'pending': self.pending[priority], 'created': time.time()})
+            pipe.lpush(self.pending[priority], job_id)
+            pipe.execute()
+        return job_id
+
+    def lease(self, worker: str, visibility_timeout: float = VISIBILITY_TIMEOUT,
+              priorities: Sequence[str] = PRIORITIES) -> Optional[Job]:
+        classes = [value for priority in priorities for value in (self.pending[priority], priority)]
+        leased = self._lease(keys=[self.pending[INTERACTIVE], self.leased, self.job_prefix, self.waits_prefix,
+                                   self.delayed],
+                             args=[time.time(), visibility_timeout, worker, RESULT_TTL, WAIT_SAMPLES, *classes])
+        if not leased:
+            return None
+        job_id, payload, attempts, priority = leased
+        return Job(job_id, json.loads(payload), int(attempts), priority)
+
+    def extend(self, job_id: str, visibility_timeout: float = VISIBILITY_TIMEOUT):
+        self.redis.zadd(self.leased, {job_id: time.time() + visibility_timeout}, xx=True)
+
+    def complete(self, job_id: str, result):
+        job = self.job_prefix + job_id
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(self.leased, job_id)
+            pipe.hset(job, mapping={'status': 'done', 'result': json.dumps(result)})
+            pipe.hdel(job, 'error')
+            pipe.expire(job, RESULT_TTL)
+            pipe.execute()
+
+    def fail(self, job_id: str, error: str) -> bool:
+        job = self.job_prefix + job_id
+        attempts, max_attempts = self.redis.hmget(job, 'attempts', 'max_attempts')
+        if attempts is None:
+            return False
+        retry = int(attempts) < int(max_attempts)
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(self.leased, job_id)
+            pipe.hset(job, mapping={'status': 'queued' if retry else 'failed', 'error': error})
+            if retry:
+                # The lease script queues it again once the delay is up
+                pipe.zadd(self.delayed, {job_id: time.time() + retry_delay(int(attempts))})
+            else:
+                pipe.expire(job, RESULT_TTL)
+            pipe.execute()
+        return retry
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.redis.hgetall(self.job_prefix + job_id)
+        if not job:
+            return None
+        return {'status': job['status'], 'attempts': int(job['attempts']),
+                'result': json.loads(job['result']) if job.get('result') else None, 'error': job.get('error')}
+
+    def stats(self) -> Dict:
+        classes = {}
+        for priority in PRIORITIES:
+            waits = self.redis.lrange(self.waits_prefix + priority, 0, -1)
+            classes[priority] = {'queued': self.redis.llen(self.pending[priority]),
+                                 'wait': WaitStats(float(wait) for wait in waits).snapshot()}
+        return {'queued': sum(stats['queued'] for stats in classes.values()) + self.redis.zcard(self.delayed),
+                'leased': self.redis.zcard(self.leased), 'classes': classes}
+
+    def close(self):
+        self.redis.close()
+
+
+def open_queue(url: str = QUEUE_URL) -> JobQueue:
+    """Queue for a redis:// or sqlite:/// URL (an empty URL is the default queue file)."""
+    parsed = urlparse(url)
+    if parsed.scheme in ('redis', 'rediss'):
+        return RedisQueue(url)
+    if parsed.scheme in ('', 'sqlite'):
+        path = parsed.path[1:] if parsed.scheme else url
+        return SqliteQueue(Path(path) if path else QUEUE_DB)
+    raise ValueError(f"Unsupported queue URL '{url}'; use redis://... or sqlite:///path")
+
+
+def work(queue: JobQueue, handler: Callable[[Dict], object], worker: Optional[str] = None,
+         visibility_timeout: float = VISIBILITY_TIMEOUT, stop: Optional[threading.Event] = None,
+         max_jobs: Optional[int] = None, scheduler: Optional[Scheduler] = None) -> int:
+    """Lease and handle jobs until stopped; returns how many were handled.
+
+    `scheduler` picks the class each job is leased from (by default one
+    that takes both classes). The lease is extended in the background while
+    `handler` runs, so a slow scan is not handed to a second worker; only a
+    dead worker's jobs are.
+    """
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    stop = stop or threading.Event()
+    scheduler = scheduler or Scheduler()
+    handled = 0
+    while not stop.is_set() and (max_jobs is None or handled < max_jobs):
+        order = scheduler.order()
+        job = queue.lease(worker, visibility_timeout, order)
+        if job is None:
+            stop.wait(POLL_INTERVAL * 5)
+            continue
+        scheduler.charge(job.priority, order)
+
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(visibility_timeout / 3):
+                queue.extend(job.id, visibility_timeout)
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            result = handler(job.payload)
+        except Exception as e:
+            retry = queue.fail(job.id, f"{type(e).__name__}: {e}")
+            print(f"Job {job.id} attempt {job.attempts} failed ({'retrying' if retry else 'giving up'}): {e}")
+        else:
+            queue.complete(job.id, result)
+        finally:
+            done.set()
+            beat.join()
+        handled += 1
+    return handled
+
+
+def scan_queued(queue: JobQueue, image_paths: Iterable[Path], payload: Dict,
+                window: int = BULK_WINDOW) -> Iterator[Tuple[Path, List[Dict]]]:
+    """Yield (path, results) for images scanned by queue workers as bulk jobs, in order.
+
+    At most `window` jobs are queued at a time, so a large backfill does
+    not flood the queue, and jobs are waited on without a timeout, since
+    bulk jobs wait behind uploads and through a pause. A job that failed
+    yields no results.
+    """
+    jobs = deque()
+
+    def result(image_path: Path, job_id: str) -> Tuple[Path, List[Dict]]:
+        status = None
+        # Ends once the job is done, failed or gone (wait() counts a missing job as failed)
+        while status is None:
+            status = queue.wait(job_id, VISIBILITY_TIMEOUT)
+        if status['status'] != 'done':
+            print(f"{image_path.name}: {status['error']}", file=sys.stderr)
+        return image_path, status['result'] or []
+
+    for image_path in image_paths:
+        jobs.append((image_path, queue.enqueue({**payload, 'image': str(Path(image_path).resolve())},
+                                               priority=BULK)))
+        if len(jobs) >= window:
+            yield result(*jobs.popleft())
+    while jobs:
+        yield result(*jobs.popleft())
@@ -0,0 +1,143 @@
+"""Learned slip layouts for region-targeted OCR.
+
+For a given screen size and sportsbook, a slip's header (bet type, leg
+count, odds), leg list and wager/payout footer sit at the same heights
+every time, as long as the slip type and leg count are the same. After a
+full-page scan parses cleanly, the line boxes from image_to_data are
+split into those three regions, and the regions are stored as a layout
+variant under (sportsbook, size), keyed by (bet type, legs).
+
+A later scan at the same size OCRs only the header first, to learn the
+bet type and leg count. It then OCRs the matching variant's leg and
+footer regions in parallel, each with a page segmentation mode suited to
+it, skipping status bars, promos and buttons. If the result does not
+parse as the same kind of slip, the caller falls back to a full-page
+scan. Variants that keep missing are skipped.
+"""
+import json
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from scanner import DATA_DIR
+
+LAYOUTS_DB = DATA_DIR / 'layouts.db'
+REGION_PSM = {
+    'header': 6,    # a uniform block of short lines
+    'legs': 4,      # one column of lines of varying size
+    'footer': 6,
+}
+MAX_MISSES = 3     # a variant that missed this often (and more than it hit) is skipped
+
+HEADER_LINE = re.compile(r'\d+\s*leg\b|PARLAY|MONEYLINE|SPREAD|INCLUDES|SELECTIONS|^[+-]\d{3,}$', re.IGNORECASE)
+MONEY = re.compile(r'\$\d')
+FOOTER_LINE = re.compile(r'\$\d|TOTAL|WAGER|PAYOUT|\bWON\b', re.IGNORECASE)
+
+Region = Dict   # {'name', 'top', 'bottom', 'psm'}
+
+
+def layout_key(size: Tuple[int, int], sportsbook: str) -> str:
+    return f"{sportsbook}:{size[0]}x{size[1]}"
+
+
+def variant_key(result: Dict) -> str:
+    return f"{result['bet_type'].lower()}:{result['expected_legs']}"
+
+
+def is_clean(result: Dict) -> bool:
+    """A parse good enough to learn a layout from (or to accept a region scan)."""
+    return (result['total_wager'] > 0 and result['expected_legs'] > 0
+            and result['found_legs'] == result['expected_legs'])
+
+
+def learn_regions(lines: List[List], height: int) -> Optional[List[Region]]:
+    """Header, legs and footer bands from [top, bottom, text] lines, or None."""
+    lines = sorted(lines, key=lambda line: line[0])
+    texts = [line[2].strip() for line in lines]
+    footer_start = next((i for i, text in enumerate(texts) if MONEY.search(text)), None)
+    if footer_start is None:
+        return None
+    footer_end = max(i for i in range(footer_start, len(texts)) if FOOTER_LINE.search(texts[i]))
+
+    header_start = next((i for i in range(footer_start) if HEADER_LINE.search(texts[i])), None)
+    if header_start is None:
+        return None
+    if re.search(r'MONEYLINE', texts[header_start], re.IGNORECASE) and header_start > 0:
+        # Straight bets name the selection on the line above MONEYLINE
+        header_start -= 1
+    header_end = header_start
+    while header_end + 1 < footer_start and HEADER_LINE.search(texts[header_end + 1]):
+        header_end += 1
+
+    def gap(i: int) -> int:
+        # Boundary halfway between line i and the next one
+        return (lines[i][1] + lines[i + 1][0]) // 2
+
+    pad = max(4, (lines[header_start][1] - lines[header_start][0]) // 2)
+    top = max(0, lines[header_start][0] - pad)
+    bottom = min(height, lines[footer_end][1] + pad)
+    bounds = [('header', top, gap(header_end))]
+    footer_top = gap(header_end)
+    if header_end + 1 < footer_start:
+        footer_top = gap(footer_start - 1)
+        bounds.append(('legs', gap(header_end), footer_top))
+    bounds.append(('footer', footer_top, bottom))
+    return [{'name': name, 'top': int(top), 'bottom': int(bottom), 'psm': REGION_PSM[name]}
+            for name, top, bottom in bounds if bottom > top]
+
+
+class LayoutIndex:
+    def __init__(self, path: Path = LAYOUTS_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS layouts (
+            layout TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            regions TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            learned_from TEXT,
+            updated TEXT,
+            PRIMARY KEY (layout, variant))''')
+        self.db.commit()
+
+    def variants(self, layout: str) -> Dict[str, List[Region]]:
+        """Usable variants of a layout: {variant: regions}."""
+        rows = self.db.execute('SELECT variant, regions, hits, misses FROM layouts WHERE layout = ?', (layout,))
+        return {variant: json.loads(regions) for variant, regions, hits, misses in rows
+                if misses < MAX_MISSES or misses <= hits}
+
+    def learn(self, layout: str, variant: str, regions: List[Region], source: Optional[str] = None):
+        """Store the latest regions of a variant; a relearned variant starts without misses."""
+        self.db.execute('''
+            INSERT INTO layouts (layout, variant, regions, learned_from, updated) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (layout, variant) DO UPDATE SET
+                regions = excluded.regions, misses = 0,
+                learned_from = excluded.learned_from, updated = excluded.updated''',
+            (layout, variant, json.dumps(regions), source, datetime.now().isoformat(timespec='seconds')))
+        self.db.commit()
+
+    def record(self, layout: str, variant: str, hit: bool):
+        column = 'hits' if hit else 'misses'
+        self.db.execute(f'UPDATE layouts SET {column} = {column} + 1 WHERE layout = ? AND variant = ?',
+                        (layout, variant))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def header_region(variants: Dict[str, List[Region]]) -> Optional[Region]:
+    """One header band covering every variant's header.
+
+    It may reach into a variant's leg list; the header lines are picked
+    out of it again by position once the variant is known.
+    """
+    headers = [region for regions in variants.values() for region in regions if region['name'] == 'header']
+    if not headers:
+        return None
+    return {'name': 'header', 'top': min(r['top'] for r in headers),
+            'bottom': max(r['bottom'] for r in headers), 'psm': REGION_PSM['header']}
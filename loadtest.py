@@ -0,0 +1,327 @@
+"""Local HTTP load test for the upload path.
+
+Drives /upload (or any endpoint taking a multipart image) on a local
+instance of the app with a corpus of slip images, at a fixed concurrency
+and optionally a fixed request rate. Reports throughput, latency
+percentiles, error rate and server CPU, and writes everything to a JSON
+file so runs can be compared across releases:
+
+    python loadtest.py images/ --concurrency 8 --duration 60 --server-pid $(pgrep -f app.py)
+    python loadtest.py images/ --rate 5 --requests 500 --compare loadtest-1.2.json
+
+Uploads are sent with archive=0: the app scans them without archiving or
+indexing them and deletes them afterwards, so a run leaves no trace in
+images/ or the data directory. --allow-reuse has to let the app archive
+them (reuse works from the archive); run it against a scratch
+CAPPING_DATA_DIR and upload folder.
+"""
+import argparse
+import itertools
+import json
+import math
+import mimetypes
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1'}
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg'}
+
+
+def load_corpus(paths: List[str]) -> List[tuple]:
+    """(filename, bytes) for every image in the given files/directories."""
+    files = []
+    for path in map(Path, paths):
+        candidates = sorted(path.iterdir()) if path.is_dir() else [path]
+        files.extend(p for p in candidates if p.suffix.lower() in IMAGE_SUFFIXES)
+    return [(p.name, p.read_bytes()) for p in files]
+
+
+def encode_multipart(field: str, filename: str, data: bytes, fields: Optional[Dict[str, str]] = None) -> tuple:
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    body = ''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in (fields or {}).items()
+    ).encode('utf-8') + (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode('utf-8') + data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # Nearest rank: the smallest value with at least pct% of values at or below it
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def read_stat(pid: int) -> Optional[List[str]]:
+    """Fields of /proc/<pid>/stat after the parenthesised command name."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+
+class CpuSampler(threading.Thread):
+    """Samples the CPU time of server processes from /proc while the test runs.
+
+    Each pid counts with all its live descendants (OCR pool workers and
+    their tesseracts) and their reaped children, so CPU moves from a
+    child to its parent when the child exits instead of being lost. Pass
+    queue worker pids too, since they are not children of the app.
+    """
+
+    def __init__(self, pids: List[int], interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pids = list(pids)
+        self.interval = interval
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def tree(self) -> set:
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                fields = read_stat(int(entry))
+                if fields:
+                    parents.setdefault(int(fields[1]), []).append(int(entry))
+        found, todo = set(), list(self.pids)
+        while todo:
+            pid = todo.pop()
+            if pid not in found:
+                found.add(pid)
+                todo.extend(parents.get(pid, []))
+        return found
+
+    def read(self) -> Optional[float]:
+        total, alive = 0, False
+        for pid in self.tree():
+            fields = read_stat(pid)
+            if fields is None:
+                continue
+            alive = alive or pid in self.pids
+            utime, stime, cutime, cstime = (int(v) for v in fields[11:15])
+            total += utime + stime + cutime + cstime
+        return total / self.ticks if alive else None
+
+    def run(self):
+        while not self.stopped.is_set():
+            cpu = self.read()
+            if cpu is not None:
+                self.samples.append((time.monotonic(), cpu))
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> Dict:
+        self.stopped.set()
+        self.join()
+        cpu = self.read()
+        if cpu is not None:
+            self.samples.append((time.monotonic(), cpu))
+        if len(self.samples) < 2:
+            return {'cpu_percent_mean': None, 'cpu_percent_peak': None}
+        (t0, c0), (t1, c1) = self.samples[0], self.samples[-1]
+        peaks = [(cb - ca) / (tb - ta) * 100
+                 for (ta, ca), (tb, cb) in zip(self.samples, self.samples[1:]) if tb > ta]
+        return {'cpu_percent_mean': round((c1 - c0) / (t1 - t0) * 100, 1),
+                'cpu_percent_peak': round(max(peaks), 1)}
+
+
+class LoadTest:
+    def __init__(self, url: str, corpus: List[tuple], concurrency: int = 4,
+                 rate: Optional[float] = None, duration: Optional[float] = None,
+                 requests: Optional[int] = None, field: str = 'file', timeout: float = 120,
+                 reuse: bool = False):
+        self.url = url
+        self.corpus = corpus
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+        self.field = field
+        self.timeout = timeout
+        self.reuse = reuse
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+
+    def _schedule(self, start: float) -> Optional[tuple]:
+        """(intended start time, request index), or None when the test is over."""
+        index = next(self.counter)
+        if self.requests is not None and index >= self.requests:
+            return None
+        scheduled = start + index / self.rate if self.rate else time.monotonic()
+        if self.duration is not None and scheduled - start >= self.duration:
+            return None
+        return scheduled, index
+
+    def _send(self, index: int) -> Optional[str]:
+        filename, data = self.corpus[index % len(self.corpus)]
+        # A name of its own, so concurrent uploads of one corpus file do not
+        # overwrite each other, and (unless testing reuse) no reuse of earlier
+        # scans of the same image, so every request runs tesseract
+        stem, suffix = os.path.splitext(filename)
+        filename = f"{stem}-lt{index}{suffix}"
+        fields = None if self.reuse else {'reuse': '0', 'archive': '0'}
+        body, content_type = encode_multipart(self.field, filename, data, fields)
+        request = Request(self.url, data=body, headers={'Content-Type': content_type})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            return None
+        except HTTPError as e:
+            return f'HTTP {e.code}'
+        except (URLError, OSError) as e:
+            return type(e).__name__
+
+    def _worker(self, start: float):
+        while True:
+            scheduled = self._schedule(start)
+            if scheduled is None:
+                return
+            scheduled, index = scheduled
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            error = self._send(index)
+            # With a fixed rate, latency counts from the intended start so
+            # that queueing behind a saturated server is not hidden.
+            latency = time.monotonic() - scheduled
+            with self.lock:
+                if error:
+                    self.errors[error] = self.errors.get(error, 0) + 1
+                else:
+                    self.latencies.append(latency)
+
+    def run(self) -> Dict:
+        start = time.monotonic()
+        threads = [threading.Thread(target=self._worker, args=(start,), daemon=True)
+                   for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        latencies = sorted(self.latencies)
+        errors = sum(self.errors.values())
+        total = len(latencies) + errors
+        ms = lambda value: None if value is None else round(value * 1000, 1)
+        return {
+            'requests': total,
+            'succeeded': len(latencies),
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else None,
+            'error_kinds': self.errors,
+            'elapsed_s': round(elapsed, 2),
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+                'p50': ms(percentile(latencies, 50)),
+                'p95': ms(percentile(latencies, 95)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(latencies[-1]) if latencies else None,
+            },
+        }
+
+
+def print_report(report: Dict, previous: Optional[Dict] = None):
+    def line(label, value, key_path):
+        text = f"{label:<16}{'-' if value is None else value}"
+        if previous is not None:
+            old = previous['results']
+            for key in key_path:
+                old = (old or {}).get(key)
+            if old and value is not None:
+                text += f"   (was {old}, {(value - old) / old:+.1%})"
+        print(text)
+
+    results = report['results']
+    print(f"\n{report['config']['url']}  concurrency={report['config']['concurrency']} "
+          f"rate={report['config']['rate'] or 'max'}")
+    line('requests', results['requests'], ['requests'])
+    line('throughput/s', results['throughput_rps'], ['throughput_rps'])
+    for key in ('p50', 'p95', 'p99', 'max'):
+        line(f'{key} ms', results['latency_ms'][key], ['latency_ms', key])
+    line('error rate', results['error_rate'], ['error_rate'])
+    line('server cpu %', results.get('cpu_percent_mean'), ['cpu_percent_mean'])
+    line('server cpu peak', results.get('cpu_percent_peak'), ['cpu_percent_peak'])
+    if results['error_kinds']:
+        print('errors: ' + ', '.join(f"{kind} x{count}" for kind, count in results['error_kinds'].items()))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Load test the local scanner web app')
+    parser.add_argument('corpus', nargs='+', help='slip images or directories of them')
+    parser.add_argument('--url', default='http://127.0.0.1:3636/upload')
+    parser.add_argument('--field', default='file', help='multipart field name')
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, help='requests per second (default: as fast as possible)')
+    parser.add_argument('--duration', type=float, help='seconds to run')
+    parser.add_argument('-n', '--requests', type=int, help='total requests to send')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--allow-reuse', action='store_true',
+                        help='let the server archive uploads and reuse earlier scans of repeated images '
+                             'instead of OCRing each upload (use a scratch data directory)')
+    parser.add_argument('--server-pid', type=int, action='append', default=[],
+                        help='app or queue worker process to sample CPU usage from, with its children '
+                             '(repeat for each worker)')
+    parser.add_argument('--label', help='release or build label stored with the results')
+    parser.add_argument('-o', '--out', help='results file (default: loadtest-<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+
+    if urlparse(args.url).hostname not in LOCAL_HOSTS:
+        print(f"Refusing to load test non-local host in {args.url}", file=sys.stderr)
+        return 2
+    if args.duration is None and args.requests is None:
+        args.duration = 30.0
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print("No .png/.jpg images found in corpus", file=sys.stderr)
+        return 2
+
+    sampler = CpuSampler(args.server_pid) if args.server_pid else None
+    if sampler:
+        sampler.start()
+    test = LoadTest(args.url, corpus, concurrency=args.concurrency, rate=args.rate,
+                    duration=args.duration, requests=args.requests,
+                    field=args.field, timeout=args.timeout, reuse=args.allow_reuse)
+    results = test.run()
+    if sampler:
+        results.update(sampler.stop())
+
+    report = {
+        'label': args.label,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {'url': args.url, 'concurrency': args.concurrency, 'rate': args.rate,
+                   'duration': args.duration, 'requests': args.requests, 'reuse': args.allow_reuse,
+                   'corpus_files': len(corpus), 'corpus_bytes': sum(len(data) for _, data in corpus)},
+        'results': results,
+    }
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, previous)
+
+    out = Path(args.out or f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    out.write_text(json.dumps(report, indent=2))
+    print(f"\nWrote {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,412 @@
+"""Process pool for OCR with shared-memory image handoff.
+
+Segmentation, cropping and encoding images for tesseract are CPU work in
+Python, so threads serialize on the GIL. `OcrPool` runs that work (and
+the tesseract calls it drives) in worker processes. Pickling a decoded
+1170x2532 RGB screenshot to a worker would copy ~9MB per job. Instead the
+parent copies the pixels once into a `multiprocessing.shared_memory`
+block, and only a small `SharedImage` descriptor (block name, size, mode)
+crosses the process boundary. Workers map the block for the duration of
+the job.
+
+The parent owns every block. It unlinks the block as soon as the job
+finishes, fails or times out. A block left behind by a killed parent is
+removed by the multiprocessing resource tracker. Failing that, it is
+named after that parent's pid and is removed the next time a pool
+starts.
+
+Workers are supervised so that a batch of thousands of images, or a web
+process that runs for days, stays stable. Each worker runs under
+RLIMIT_AS and RLIMIT_CPU, which the tesseract processes it starts
+inherit, and writes its temp files to a directory of its own. It is
+replaced after WORKER_MAX_JOBS jobs, or once its RSS or CPU time grows
+too large, and its temp directory is removed with it. If a worker dies
+mid-job, only that job is affected: it is retried on a fresh worker, and
+an image that kills a worker again is moved to QUARANTINE_DIR so batch
+reruns skip it.
+"""
+import json
+import os
+import queue
+import re
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from multiprocessing import get_context, shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from deadline import Deadline, DeadlineExceeded
+from scanner import DATA_DIR
+
+OCR_WORKERS = int(os.environ.get('CAPPING_OCR_WORKERS', 0))   # 0: OCR in the calling process
+SHM_PREFIX = 'capping-'
+SHM_DIR = '/dev/shm'
+TMP_PREFIX = 'capping-ocr-'
+
+# Worker supervision (0 disables each limit)
+WORKER_MAX_JOBS = int(os.environ.get('CAPPING_OCR_WORKER_MAX_JOBS', 200))         # recycle after this many jobs
+WORKER_MAX_RSS_MB = float(os.environ.get('CAPPING_OCR_WORKER_MAX_RSS_MB', 768))   # ... or once RSS passes this
+WORKER_MEMORY_MB = int(os.environ.get('CAPPING_OCR_WORKER_MEMORY_MB', 4096))      # RLIMIT_AS, tesseract included
+WORKER_CPU_S = int(os.environ.get('CAPPING_OCR_WORKER_CPU_S', 600))               # RLIMIT_CPU per process
+CRASH_RETRIES = 1     # a job whose worker died is retried this many times on a fresh worker
+KILL_GRACE_S = 5      # a worker still busy this long after the scan deadline is killed
+QUARANTINE_DIR = DATA_DIR / 'quarantine'
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class SharedImage:
+    """Descriptor of decoded pixels in a shared-memory block."""
+
+    def __init__(self, name: str, size: Tuple[int, int], mode: str):
+        self.name = name
+        self.size = size
+        self.mode = mode
+
+    @classmethod
+    def create(cls, image) -> Tuple['SharedImage', shared_memory.SharedMemory]:
+        """Copy an image into a new block; the caller must unlink the block."""
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        data = image.tobytes()
+        name = f'{SHM_PREFIX}{os.getpid()}-{os.urandom(6).hex()}'
+        block = shared_memory.SharedMemory(name=name, create=True, size=max(len(data), 1))
+        block.buf[:len(data)] = data
+        return cls(block.name, image.size, image.mode), block
+
+    @contextmanager
+    def attach(self):
+        """The shared pixels as a PIL image, valid inside the with block."""
+        from PIL import Image
+        # Pool workers share the parent's resource tracker, so attaching here
+        # does not hand ownership of the block to the worker
+        block = shared_memory.SharedMemory(name=self.name)
+        try:
+            length = self.size[0] * self.size[1] * len(self.mode)
+            image = Image.frombuffer(self.mode, self.size, block.buf[:length], 'raw', self.mode, 0, 1)
+            yield image
+            del image
+        finally:
+            try:
+                block.close()
+            except BufferError:
+                # A hedged OCR thread that lost the race still holds the
+                # pixels; the mapping is released when it finishes.
+                pass
+
+
+def _pid_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale_blocks():
+    """Unlink blocks (and worker temp dirs) left behind by parent processes that no longer exist."""
+    for directory, pattern in ((SHM_DIR, rf'{SHM_PREFIX}(\d+)-[0-9a-f]+'),
+                               (tempfile.gettempdir(), rf'{TMP_PREFIX}(\d+)-\w+')):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            match = re.fullmatch(pattern, name)
+            if match and not _pid_exists(int(match.group(1))):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+
+
+@lru_cache(maxsize=None)
+def _scanner(options: Tuple):
+    from scanner import BetSlipScanner
+    return BetSlipScanner(verbose=False, **dict(options))
+
+
+def _ocr_cards(shared: SharedImage, options: Tuple, segment: bool,
+               remaining: Optional[float]) -> Tuple[List[Dict], Dict]:
+    """Worker side: OCR the shared image; returns (cards, deadline report)."""
+    deadline = Deadline(remaining)
+    with shared.attach() as image:
+        cards = _scanner(options).hedged_ocr_cards(image, segment=segment, deadline=deadline)
+    return cards, deadline.report()
+
+
+def _limit_resources(memory_mb: int, cpu_s: int):
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_s:
+        # SIGXCPU at the soft limit; the worker asks to be recycled well before
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_s, cpu_s + KILL_GRACE_S))
+
+
+def _usage() -> Dict:
+    """RSS (MB) and CPU seconds of this worker process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        rss = usage.ru_maxrss * 1024    # peak, where /proc is unavailable
+    return {'rss_mb': round(rss / 1024 / 1024, 1), 'cpu_s': round(usage.ru_utime + usage.ru_stime, 2)}
+
+
+def _serve(conn, memory_mb: int, cpu_s: int, tmpdir: str):
+    """Worker process: run jobs from the parent until told to stop."""
+    _limit_resources(memory_mb, cpu_s)
+    # pytesseract's image and output files; a tesseract killed on timeout
+    # leaves them behind, and the parent removes the directory with the worker
+    tempfile.tempdir = tmpdir
+    conn.send(('ready', os.getpid()))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        try:
+            reply = ('ok', _ocr_cards(*job))
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            conn.send(reply + (_usage(),))
+        except Exception:
+            # An exception that does not pickle
+            conn.send(('error', RuntimeError(f"{type(reply[1]).__name__}: {reply[1]}"), _usage()))
+
+
+class Worker:
+    """One supervised worker process and its pipe."""
+
+    def __init__(self, context, memory_mb: int, cpu_s: int):
+        self.tmpdir = tempfile.mkdtemp(prefix=f'{TMP_PREFIX}{os.getpid()}-')
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, memory_mb, cpu_s, self.tmpdir),
+                                       name='ocr-worker', daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+        self.jobs = 0
+        self.usage = {}
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        if not self.ready:
+            try:
+                if not self.conn.poll(timeout):
+                    raise TimeoutError("OCR worker did not start")
+                self.conn.recv()
+            except (EOFError, OSError):
+                # Not the image's fault, so not a crash to retry or quarantine
+                raise RuntimeError(f"OCR worker failed to start ({self.exit_reason()})")
+            self.ready = True
+
+    def call(self, job: Tuple, timeout: Optional[float]) -> Tuple:
+        """Run a job; EOFError or OSError if the worker died, TimeoutError if it hangs."""
+        self.wait_ready(timeout)
+        self.conn.send(job)
+        if not self.conn.poll(timeout):
+            raise TimeoutError
+        status, payload, self.usage = self.conn.recv()
+        self.jobs += 1
+        return status, payload
+
+    def exit_reason(self) -> str:
+        self.process.join(1)
+        code = self.process.exitcode
+        if code is None:
+            return "still running"
+        if code < 0:
+            try:
+                return f"killed by {signal.Signals(-code).name}"
+            except ValueError:
+                return f"killed by signal {-code}"
+        return f"exit code {code}"
+
+    def stop(self, kill: bool = False):
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(KILL_GRACE_S)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def quarantine(image_path: Path, reason: str) -> Optional[Path]:
+    """Move an image that crashes OCR workers out of the way, with a note why."""
+    QUARANTINE_DIR.mkdir(parents=True, exist_ok=True)
+    target = QUARANTINE_DIR / f"{datetime.now():%Y%m%d%H%M%S}-{image_path.name}"
+    try:
+        shutil.move(str(image_path), str(target))
+    except OSError as e:
+        print(f"Could not quarantine {image_path}: {e}", file=sys.stderr)
+        return None
+    with open(target.with_name(target.name + '.json'), 'w') as f:
+        json.dump({'image': str(image_path), 'reason': reason,
+                   'quarantined_at': datetime.now().isoformat(timespec='seconds')}, f)
+    return target
+
+
+class OcrPool:
+    def __init__(self, workers: int = OCR_WORKERS, max_jobs: int = WORKER_MAX_JOBS,
+                 max_rss_mb: float = WORKER_MAX_RSS_MB, memory_mb: int = WORKER_MEMORY_MB,
+                 cpu_s: int = WORKER_CPU_S):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.memory_mb = memory_mb
+        self.cpu_s = cpu_s
+        # spawn: the web app forks from a process with running threads
+        self.context = get_context('spawn')
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = set()
+        self.counts = {'jobs': 0, 'recycled': 0, 'crashes': 0, 'hung': 0, 'quarantined': 0}
+
+    def _spawn(self) -> Worker:
+        # Called with the lock held
+        worker = Worker(self.context, self.memory_mb, self.cpu_s)
+        self.running.add(worker)
+        return worker
+
+    def _retire(self, worker: Worker, kill: bool = False):
+        """Stop a worker and start its replacement."""
+        with self.lock:
+            self.running.discard(worker)
+            replacement = self._spawn()
+        threading.Thread(target=worker.stop, args=(kill,), daemon=True).start()
+        self.idle.put(replacement)
+
+    def _worn_out(self, worker: Worker) -> bool:
+        return bool((self.max_jobs and worker.jobs >= self.max_jobs)
+                    or (self.max_rss_mb and worker.usage.get('rss_mb', 0) > self.max_rss_mb)
+                    # Before RLIMIT_CPU's SIGXCPU would kill it mid-job
+                    or (self.cpu_s and worker.usage.get('cpu_s', 0) > self.cpu_s / 2))
+
+    def _count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def start(self):
+        """Spawn the worker processes now rather than on the first scan."""
+        remove_stale_blocks()
+        with self.lock:
+            workers = [self._spawn() for _ in range(self.workers - len(self.running))]
+        error = None
+        for worker in workers:
+            try:
+                worker.wait_ready()
+            except (RuntimeError, TimeoutError) as e:
+                # Leave the slot to a fresh worker instead of losing it
+                self._retire(worker, kill=True)
+                error = error or e
+                continue
+            self.idle.put(worker)
+        if error is not None:
+            raise error
+
+    def _acquire(self) -> Worker:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.running) < self.workers:
+                return self._spawn()
+        return self.idle.get()
+
+    def ocr_cards(self, scanner, image, segment: bool = True, deadline: Optional[Deadline] = None,
+                  image_path: Optional[Path] = None) -> List[Dict]:
+        """scanner.hedged_ocr_cards(image, ...) run in a worker process.
+
+        Raises WorkerCrashed, after quarantining `image_path` if given, when
+        the image kills a worker on every attempt.
+        """
+        options = tuple(sorted({'ocr_config': scanner.ocr_config, 'sportsbook': scanner.sportsbook,
+                                'hedge_after': scanner.hedge_after}.items()))
+        shared, block = SharedImage.create(image)
+        try:
+            for attempt in range(CRASH_RETRIES + 1):
+                remaining = deadline.remaining() if deadline is not None else None
+                timeout = None if remaining is None else max(remaining, 0) + KILL_GRACE_S
+                worker = self._acquire()
+                try:
+                    status, payload = worker.call((shared, options, segment, remaining), timeout)
+                except RuntimeError:
+                    # Failed to start: replace it, or the pool loses the slot for good
+                    self._retire(worker, kill=True)
+                    raise
+                except TimeoutError:
+                    # Stuck past its own tesseract timeouts
+                    self._count('hung')
+                    self._retire(worker, kill=True)
+                    if deadline is None:
+                        raise
+                    deadline.timeout('ocr')
+                except (EOFError, OSError):
+                    reason = worker.exit_reason()
+                    self._count('crashes')
+                    self._retire(worker, kill=True)
+                    print(f"OCR worker died on {image_path.name if image_path else 'an image'} "
+                          f"({reason}), attempt {attempt + 1}", file=sys.stderr)
+                    continue
+                self._count('jobs')
+                if self._worn_out(worker):
+                    self._count('recycled')
+                    self._retire(worker)
+                else:
+                    self.idle.put(worker)
+                break
+            else:
+                message = f"OCR worker died on every attempt ({reason})"
+                if image_path is not None and quarantine(image_path, message):
+                    self._count('quarantined')
+                    message += "; image quarantined"
+                raise WorkerCrashed(message)
+        finally:
+            block.close()
+            block.unlink()
+        if status == 'error':
+            if isinstance(payload, DeadlineExceeded) and deadline is not None:
+                deadline.timeout(payload.stage)
+            raise payload
+        cards, report = payload
+        if deadline is not None:
+            deadline.hedged = report['hedged']
+            deadline.fallback = report['fallback']
+        return cards
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'workers': len(self.running), **self.counts}
+
+    def shutdown(self):
+        with self.lock:
+            workers = list(self.running)
+            self.running.clear()
+        for worker in workers:
+            worker.stop()
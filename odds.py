@@ -0,0 +1,175 @@
+"""American odds maths and batch payout validation.
+
+`extract_wager_and_payout` takes the first two dollar amounts on a slip,
+so a misread digit goes unnoticed. A slip's payout should equal its wager
+times the decimal odds it shows. `validate_store` checks that for every
+archived slip, in NumPy batches, and reports the suspect slips so that
+only those need to be re-OCR'd.
+
+When no total-odds line was read but every leg shows its odds, the
+expected payout uses the parlay of the legs (the product of their decimal
+odds). Slips with no odds at all cannot be checked and are not reported.
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+PAYOUT_TOLERANCE = 0.05       # dollars; covers cent rounding
+PAYOUT_TOLERANCE_RATIO = 0.01
+BATCH_SIZE = 10000
+
+OK, MISSING_AMOUNTS, UNVERIFIABLE, PAYOUT_MISMATCH = range(4)
+REASONS = ['ok', 'missing_amounts', 'unverifiable', 'payout_mismatch']
+
+ODDS_TOKEN = re.compile(r'(?:^|\s)([+-]\d{3,6})\s*$')
+
+
+def american_to_decimal(odds):
+    """Decimal odds (total return per unit staked) for American odds."""
+    odds = np.asarray(odds, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(odds > 0, 1 + odds / 100, 1 + 100 / np.abs(odds))
+
+
+def implied_probability(odds):
+    """Win probability implied by American odds (vig included)."""
+    odds = np.asarray(odds, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(odds > 0, 100 / (odds + 100), np.abs(odds) / (np.abs(odds) + 100))
+
+
+def decimal_to_american(decimal):
+    decimal = np.asarray(decimal, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(decimal >= 2, (decimal - 1) * 100, -100 / (decimal - 1))
+
+
+def parlay_decimal(leg_odds):
+    """Decimal odds of parlays of independent legs.
+
+    `leg_odds` holds one row of American leg odds per parlay, padded with
+    NaN. Rows without any legs give NaN.
+    """
+    legs = np.atleast_2d(np.asarray(leg_odds, dtype=np.float64))
+    missing = np.isnan(legs)
+    decimal = np.where(missing, 1.0, american_to_decimal(legs)).prod(axis=1)
+    return np.where(missing.all(axis=1), np.nan, decimal)
+
+
+def slip_odds(text: str, legs: int) -> Tuple[Optional[int], List[int]]:
+    """(total odds, leg odds) read from a slip's text.
+
+    A slip shows its total odds under the bet type, and some show each
+    leg's odds as well. With one odds line per leg and no extra one, the
+    total line was not read, and the legs' odds are returned instead.
+    """
+    found = [int(match.group(1)) for match in map(ODDS_TOKEN.search, (line.strip() for line in text.split('\n')))
+             if match and abs(int(match.group(1))) >= 100]
+    if not found:
+        return None, []
+    if legs > 1 and len(found) == legs:
+        return None, found
+    return found[0], found[1:] if len(found) == legs + 1 else []
+
+
+def expected_payout(wager, odds):
+    """Total payout (stake included) for `wager` at American `odds`."""
+    return np.asarray(wager, dtype=np.float64) * american_to_decimal(odds)
+
+
+def check_payouts(wagers, payouts, odds):
+    """Vectorised consistency check; returns (expected payouts, reason codes).
+
+    Missing odds are passed as NaN and missing amounts as 0.
+    """
+    wagers = np.asarray(wagers, dtype=np.float64)
+    payouts = np.asarray(payouts, dtype=np.float64)
+    odds = np.asarray(odds, dtype=np.float64)
+
+    expected = expected_payout(wagers, odds)
+    tolerance = np.maximum(PAYOUT_TOLERANCE, PAYOUT_TOLERANCE_RATIO * expected)
+    with np.errstate(invalid='ignore'):
+        mismatch = np.abs(payouts - expected) > tolerance
+
+    codes = np.full(wagers.shape, OK, dtype=np.int8)
+    codes[mismatch] = PAYOUT_MISMATCH
+    # No odds on the slip: nothing to check the payout against
+    codes[np.isnan(odds)] = UNVERIFIABLE
+    codes[(wagers <= 0) | (payouts <= 0)] = MISSING_AMOUNTS
+    return expected, codes
+
+
+def iter_slips(record_paths: Iterable[Path]) -> Iterator[Dict]:
+    """Flatten archive records into one row per slip."""
+    from archive import load_record, record_slips
+
+    for record_path in record_paths:
+        try:
+            record = load_record(record_path)
+        except (OSError, ValueError):
+            continue
+        for idx, slip in enumerate(record_slips(record), 1):
+            result = slip.get('result') or {}
+            legs = sum(len(game['positions']) for game in result.get('games', []))
+            # Read from the text, so records parsed before odds were extracted are covered
+            odds, leg_odds = slip_odds(slip['text'], legs)
+            payout = result.get('won_amount') if result.get('bet_finished') else result.get('total_payout')
+            yield {
+                'record': str(record_path),
+                'image': record.get('image'),
+                'slip_index': idx,
+                'wager': result.get('total_wager') or 0.0,
+                'payout': payout or 0.0,
+                'odds': odds,
+                'leg_odds': leg_odds,
+            }
+
+
+def validate_batch(rows: List[Dict]) -> List[Dict]:
+    """Return the suspect rows of a batch.
+
+    Each is annotated with the odds checked against (`odds_from` says
+    whether the slip's total or its legs), their implied probability, the
+    expected payout and the reason.
+    """
+    if not rows:
+        return []
+    odds = np.array([np.nan if row['odds'] is None else row['odds'] for row in rows], dtype=np.float64)
+    width = max(len(row.get('leg_odds') or ()) for row in rows)
+    leg_odds = np.full((len(rows), max(width, 1)), np.nan)
+    for idx, row in enumerate(rows):
+        legs = row.get('leg_odds') or ()
+        leg_odds[idx, :len(legs)] = legs
+    # No total line read: the parlay of the legs' odds
+    from_legs = np.isnan(odds) & ~np.isnan(leg_odds).all(axis=1)
+    odds[from_legs] = decimal_to_american(parlay_decimal(leg_odds[from_legs]))
+    expected, codes = check_payouts(
+        [row['wager'] for row in rows],
+        [row['payout'] for row in rows],
+        odds,
+    )
+    probability = implied_probability(odds)
+    suspects = []
+    for idx in np.flatnonzero((codes != OK) & (codes != UNVERIFIABLE)):
+        row = dict(rows[idx])
+        if from_legs[idx]:
+            row['odds'] = int(round(float(odds[idx])))
+        row['odds_from'] = None if np.isnan(odds[idx]) else ('legs' if from_legs[idx] else 'slip')
+        row['implied_probability'] = None if np.isnan(probability[idx]) else round(float(probability[idx]), 4)
+        row['expected_payout'] = None if np.isnan(expected[idx]) else round(float(expected[idx]), 2)
+        row['reason'] = REASONS[codes[idx]]
+        suspects.append(row)
+    return suspects
+
+
+def validate_store(record_paths: Iterable[Path], batch_size: int = BATCH_SIZE) -> Iterator[Dict]:
+    """Stream every archived slip through `validate_batch`, yielding suspects."""
+    batch = []
+    for row in iter_slips(record_paths):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from validate_batch(batch)
+            batch = []
+    yield from validate_batch(batch)
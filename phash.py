@@ -0,0 +1,106 @@
+"""Perceptual-hash index for near-duplicate screenshots.
+
+The same slip screenshotted twice differs in the status-bar clock or by a
+few pixels of crop, so byte hashes never match. A 64-bit dHash (brightness
+gradients of a 9x8 grayscale thumbnail) barely changes between such
+copies. The hashes are stored in SQLite as a multi-index hash table: each
+hash is split into four 16-bit chunks, each indexed separately. Two hashes
+within Hamming distance d must agree to within d // 4 bits on at least one
+chunk, so a lookup only probes the chunk values in that radius. That stays
+fast with millions of stored hashes.
+"""
+import sqlite3
+from itertools import combinations
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from scanner import DATA_DIR
+
+PHASH_DB = DATA_DIR / 'phash.db'
+DUPLICATE_DISTANCE = 4     # max Hamming distance treated as the same screenshot
+CHUNKS = 4
+CHUNK_BITS = 16
+
+
+def dhash(image, size: int = 8) -> int:
+    """64-bit difference hash of an image."""
+    from PIL import Image
+    thumb = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = list(thumb.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def chunks(value: int) -> List[int]:
+    mask = (1 << CHUNK_BITS) - 1
+    return [(value >> (CHUNK_BITS * i)) & mask for i in range(CHUNKS)]
+
+
+def neighbours(value: int, radius: int) -> Iterator[int]:
+    """Every CHUNK_BITS-bit value within `radius` bit flips of `value`."""
+    for flips in range(radius + 1):
+        for bits in combinations(range(CHUNK_BITS), flips):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            yield flipped
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class PhashIndex:
+    def __init__(self, path: Path = PHASH_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS hashes (
+            id INTEGER PRIMARY KEY,
+            hash INTEGER NOT NULL,
+            c0 INTEGER NOT NULL, c1 INTEGER NOT NULL, c2 INTEGER NOT NULL, c3 INTEGER NOT NULL,
+            record TEXT NOT NULL UNIQUE,
+            image TEXT)''')
+        for i in range(CHUNKS):
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS hashes_c{i} ON hashes (c{i})')
+        self.db.commit()
+
+    def add(self, value: int, record: Path, image: Optional[str] = None):
+        self.db.execute(
+            'INSERT OR REPLACE INTO hashes (hash, c0, c1, c2, c3, record, image) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (_signed(value), *chunks(value), str(record), image))
+        self.db.commit()
+
+    def remove(self, record: Path):
+        self.db.execute('DELETE FROM hashes WHERE record = ?', (str(record),))
+        self.db.commit()
+
+    def search(self, value: int, threshold: int = DUPLICATE_DISTANCE) -> List[Tuple[int, str, str]]:
+        """(distance, record, image) of stored hashes within `threshold`, closest first."""
+        radius = threshold // CHUNKS
+        clauses, params = [], []
+        for i, chunk in enumerate(chunks(value)):
+            probes = list(neighbours(chunk, radius))
+            clauses.append(f"c{i} IN ({','.join('?' * len(probes))})")
+            params.extend(probes)
+        rows = self.db.execute(
+            f"SELECT hash, record, image FROM hashes WHERE {' OR '.join(clauses)}", params)
+        matches = []
+        for stored, record, image in rows:
+            distance = hamming(value, stored & ((1 << 64) - 1))
+            if distance <= threshold:
+                matches.append((distance, record, image))
+        return sorted(matches)
+
+    def close(self):
+        self.db.close()
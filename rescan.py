@@ -0,0 +1,147 @@
+"""Change-aware re-scan for repeated screenshots of the same slip.
+
+Live SGPs get re-uploaded every few minutes with only the score and status
+areas changed. Every archived scan stores a grid of block means (its
+signature) and the OCR'd lines with their vertical positions. A new upload
+with the same dimensions is compared block by block against recent scans.
+If it closely matches one, only the rows that changed are re-OCR'd, and
+those lines are merged into the previous text.
+"""
+import base64
+import os
+from collections import defaultdict, deque
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+BLOCK = 16                   # signature block size in pixels
+CHANGE_THRESHOLD = 2.0       # mean grey-level difference for a block to count as changed
+MAX_CHANGED_FRACTION = 0.3   # above this the upload is treated as a different slip
+ROW_PADDING = 6              # pixels added around each changed region
+RECENT_PER_SIZE = 20         # recent scans remembered per image size
+SEED_LIMIT = 200             # archived scans loaded when a directory is first seen
+
+Line = List  # [top, bottom, text]
+
+
+def block_signature(image) -> np.ndarray:
+    gray = np.asarray(image.convert('L'), dtype=np.float32)
+    rows, cols = gray.shape[0] // BLOCK, gray.shape[1] // BLOCK
+    gray = gray[:rows * BLOCK, :cols * BLOCK]
+    means = gray.reshape(rows, BLOCK, cols, BLOCK).mean(axis=(1, 3))
+    return np.round(means).astype(np.uint8)
+
+
+def encode_signature(signature: np.ndarray) -> Dict:
+    return {'block': BLOCK,
+            'shape': list(signature.shape),
+            'data': base64.b64encode(signature.tobytes()).decode('ascii')}
+
+
+def decode_signature(encoded: Dict) -> Optional[np.ndarray]:
+    if not encoded or encoded.get('block') != BLOCK:
+        return None
+    data = np.frombuffer(base64.b64decode(encoded['data']), dtype=np.uint8)
+    return data.reshape(encoded['shape'])
+
+
+def changed_rows(old: np.ndarray, new: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Per block-row change mask and the fraction of blocks that changed."""
+    changed = np.abs(old.astype(np.int16) - new.astype(np.int16)) > CHANGE_THRESHOLD
+    return changed.any(axis=1), float(changed.mean())
+
+
+def plan_regions(rows: np.ndarray, lines: List[Line], height: int) -> List[Tuple[int, int]]:
+    """Pixel row ranges to re-OCR: changed rows grown to cover whole text lines."""
+    regions = []
+    padded = np.concatenate(([False], rows, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    for start, end in zip(edges[::2], edges[1::2]):
+        top = max(0, int(start) * BLOCK - ROW_PADDING)
+        bottom = min(height, int(end) * BLOCK + ROW_PADDING)
+        # Never cut through a text line
+        for line_top, line_bottom, _ in lines:
+            if line_top < bottom and line_bottom > top:
+                top = min(top, max(0, line_top - ROW_PADDING))
+                bottom = max(bottom, min(height, line_bottom + ROW_PADDING))
+        if regions and top <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], bottom))
+        else:
+            regions.append((top, bottom))
+    return regions
+
+
+def merge_lines(lines: List[Line], regions: List[Tuple[int, int]],
+                region_lines: List[List[Line]]) -> List[Line]:
+    """Replace the lines inside each region with freshly OCR'd ones, keeping order."""
+    def inside(line):
+        centre = (line[0] + line[1]) / 2
+        return any(top <= centre < bottom for top, bottom in regions)
+
+    pending = sorted(zip(regions, region_lines))
+    merged = []
+    for line in lines:
+        while pending and line[0] >= pending[0][0][0]:
+            merged.extend(pending.pop(0)[1])
+        if not inside(line):
+            merged.append(line)
+    for _, new_lines in pending:
+        merged.extend(new_lines)
+    return merged
+
+
+class RecentScans:
+    """In-process index of recent scan signatures, keyed by image size."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.by_size = defaultdict(lambda: deque(maxlen=RECENT_PER_SIZE))
+        self.seeded = set()
+
+    def add(self, record_path: Path, size: Tuple[int, int], signature: np.ndarray):
+        with self.lock:
+            entries = self.by_size[tuple(size)]
+            for entry in list(entries):
+                if entry[0] == record_path:
+                    entries.remove(entry)
+            entries.append((record_path, signature))
+
+    def seed(self, directory: Path):
+        """Load signatures of the newest archived scans in `directory` once."""
+        from archive import ARCHIVE_SUFFIX, load_record
+        if directory in self.seeded:
+            return
+        self.seeded.add(directory)
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith(ARCHIVE_SUFFIX)]
+        except OSError:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[-SEED_LIMIT:]:
+            try:
+                record = load_record(Path(entry.path))
+            except (OSError, ValueError):
+                continue
+            signature = decode_signature(record.get('signature'))
+            if signature is not None and record.get('size'):
+                self.add(Path(entry.path), record['size'], signature)
+
+    def match(self, directory: Path, size: Tuple[int, int],
+              signature: np.ndarray) -> Optional[Tuple[Path, np.ndarray, float]]:
+        """Closest recent scan of the same size: (record path, changed rows, fraction)."""
+        self.seed(directory)
+        with self.lock:
+            candidates = list(self.by_size.get(tuple(size), ()))
+        best = None
+        for record_path, previous in candidates:
+            if previous.shape != signature.shape:
+                continue
+            rows, fraction = changed_rows(previous, signature)
+            if fraction <= MAX_CHANGED_FRACTION and (best is None or fraction < best[2]):
+                best = (record_path, rows, fraction)
+        return best
+
+
+recent_scans = RecentScans()
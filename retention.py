@@ -0,0 +1,200 @@
+"""Disk-budgeted retention for uploaded images.
+
+Once a scan is persisted (its `.ocr.json` sidecar exists), the original
+upload is only needed for display. Compaction replaces it with a smaller
+grayscale derivative (same name and format, so links keep working). When
+the folder is still over budget, the least recently used images are
+evicted ('lru', which uses access times bumped when an image is served)
+or the oldest are evicted ('age'). Sidecars are never removed, so the OCR
+text, results and indexes survive eviction, but their bytes count against
+the budget.
+
+`RetentionWorker` runs compaction in a background thread at idle CPU and
+I/O priority. `python scanner.py compact` runs a single pass from cron.
+"""
+import ctypes
+import os
+import platform
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from archive import ARCHIVE_SUFFIX, archive_path, load_record, write_record
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+
+DISK_BUDGET_MB = float(os.environ.get('CAPPING_IMAGE_BUDGET_MB', 2048))
+RETENTION_POLICY = os.environ.get('CAPPING_RETENTION_POLICY', 'lru')
+MAX_AGE_DAYS = float(os.environ.get('CAPPING_MAX_IMAGE_AGE_DAYS', 0))   # 0 keeps images forever
+COMPACT_AFTER_MIN = float(os.environ.get('CAPPING_COMPACT_AFTER_MIN', 60))
+RETENTION_INTERVAL_S = float(os.environ.get('CAPPING_RETENTION_INTERVAL_S', 600))
+DERIVATIVE_MAX_WIDTH = 1170
+JPEG_QUALITY = 75
+
+# ioprio_set(2) syscall numbers and the idle I/O class
+IOPRIO_SYSCALL = {'x86_64': 251, 'aarch64': 30}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+
+
+def lower_thread_priority():
+    """Give the calling thread idle CPU and I/O priority (Linux; best effort)."""
+    if not hasattr(threading, 'get_native_id'):
+        return
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except (AttributeError, OSError):
+        pass
+    syscall_number = IOPRIO_SYSCALL.get(platform.machine())
+    if syscall_number is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, tid, IOPRIO_CLASS_IDLE << 13)
+    except (OSError, AttributeError):
+        pass
+
+
+def touch_access(path: Path):
+    """Record that an image was used, for LRU eviction (works on noatime mounts)."""
+    try:
+        stat = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def compact_image(image_path: Path) -> Optional[Dict]:
+    """Replace an original upload with a grayscale derivative; returns size info.
+
+    Returns None, leaving everything as it was, if the image was already
+    compacted or changed (re-uploaded under the same name) meanwhile.
+    """
+    from PIL import Image
+
+    record_path = archive_path(image_path)
+    if load_record(record_path).get('compacted'):
+        return None
+
+    stat = image_path.stat()
+    original_bytes = stat.st_size
+    with Image.open(image_path) as image:
+        derivative = image.convert('L')
+        if derivative.size[0] > DERIVATIVE_MAX_WIDTH:
+            height = round(derivative.size[1] * DERIVATIVE_MAX_WIDTH / derivative.size[0])
+            derivative = derivative.resize((DERIVATIVE_MAX_WIDTH, height), Image.LANCZOS)
+        fmt = image.format
+
+    tmp_path = image_path.with_name(f'.{image_path.name}.compact')
+    if fmt == 'JPEG':
+        derivative.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    else:
+        derivative.save(tmp_path, 'PNG', optimize=True)
+    compacted_bytes = tmp_path.stat().st_size
+    current = image_path.stat()
+    if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+        # Re-uploaded while we were compacting: the new upload is not ours to touch
+        tmp_path.unlink()
+        return None
+    if compacted_bytes >= original_bytes:
+        tmp_path.unlink()
+        compacted_bytes = original_bytes
+    else:
+        os.replace(tmp_path, image_path)
+    # Neither reading nor rewriting the image counts as a use for LRU/age ordering
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    compacted = {'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'original_bytes': original_bytes,
+                 'bytes': compacted_bytes}
+    # Reload, so a rescan written meanwhile is kept and only gains this key
+    record = load_record(record_path)
+    record['compacted'] = compacted
+    write_record(record_path, record)
+    return compacted
+
+
+def persisted_images(directory: Path) -> List[os.DirEntry]:
+    """Image entries in `directory` whose scan has been archived."""
+    entries = list(os.scandir(directory))
+    sidecars = {entry.name for entry in entries if entry.name.endswith(ARCHIVE_SUFFIX)}
+    return [entry for entry in entries
+            if entry.name.lower().endswith(IMAGE_SUFFIXES) and entry.name + ARCHIVE_SUFFIX in sidecars]
+
+
+def enforce_retention(directory: Path, budget_mb: float = DISK_BUDGET_MB,
+                      policy: str = RETENTION_POLICY, max_age_days: float = MAX_AGE_DAYS,
+                      compact_after_min: float = COMPACT_AFTER_MIN,
+                      stop: Optional[threading.Event] = None) -> Dict[str, int]:
+    """One compaction and eviction pass over an upload folder."""
+    if policy not in ('lru', 'age'):
+        raise ValueError(f"Unknown retention policy '{policy}'; use 'lru' or 'age'")
+    stats = {'compacted': 0, 'saved_bytes': 0, 'evicted': 0, 'evicted_bytes': 0}
+    now = time.time()
+
+    for entry in persisted_images(directory):
+        if stop is not None and stop.is_set():
+            return stats
+        if now - entry.stat().st_mtime < compact_after_min * 60:
+            continue
+        try:
+            compacted = compact_image(Path(entry.path))
+        except (OSError, ValueError) as e:
+            print(f"Retention: could not compact {entry.name}: {e}")
+            continue
+        if compacted:
+            stats['compacted'] += 1
+            stats['saved_bytes'] += compacted['original_bytes'] - compacted['bytes']
+
+    images = []
+    for entry in persisted_images(directory):
+        stat = entry.stat()
+        images.append((stat.st_atime if policy == 'lru' else stat.st_mtime, stat.st_mtime, stat.st_size, entry.path))
+    images.sort()
+    # Sidecars stay, so they shrink what is left of the budget for images
+    sidecar_bytes = sum(entry.stat().st_size for entry in os.scandir(directory)
+                        if entry.name.endswith(ARCHIVE_SUFFIX))
+    total = sidecar_bytes + sum(size for _, _, size, _ in images)
+    budget = budget_mb * 1024 * 1024
+
+    for _, mtime, size, path in images:
+        expired = max_age_days and now - mtime > max_age_days * 86400
+        if not expired and (not budget_mb or total <= budget):
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        stats['evicted'] += 1
+        stats['evicted_bytes'] += size
+    return stats
+
+
+class RetentionWorker(threading.Thread):
+    """Background compaction loop for the web app."""
+
+    def __init__(self, directory: Path, interval: float = RETENTION_INTERVAL_S, **options):
+        super().__init__(name='retention', daemon=True)
+        self.directory = Path(directory)
+        self.interval = interval
+        self.options = options
+        self.stopped = threading.Event()
+
+    def run(self):
+        lower_thread_priority()
+        while not self.stopped.wait(self.interval):
+            try:
+                stats = enforce_retention(self.directory, stop=self.stopped, **self.options)
+            except Exception as e:
+                print(f"Retention pass failed: {e}")
+                continue
+            if stats['compacted'] or stats['evicted']:
+                print(f"Retention: compacted {stats['compacted']} images "
+                      f"(saved {stats['saved_bytes'] / 1e6:.1f}MB), evicted {stats['evicted']} "
+                      f"({stats['evicted_bytes'] / 1e6:.1f}MB)")
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,18 @@
+"""Built-in sample slip text used by `bench` and other self-checks."""
+
+SAMPLE_SLIP_TEXT = """3 leg Same Game Parlay
++450
+SAME GAME PARLAY
+INCLUDES: 3 SELECTIONS
+Boston Celtics @ New York Knicks 7:30PM ET
+Jayson Tatum
+TO SCORE 25+ POINTS
+Jalen Brunson
+3+ MADE THREES
+Josh Hart
+TO RECORD A DOUBLE DOUBLE
+$10.00
+TOTAL WAGER
+$55.00
+TOTAL PAYOUT
+"""
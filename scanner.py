@@ -1,14 +1,111 @@
-import pytesseract
-from PIL import Image
 import os
 import re
+import json
+import shutil
+import subprocess
+import sys
+import time
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 
+from deadline import (Deadline, DeadlineExceeded, FALLBACK_OCR_CONFIG, FALLBACK_SCALE, HEDGE_AFTER_S,
+                      SCAN_DEADLINE_S, is_tesseract_timeout, scan_metrics)
+
+# pytesseract and PIL are imported lazily inside the OCR methods so that the
+# CLI, reparse and bench paths start without paying for them.
+
+WINDOWS_TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+CACHE_DIR = Path(os.environ.get('CAPPING_CACHE_DIR', Path.home() / '.cache' / 'capping'))
+ENV_CACHE_FILE = CACHE_DIR / 'tesseract_env.json'
+# SQLite indexes over archived scans
+DATA_DIR = Path(os.environ.get('CAPPING_DATA_DIR', Path(__file__).parent / 'data'))
+
+# Tesseract config passed to image_to_string, and the parser revision.
+# Both are recorded with every archived scan; bump PARSER_VERSION whenever
+# extract_legs or its helpers change so `reparse` picks up stale records.
+OCR_CONFIG = ''
+PARSER_VERSION = '2'
+
+# Alternative page segmentation used when re-reading slips that failed validation
+RETRY_OCR_CONFIG = '--psm 4'
+
+# Selects the user-words/user-patterns files passed to tesseract (see vocabulary.py)
+DEFAULT_SPORTSBOOK = 'fanduel'
+
+
+@lru_cache(maxsize=None)
+def find_tesseract() -> Optional[str]:
+    """Locate the tesseract binary once per process."""
+    configured = os.environ.get('TESSERACT_CMD')
+    if configured:
+        return configured
+    if os.name == 'nt' and os.path.exists(WINDOWS_TESSERACT_CMD):
+        return WINDOWS_TESSERACT_CMD
+    return shutil.which('tesseract')
+
+
+@lru_cache(maxsize=None)
+def tesseract_version() -> Optional[str]:
+    """Return the tesseract version string.
+
+    The answer is cached on disk keyed by the binary's path, size and mtime,
+    so repeated CLI invocations skip the `tesseract --version` subprocess.
+    """
+    cmd = find_tesseract()
+    if not cmd:
+        return None
+    try:
+        stat = os.stat(cmd)
+    except OSError:
+        return None
+    key = f"{cmd}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    try:
+        cached = json.loads(ENV_CACHE_FILE.read_text())
+        if cached.get('key') == key:
+            return cached.get('version')
+    except (OSError, ValueError):
+        pass
+
+    try:
+        output = subprocess.run([cmd, '--version'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    first_line = (output.stdout or output.stderr).strip().split('\n')[0]
+    match = re.search(r'(\d+\.\d+(?:\.\d+)?)', first_line)
+    version = match.group(1) if match else None
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        ENV_CACHE_FILE.write_text(json.dumps({'key': key, 'version': version}))
+    except OSError:
+        pass
+    return version
+
+
+def lines_to_text(lines: List[List]) -> str:
+    return '\n'.join(text for _, _, text in lines)
+
+
 class BetSlipScanner:
-    def __init__(self):
-        if os.name == 'nt':
-            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+    def __init__(self, verbose: bool = True, archive: bool = False, ocr_config: str = OCR_CONFIG,
+                 sportsbook: Optional[str] = DEFAULT_SPORTSBOOK, scan_deadline: float = SCAN_DEADLINE_S,
+                 hedge_after: float = HEDGE_AFTER_S, ocr_pool=None):
+        self.verbose = verbose
+        self.archive = archive
+        self.ocr_config = ocr_config
+        self.sportsbook = sportsbook
+        # Seconds per scan_slips call (0: no limit), and how long the primary
+        # OCR may run before the reduced-resolution fallback is started
+        self.scan_deadline = scan_deadline
+        self.hedge_after = hedge_after
+        # Optional ocrpool.OcrPool: OCR runs in its worker processes
+        self.ocr_pool = ocr_pool
+
+    def log(self, *args, **kwargs):
+        if self.verbose:
+            print(*args, **kwargs)
 
     def clean_text(self, text: str) -> str:
         # Remove special characters but keep essential ones
@@ -32,35 +129,35 @@ class BetSlipScanner:
         words = text.split()
         dollar_amounts = []
         
-        print("\nDEBUG - Processing text word by word:")
+        self.log("\nDEBUG - Processing text word by word:")
         for i, word in enumerate(words):
-            print(f"Word {i}: '{word}'")
+            self.log(f"Word {i}: '{word}'")
             match = re.match(r'\$(\d+(?:,\d{3})*(?:\.\d{2})?)', word)
             if match:
                 # Remove commas and convert to float
                 amount = float(match.group(1).replace(',', ''))
                 dollar_amounts.append(amount)
-                print(f"Found dollar amount: ${amount}")
+                self.log(f"Found dollar amount: ${amount}")
 
-        print("\nDEBUG - All dollar amounts found:", dollar_amounts)
+        self.log("\nDEBUG - All dollar amounts found:", dollar_amounts)
         
-        print("\nDEBUG - Looking for TOTAL WAGER/PAYOUT:")
+        self.log("\nDEBUG - Looking for TOTAL WAGER/PAYOUT:")
         if len(dollar_amounts) >= 2:
             wager = dollar_amounts[0]  # First dollar amount is wager
             # Check if this is a finished bet with winnings
             if "WON ON FANDUEL" in text.upper():
                 bet_finished = True
                 won_amount = dollar_amounts[1]  # Second amount is winnings
-                print(f"Found WON ON FANDUEL amount: ${won_amount}")
+                self.log(f"Found WON ON FANDUEL amount: ${won_amount}")
             else:
                 potential_payout = dollar_amounts[1]  # Second amount is potential payout
-                print(f"Found TOTAL PAYOUT amount: ${potential_payout}")
+                self.log(f"Found TOTAL PAYOUT amount: ${potential_payout}")
 
-        print(f"\nDEBUG - Final values:")
-        print(f"Wager: ${wager}")
-        print(f"Potential Payout: ${potential_payout}")
-        print(f"Won Amount: ${won_amount}")
-        print(f"Bet Finished: {bet_finished}")
+        self.log(f"\nDEBUG - Final values:")
+        self.log(f"Wager: ${wager}")
+        self.log(f"Potential Payout: ${potential_payout}")
+        self.log(f"Won Amount: ${won_amount}")
+        self.log(f"Bet Finished: {bet_finished}")
         
         return {
             'wager': wager,
@@ -126,6 +223,14 @@ class BetSlipScanner:
         
         return legs
 
+    def extract_odds(self, text: str) -> Optional[int]:
+        """American odds of the slip: the first +NNN/-NNN token ending a line."""
+        for line in text.split('\n'):
+            match = re.search(r'(?:^|\s)([+-]\d{3,6})\s*$', line.strip())
+            if match and abs(int(match.group(1))) >= 100:
+                return int(match.group(1))
+        return None
+
     def extract_moneyline_details(self, text: str) -> Dict:
         lines = text.split('\n')
         matchup = None
@@ -158,8 +263,9 @@ class BetSlipScanner:
             return None
             
         # Standard formats
+        threshold_match = re.search(r'(\d+)\+?', next_line)
         prop_types = {
-            'MADE THREES': lambda x: f"{x.strip()} {re.search(r'(\d+)\+?', next_line).group(1)}+ MADE THREES" if re.search(r'(\d+)\+?', next_line) else None,
+            'MADE THREES': lambda x: f"{x.strip()} {threshold_match.group(1)}+ MADE THREES" if threshold_match else None,
             'ALT ': lambda x: f"{x.strip()} - {next_line.strip()}",
             'TO SCORE': lambda x: f"{x.strip()} {next_line.strip()}",
             'TO RECORD': lambda x: f"{x.strip()} {next_line.strip()}"
@@ -321,6 +427,7 @@ class BetSlipScanner:
                         'total_payout': amounts['potential_payout'],
                         'won_amount': amounts['won_amount'],
                         'bet_finished': amounts['bet_finished'],
+                        'odds': self.extract_odds(text),
                         'games': [{'game': 'Straight Bet', 'positions': [pos]}],
                         'formatted_output': [f"Position: {pos['position']}", f"Details: {pos['details']}"]
                     }
@@ -394,62 +501,516 @@ class BetSlipScanner:
             'total_payout': amounts['potential_payout'],
             'won_amount': amounts['won_amount'],
             'bet_finished': amounts['bet_finished'],
+            'odds': self.extract_odds(text),
             'games': games_list,
             'formatted_output': formatted_output
         }
 
-    def scan_image(self, image_path: Path) -> Dict:
+    def load_image(self, image_path: Path):
+        from PIL import Image
+        image = Image.open(image_path)
+        image.load()
+        return image
+
+    def _tesseract(self):
+        import pytesseract
+        cmd = find_tesseract()
+        if cmd:
+            pytesseract.pytesseract.tesseract_cmd = cmd
+        return pytesseract
+
+    def tesseract_config(self, config: Optional[str] = None) -> str:
+        """Full tesseract options: `config` (default: the scanner's) plus the
+        sportsbook's vocabulary files."""
+        config = self.ocr_config if config is None else config
+        if not self.sportsbook:
+            return config
+        from vocabulary import vocabulary_config
+        return f"{config} {vocabulary_config(self.sportsbook)}".strip()
+
+    def _with_deadline(self, call, deadline: Optional[Deadline]):
+        """Run a pytesseract call with the scan's remaining time as its timeout."""
+        if deadline is None:
+            return call(0)
         try:
-            print(f"\nProcessing: {image_path.name}")
-            print("="*50)
-            
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image)
+            return call(deadline.tesseract_timeout())
+        except RuntimeError as e:
+            if is_tesseract_timeout(e):
+                deadline.timeout('ocr')
+            raise
+
+    def run_tesseract(self, image, config: Optional[str] = None, deadline: Optional[Deadline] = None) -> str:
+        config = self.tesseract_config(config)
+        pytesseract = self._tesseract()
+        return self._with_deadline(
+            lambda timeout: pytesseract.image_to_string(image, config=config, timeout=timeout), deadline)
+
+    def run_tesseract_lines(self, image, config: Optional[str] = None, offset: int = 0,
+                            deadline: Optional[Deadline] = None) -> List[List]:
+        """OCR into [top, bottom, text] lines, in tesseract's reading order."""
+        config = self.tesseract_config(config)
+        pytesseract = self._tesseract()
+        data = self._with_deadline(
+            lambda timeout: pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT,
+                                                      timeout=timeout), deadline)
+        lines = {}
+        for i, word in enumerate(data['text']):
+            if not word.strip():
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            top = data['top'][i] + offset
+            bottom = top + data['height'][i]
+            line = lines.setdefault(key, [top, bottom, []])
+            line[0] = min(line[0], top)
+            line[1] = max(line[1], bottom)
+            line[2].append(word)
+        return [[top, bottom, ' '.join(words)] for top, bottom, words in lines.values()]
+
+    def ocr_image(self, image, config: Optional[str] = None, deadline: Optional[Deadline] = None) -> str:
+        from tiling import needs_tiling, ocr_tiled
+        if needs_tiling(image):
+            self.log(f"Tall image {image.size[0]}x{image.size[1]}, using tiled OCR")
+            return ocr_tiled(image, lambda tile: self.run_tesseract(tile, config, deadline))
+        return self.run_tesseract(image, config, deadline)
+
+    def archive_scan(self, image_path: Path, slips: List[Dict], **extra) -> Path:
+        from archive import save_record
+        return save_record(image_path, slips,
+                           engine='tesseract',
+                           engine_version=tesseract_version(),
+                           ocr_config=self.tesseract_config(),
+                           parser_version=PARSER_VERSION,
+                           **extra)
+
+    def ocr_cards(self, image, segment: bool = True, deadline: Optional[Deadline] = None) -> List[Dict]:
+        """OCR each bet card in the image.
+
+        Segments are read once: when they form a single card (or none ends
+        in a wager footer), their text is returned as one card rather than
+        OCR'ing the image again.
+
+        Returns one {'box', 'text'} dict per card; box is None when the whole
+        image is a single slip, in which case the OCR'd 'lines' (with their
+        positions) are kept too so later uploads can be re-scanned
+        incrementally.
+        """
+        if segment:
+            from segment import find_cards, join_cards
+            boxes = find_cards(image)
+            if len(boxes) > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                crops = [image.crop(box) for box in boxes]
+                with ThreadPoolExecutor(max_workers=min(len(crops), os.cpu_count() or 1)) as pool:
+                    texts = list(pool.map(lambda crop: self.ocr_image(crop, deadline=deadline), crops))
+                cards = join_cards(boxes, texts)
+                if len(cards) > 1:
+                    self.log(f"Found {len(cards)} bet cards")
+                elif not cards:
+                    # No wager footer anywhere: keep everything read as one card
+                    cards = [((min(box[0] for box in boxes), boxes[0][1],
+                               max(box[2] for box in boxes), boxes[-1][3]), '\n'.join(texts))]
+                return [{'box': list(box), 'text': text} for box, text in cards]
+
+        from tiling import needs_tiling
+        if needs_tiling(image):
+            return [{'box': None, 'text': self.ocr_image(image, deadline=deadline)}]
+        lines = self.run_tesseract_lines(image, deadline=deadline)
+        return [{'box': None, 'text': lines_to_text(lines), 'lines': lines}]
+
+    def fallback_cards(self, image, deadline: Optional[Deadline] = None) -> List[Dict]:
+        """Cheap OCR of the whole image: reduced resolution, no layout analysis."""
+        from PIL import Image
+        width, height = image.size
+        small = image.convert('L').resize((int(width * FALLBACK_SCALE), int(height * FALLBACK_SCALE)),
+                                          Image.BILINEAR)
+        config = f"{self.ocr_config} {FALLBACK_OCR_CONFIG}".strip()
+        return [{'box': None, 'text': self.run_tesseract(small, config, deadline)}]
+
+    def hedged_ocr_cards(self, image, segment: bool = True, deadline: Optional[Deadline] = None) -> List[Dict]:
+        """ocr_cards, with fallback_cards started in parallel if it is slow.
+
+        Whichever finishes first wins. The loser keeps running only until
+        its tesseract call hits the scan deadline.
+        """
+        if not self.hedge_after:
+            return self.ocr_cards(image, segment, deadline)
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = pool.submit(self.ocr_cards, image, segment, deadline)
+            if not wait([primary], timeout=self.hedge_after).not_done:
+                return primary.result()
+
+            self.log(f"OCR still running after {self.hedge_after}s, starting reduced-resolution fallback")
+            if deadline is not None:
+                deadline.hedged = True
+            fallback = pool.submit(self.fallback_cards, image, deadline)
+            pending = {primary, fallback}
+            errors = {}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        cards = future.result()
+                    except Exception as e:
+                        errors[future] = e
+                        continue
+                    if deadline is not None:
+                        deadline.fallback = future is fallback
+                    return cards
+            raise errors.get(primary) or errors[fallback]
+        finally:
+            pool.shutdown(wait=False)
+
+    def rescan_cards(self, image, image_path: Path, signature,
+                     deadline: Optional[Deadline] = None) -> Optional[Tuple[List[Dict], Dict]]:
+        """Re-OCR only what changed since a matching earlier scan of this slip.
+
+        Returns (cards, archive extras), or None when there is no usable match.
+        """
+        from archive import load_record, record_slips
+        from rescan import recent_scans, plan_regions, merge_lines
+
+        match = recent_scans.match(image_path.parent, image.size, signature)
+        if not match:
+            return None
+        record_path, rows, fraction = match
+        try:
+            record = load_record(record_path)
+        except (OSError, ValueError):
+            return None
+        previous = record_slips(record)
+        if len(previous) != 1 or not previous[0].get('lines'):
+            return None
+
+        lines = previous[0]['lines']
+        regions = plan_regions(rows, lines, image.size[1])
+        width = image.size[0]
+
+        def ocr_region(region):
+            top, bottom = region
+            crop = image.crop((0, top, width, bottom))
+            return self.run_tesseract_lines(crop, f"{self.ocr_config} --psm 6".strip(), offset=top,
+                                            deadline=deadline)
+
+        if regions:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(len(regions), os.cpu_count() or 1)) as pool:
+                region_lines = list(pool.map(ocr_region, regions))
+            lines = merge_lines(lines, regions, region_lines)
+
+        rescanned = sum(bottom - top for top, bottom in regions)
+        self.log(f"Matched earlier scan of {record['image']} ({fraction:.0%} of blocks changed), "
+                 f"re-OCR'd {len(regions)} regions ({rescanned}px of {image.size[1]}px)")
+        extras = {'rescan_of': record['image'], 'rescanned_regions': [list(r) for r in regions]}
+        return [{'box': None, 'text': lines_to_text(lines), 'lines': lines}], extras
+
+    def duplicate_cards(self, image, image_hash: int, signature=None,
+                        deadline: Optional[Deadline] = None) -> Optional[Tuple[List[Dict], Dict]]:
+        """Reuse the OCR of a near-identical earlier screenshot (perceptual hash match).
+
+        A hash match alone is not enough: different slips can be a bit or two
+        apart. A same-size match must have no changed blocks over its text,
+        and any other match must show the same wager and leg count in a
+        cheap low-resolution OCR. Returns (cards, archive extras), or None.
+        """
+        from archive import load_record, record_slips
+        from phash import PhashIndex
+
+        index = PhashIndex()
+        try:
+            matches = index.search(image_hash)
+        finally:
+            index.close()
+        quick = None
+        for distance, record_path, _ in matches:
+            try:
+                record = load_record(Path(record_path))
+            except (OSError, ValueError):
+                continue
+            slips = record_slips(record)
+            same_size = record.get('size') == list(image.size)
+            if same_size and signature is not None:
+                if not self.unchanged_text(record, slips, signature):
+                    continue
+            else:
+                if len(slips) != 1 or not slips[0].get('result'):
+                    continue
+                if quick is None:
+                    quick = self.extract_legs(self.fallback_cards(image, deadline)[0]['text'])
+                previous = slips[0]['result']
+                if (quick['total_wager'], quick['expected_legs']) != (previous['total_wager'],
+                                                                      previous['expected_legs']):
+                    continue
+            cards = []
+            for slip in slips:
+                card = {'box': slip.get('box'), 'text': slip['text']}
+                # Line positions only carry over when the pixels line up
+                if same_size and slip.get('lines'):
+                    card['lines'] = slip['lines']
+                cards.append(card)
+            self.log(f"Near-duplicate of {record['image']} (hash distance {distance}), reusing its OCR")
+            return cards, {'duplicate_of': record['image'], 'phash_distance': distance}
+        return None
+
+    def unchanged_text(self, record: Dict, slips: List[Dict], signature) -> bool:
+        """Whether no block changed over the text of an archived same-size scan."""
+        from rescan import BLOCK, changed_rows, decode_signature
+
+        previous = decode_signature(record.get('signature'))
+        if previous is None or previous.shape != signature.shape:
+            return False
+        rows, fraction = changed_rows(previous, signature)
+        spans = [(line[0], line[1]) for slip in slips for line in slip.get('lines') or []]
+        spans += [(slip['box'][1], slip['box'][3]) for slip in slips if slip.get('box')]
+        if not spans:
+            return fraction == 0
+        for row in map(int, rows.nonzero()[0]):
+            top, bottom = row * BLOCK, (row + 1) * BLOCK
+            if any(span_top < bottom and span_bottom > top for span_top, span_bottom in spans):
+                return False
+        return True
+
+    def layout_cards(self, image, deadline: Optional[Deadline] = None) -> Optional[Tuple[List[Dict], Dict]]:
+        """OCR only the regions of a learned layout for this screen size.
+
+        Returns (cards, archive extras), or None when no learned layout
+        fits the image.
+        """
+        if not self.sportsbook:
+            return None
+        from layout import LayoutIndex, header_region, is_clean, layout_key, variant_key
+        from segment import find_cards
+
+        key = layout_key(image.size, self.sportsbook)
+        index = LayoutIndex()
+        try:
+            variants = index.variants(key)
+            header = header_region(variants)
+            # Layouts are learned from single-slip screenshots only
+            if header is None or len(find_cards(image)) > 1:
+                return None
+            width = image.size[0]
+
+            def ocr_region(region):
+                crop = image.crop((0, region['top'], width, region['bottom']))
+                return self.run_tesseract_lines(crop, f"{self.ocr_config} --psm {region['psm']}".strip(),
+                                                offset=region['top'], deadline=deadline)
+
+            header_lines = ocr_region(header)
+            variant = variant_key(self.extract_legs(lines_to_text(header_lines)))
+            regions = variants.get(variant)
+            if regions is None:
+                self.log(f"No learned {variant} layout for {key}, scanning the full page")
+                return None
+            own = next((region for region in regions if region['name'] == 'header'), None)
+            if own is None:
+                self.log(f"Learned {variant} layout for {key} has no header region, scanning the full page")
+                return None
+            lines = [line for line in header_lines if own['top'] <= (line[0] + line[1]) / 2 < own['bottom']]
+            rest = [region for region in regions if region['name'] != 'header']
+            if rest:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=len(rest)) as pool:
+                    for region_lines in pool.map(ocr_region, rest):
+                        lines.extend(region_lines)
+
+            result = self.extract_legs(lines_to_text(lines))
+            hit = is_clean(result) and variant_key(result) == variant
+            index.record(key, variant, hit)
+            if not hit:
+                self.log(f"Learned {variant} layout for {key} did not parse cleanly, scanning the full page")
+                return None
+        finally:
+            index.close()
+
+        scanned = sum(region['bottom'] - region['top'] for region in regions)
+        self.log(f"Used learned {variant} layout for {key}: OCR'd {scanned}px of {image.size[1]}px")
+        return ([{'box': None, 'text': lines_to_text(lines), 'lines': lines}],
+                {'layout': key, 'layout_variant': variant})
+
+    def learn_layout(self, image, cards: List[Dict], image_path: Path):
+        """Learn region boxes from a clean full-page scan of a single slip."""
+        if not self.sportsbook or len(cards) != 1 or cards[0]['box'] is not None or not cards[0].get('lines'):
+            return
+        from layout import LayoutIndex, is_clean, layout_key, learn_regions, variant_key
+        result = cards[0]['result']
+        if not is_clean(result):
+            return
+        regions = learn_regions(cards[0]['lines'], image.size[1])
+        if not regions:
+            return
+        index = LayoutIndex()
+        try:
+            index.learn(layout_key(image.size, self.sportsbook), variant_key(result), regions, image_path.name)
+        finally:
+            index.close()
+
+    def scan_slips(self, image_path: Path, segment: bool = True, incremental: bool = True,
+                   original_size: Optional[Tuple[int, int]] = None, priority: str = 'interactive') -> List[Dict]:
+        """Scan an image and return one result per bet slip found in it.
+
+        With `incremental`, an archived earlier scan of the same slip is
+        reused and only the changed regions are re-OCR'd. `original_size` is
+        the (width, height) of the screenshot before the upload page shrank
+        it, archived with the scan. `priority` is 'interactive' or 'bulk'
+        (see scheduler.py); bulk scans wait while bulk work is paused.
+        """
+        if priority == 'bulk':
+            from scheduler import wait_while_paused
+            wait_while_paused()
+        deadline = Deadline(self.scan_deadline)
+        try:
+            self.log(f"\nProcessing: {image_path.name}")
+            self.log("="*50)
             
-            print("Raw Extracted Text:")
-            print(text)
+            with deadline.stage('decode'):
+                image = self.load_image(image_path)
             
-            result = self.extract_legs(text)
+            signature = None
+            image_hash = None
+            cards = None
+            extras = {}
+            with deadline.stage('preprocess'):
+                if self.archive:
+                    from phash import dhash
+                    from rescan import block_signature
+                    signature = block_signature(image)
+                    image_hash = dhash(image)
+            with deadline.stage('ocr'):
+                if self.archive and incremental:
+                    # Same-size re-uploads are diffed block by block first, so
+                    # changed scores are re-read; other near duplicates are reused,
+                    # then a layout learned from earlier scans at this size.
+                    cards, extras = (self.rescan_cards(image, image_path, signature, deadline)
+                                     or self.duplicate_cards(image, image_hash, signature, deadline)
+                                     or self.layout_cards(image, deadline)
+                                     or (None, {}))
+                if cards is None and self.ocr_pool is not None:
+                    cards = self.ocr_pool.ocr_cards(self, image, segment=segment, deadline=deadline,
+                                                    image_path=image_path)
+                elif cards is None:
+                    cards = self.hedged_ocr_cards(image, segment=segment, deadline=deadline)
             
-            print(f"\nBet Details:")
-            print(f"Type: {result['bet_type'].title()}")
-            print(f"Expected legs: {result['expected_legs']}")
-            print(f"Found legs: {result['found_legs']}")
-            print(f"Total Wager: ${result['total_wager']:.2f}")
-            print(f"Total Payout: ${result['total_payout']:.2f}")
+            results = []
+            with deadline.stage('parse'):
+                for idx, card in enumerate(cards, 1):
+                    text = card['text']
+                    self.log("Raw Extracted Text:")
+                    self.log(text)
+                    
+                    result = self.extract_legs(text)
+                    if len(cards) > 1:
+                        result['slip_index'] = idx
+                    results.append(result)
+                    card['result'] = result
+                    
+                    self.log(f"\nBet Details:")
+                    self.log(f"Type: {result['bet_type'].title()}")
+                    self.log(f"Expected legs: {result['expected_legs']}")
+                    self.log(f"Found legs: {result['found_legs']}")
+                    self.log(f"Total Wager: ${result['total_wager']:.2f}")
+                    self.log(f"Total Payout: ${result['total_payout']:.2f}")
+                    
+                    self.log("\nFormatted Legs by Game:")
+                    for line in result['formatted_output']:
+                        self.log(line)
             
-            print("\nFormatted Legs by Game:")
-            for line in result['formatted_output']:
-                print(line)
+            if self.archive:
+                # The result is already in hand, so archiving is not cut short by the deadline
+                start = time.monotonic()
+                from bets import BetIndex, fingerprint
+                from rescan import encode_signature, recent_scans
+                from phash import PhashIndex
+                from search import SearchIndex
+                for card in cards:
+                    card['fingerprint'] = fingerprint(card['result'])
+                if not extras:
+                    # A fresh full-page scan: learn where this layout's regions are
+                    self.learn_layout(image, cards, image_path)
+                if original_size:
+                    extras['original_size'] = list(original_size)
+                record_path = self.archive_scan(image_path, cards,
+                                                size=list(image.size),
+                                                signature=encode_signature(signature),
+                                                phash=f"{image_hash:016x}",
+                                                latency=deadline.report(),
+                                                **extras)
+                recent_scans.add(record_path, image.size, signature)
+                index = PhashIndex()
+                index.add(image_hash, record_path, image_path.name)
+                index.close()
+                # Link each slip to its canonical bet, merging open and settled scans
+                bet_index = BetIndex()
+                for idx, card in enumerate(cards, 1):
+                    fp, is_new = bet_index.ingest(card['result'], record_path, idx)
+                    if fp and not is_new:
+                        self.log(f"Slip {idx} updates existing bet {card['fingerprint'][:12]}")
+                bet_index.close()
+                search_index = SearchIndex()
+                for idx, card in enumerate(cards, 1):
+                    search_index.add(card['result'], card['text'], record_path, idx,
+                                     fingerprint=card['fingerprint'])
+                search_index.close()
+                deadline.timings['archive'] = round(time.monotonic() - start, 3)
             
-            return result
+            self.log(f"Latency: {deadline.report()}")
+            return results
             
+        except DeadlineExceeded as e:
+            print(f"Error processing {image_path.name}: {e} ({self.scan_deadline}s)", file=sys.stderr)
+            return []
         except Exception as e:
-            print(f"Error processing {image_path.name}: {str(e)}")
-            return None
+            print(f"Error processing {image_path.name}: {str(e)}", file=sys.stderr)
+            return []
+        finally:
+            scan_metrics.record(deadline)
+
+    def scan_image(self, image_path: Path) -> Dict:
+        """Scan an image as a single slip (no card segmentation)."""
+        results = self.scan_slips(image_path, segment=False)
+        return results[0] if results else None
+
+    def iter_images(self, directory: Path):
+        """Yield slip image paths in a stable order."""
+        for ext in ('*.jpg', '*.png'):
+            yield from sorted(directory.glob(ext))
+
+    def iter_directory(self, directory: Path):
+        """Yield (path, results) for every image in a directory, one result per slip.
+
+        With an OCR pool, images are scanned concurrently (one per pool
+        worker, plus as many decoded ahead) and yielded in order. Either
+        way they are scanned as bulk work, held while bulk work is paused.
+        """
+        if self.ocr_pool is None:
+            for image_path in self.iter_images(directory):
+                yield image_path, self.scan_slips(image_path, priority='bulk')
+            return
+
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        window = deque()
+        with ThreadPoolExecutor(max_workers=2 * self.ocr_pool.workers) as threads:
+            for image_path in self.iter_images(directory):
+                window.append((image_path, threads.submit(self.scan_slips, image_path, priority='bulk')))
+                if len(window) >= 2 * self.ocr_pool.workers:
+                    image_path, future = window.popleft()
+                    yield image_path, future.result()
+            while window:
+                image_path, future = window.popleft()
+                yield image_path, future.result()
 
     def process_directory(self, directory: Path) -> List[Dict]:
         results = []
-        for ext in ('*.jpg', '*.png'):
-            for image_path in directory.glob(ext):
-                result = self.scan_image(image_path)
-                if result:
-                    results.append({'file': image_path.name, **result})
+        for image_path, slips in self.iter_directory(directory):
+            for result in slips:
+                results.append({'file': image_path.name, **result})
         return results
 
 def main():
-    scanner = BetSlipScanner()
-    current_dir = Path(__file__).parent.parent
-    images_dir = current_dir / "images"
-    results = scanner.process_directory(images_dir)
-    
-    print("\nSummary:")
-    print("="*50)
-    for result in results:
-        print(f"\nFile: {result['file']}")
-        print(f"Type: {result['bet_type']}")
-        print(f"Expected/Found Legs: {result['expected_legs']}/{result['found_legs']}")
-        print(f"Wager/Payout: ${result['total_wager']:.2f}/${result['total_payout']:.2f}")
+    from cli import main as cli_main
+    return cli_main()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
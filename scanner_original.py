@@ -197,8 +197,9 @@ class BetSlipScanner:
             return None
             
         # Standard formats
+        threshold_match = re.search(r'(\d+)\+?', next_line)
         prop_types = {
-            'MADE THREES': lambda x: f"{x.strip()} {re.search(r'(\d+)\+?', next_line).group(1)}+ MADE THREES" if re.search(r'(\d+)\+?', next_line) else None,
+            'MADE THREES': lambda x: f"{x.strip()} {threshold_match.group(1)}+ MADE THREES" if threshold_match else None,
             'ALT ': lambda x: f"{x.strip()} - {next_line.strip()}",
             'TO SCORE': lambda x: f"{x.strip()} {next_line.strip()}",
             'TO RECORD': lambda x: f"{x.strip()} {next_line.strip()}"
@@ -275,8 +276,9 @@ class BetSlipScanner:
                         break
                 
                 if clean_name and next_line and (alt_line or 'TO SCORE' in next_line.upper() or 'TO RECORD' in next_line.upper()):
+                    prop_text = re.sub(r'^[w=\\sw"$©]+', '', next_line).strip()
                     pos = {
-                        'position': f"{clean_name} {re.sub(r'^[w=\\sw"$©]+', '', next_line).strip()}",
+                        'position': f"{clean_name} {prop_text}",
                         'details': alt_line or next_line
                     }
                     current_positions.append(pos)
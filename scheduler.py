@@ -0,0 +1,127 @@
+"""Priority classes for scan jobs on the shared job queue.
+
+Uploads are queued as `interactive` jobs and backfills (`scan-dir
+--queue`) as `bulk` jobs, and the same `scanner.py worker` processes
+lease both (see jobqueue.py). Each worker's `Scheduler` picks the class
+it leases from next:
+
+- When both classes have jobs waiting, a worker takes them in
+  proportion to their weights (stride scheduling), so across workers the
+  classes get about that share. A class that was idle starts level with
+  the others, so it does not win every lease until it "catches up".
+- Workers started with `--interactive-only` never take bulk jobs. They
+  are the capacity reserved for uploads, so an upload never waits behind
+  a fleet busy with backfill scans.
+- Bulk work can be paused and resumed. Scans already running finish, and
+  queued bulk jobs stay queued. Pausing creates PAUSE_FILE, so one
+  command reaches every worker and backfill on the data directory
+  (`scanner.py bulk pause`, or POST /bulk/pause on the web app).
+
+Scans that run outside the queue (scan-dir without --queue, validate
+--rescan) have no other work to share with, and only honour the pause.
+The queue records how long each job waited for a worker, per class.
+"""
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Iterable, List
+
+from scanner import DATA_DIR
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight)
+    if set(weights) != set(PRIORITIES) or min(weights.values()) <= 0:
+        raise ValueError(f"expected positive weights for {INTERACTIVE} and {BULK}: {spec!r}")
+    return weights
+
+
+WEIGHTS = parse_weights(os.environ.get('CAPPING_SCHED_WEIGHTS', 'interactive=4,bulk=1'))
+PAUSE_FILE = DATA_DIR / 'bulk.paused'
+POLL_S = 1.0    # how often a paused bulk scan looks at PAUSE_FILE
+WAIT_SAMPLES = 1000
+
+
+def pause_bulk():
+    PAUSE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    PAUSE_FILE.touch()
+
+
+def resume_bulk():
+    try:
+        PAUSE_FILE.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def bulk_paused() -> bool:
+    return PAUSE_FILE.exists()
+
+
+def wait_while_paused():
+    """Block a bulk scan run outside the queue until bulk work is resumed."""
+    while bulk_paused():
+        time.sleep(POLL_S)
+
+
+class WaitStats:
+    def __init__(self, samples: Iterable[float] = ()):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=WAIT_SAMPLES)
+        for seconds in samples:
+            self.add(seconds)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def snapshot(self) -> Dict:
+        recent = sorted(self.recent)
+
+        def percentile(p: float) -> float:
+            # Nearest rank
+            return round(recent[max(0, math.ceil(p * len(recent)) - 1)], 3) if recent else 0.0
+
+        return {'count': self.count,
+                'mean_s': round(self.total / self.count, 3) if self.count else 0.0,
+                'p50_s': percentile(0.5),
+                'p95_s': percentile(0.95),
+                'max_s': round(self.max, 3)}
+
+
+class Scheduler:
+    """Decides which class a queue worker leases its next job from."""
+
+    def __init__(self, weights: Dict[str, float] = WEIGHTS, bulk: bool = True):
+        self.weights = dict(weights)
+        self.classes = [name for name in PRIORITIES if bulk or name != BULK]
+        self.pass_value = {name: 0.0 for name in self.classes}
+        self.clock = 0.0
+
+    def order(self) -> List[str]:
+        """Classes to lease from, the one owed the next job first.
+
+        Bulk is left out while bulk work is paused.
+        """
+        classes = [name for name in self.classes if name != BULK or not bulk_paused()]
+        return sorted(classes, key=lambda name: (self.pass_value[name], -self.weights[name]))
+
+    def charge(self, name: str, order: List[str]):
+        """Account for a job leased from `name` after trying the classes in `order`."""
+        self.clock = self.pass_value[name]
+        self.pass_value[name] += 1 / self.weights[name]
+        # Classes tried first had nothing waiting: no credit for the time they were idle
+        for idle in order[:order.index(name)]:
+            self.pass_value[idle] = max(self.pass_value[idle], self.clock)
@@ -0,0 +1,168 @@
+"""Full-text search over archived slips.
+
+Each slip is indexed once in an SQLite FTS5 table with three columns:
+the raw OCR text, normalized player names and the prop details of its
+legs. Rows are keyed by archive record and slip index (like `bet_scans`
+in bets.py), so indexing a slip again after a reparse or an index
+rebuild replaces its row.
+
+Queries use a small, forgiving syntax that never reaches FTS5 unescaped:
+plain words must all match, `"double quotes"` match a phrase, a trailing
+`*` matches a prefix, and `player:`, `prop:` or `text:` limit a term to
+one column (any other `word:` is just more words to match).
+`lebron 3+ "made threes"` or `player:jok*` both work.
+
+Results come most recently indexed first, which FTS5 streams straight
+off its doclists, so a page costs about the same however many slips
+match. Ranking by relevance has to score every match first and is only
+fast for selective queries. Totals are counted up to COUNT_LIMIT.
+"""
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from archive import ARCHIVE_SUFFIX
+from scanner import DATA_DIR
+
+SEARCH_DB = DATA_DIR / 'search.db'
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+COUNT_LIMIT = 10000
+SORTS = {'recent': 'slip_text.rowid DESC', 'relevance': 'rank'}
+COLUMNS = {'text': 'text', 'player': 'players', 'prop': 'props'}
+
+QUERY_TERM = re.compile(r'(?:(\w+):)?(?:"([^"]*)"?|(\S+))')
+
+
+def player_name(position: str) -> str:
+    """Lowercase player (or team) name of a leg, without the market prefix."""
+    name = re.sub(r'^\s*MONEYLINE:\s*', '', position, flags=re.IGNORECASE)
+    return ' '.join(re.findall(r'\w+', name.lower()))
+
+
+def prop_details(details: str) -> str:
+    return ' '.join(re.sub(r'[^\w+. ]', ' ', details.lower()).split())
+
+
+def slip_fields(result: Dict, text: str) -> Dict[str, str]:
+    legs = [leg for game in result.get('games', []) for leg in game['positions']]
+    return {
+        'text': text,
+        'players': '\n'.join(dict.fromkeys(filter(None, (player_name(leg.get('position', '')) for leg in legs)))),
+        'props': '\n'.join(filter(None, (prop_details(leg.get('details', '')) for leg in legs))),
+    }
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 MATCH expression for a search box query, or None if it has no terms."""
+    terms = []
+    for column, phrase, word in QUERY_TERM.findall(query):
+        prefix = False
+        if word:
+            prefix = word.endswith('*')
+            phrase = word.rstrip('*')
+        if column and column.lower() not in COLUMNS:
+            # Not a filter ('10:30', 'foo:bar'): the words are part of the term
+            phrase = f"{column} {phrase}"
+            column = ''
+        # FTS5's tokenizer drops punctuation the same way, so quoting keeps
+        # '3+' or "o'neal" from being read as query syntax
+        tokens = re.findall(r'\w+', phrase.lower())
+        if not tokens:
+            continue
+        term = '"' + ' '.join(tokens) + '"' + ('*' if prefix else '')
+        if column:
+            term = f"{COLUMNS[column.lower()]} : {term}"
+        terms.append(term)
+    return ' AND '.join(terms) or None
+
+
+class SearchIndex:
+    def __init__(self, path: Path = SEARCH_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS slips (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                slip_index INTEGER NOT NULL,
+                image TEXT,
+                fingerprint TEXT,
+                bet_type TEXT,
+                wager REAL,
+                payout REAL,
+                scanned_at TEXT,
+                UNIQUE (source, slip_index)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS slip_text USING fts5(
+                text, players, props,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            );
+        ''')
+        self.db.commit()
+
+    def add(self, result: Dict, text: str, source: Path, slip_index: int = 1,
+            scanned_at: Optional[str] = None, fingerprint: Optional[str] = None):
+        """Index one slip of an archived scan, replacing what it said before."""
+        source = Path(source).resolve()
+        image = source.name[:-len(ARCHIVE_SUFFIX)] if source.name.endswith(ARCHIVE_SUFFIX) else source.name
+        payout = result.get('won_amount') if result.get('bet_finished') else result.get('total_payout')
+        fields = slip_fields(result, text)
+        with self.db:
+            row = self.db.execute('SELECT id FROM slips WHERE source = ? AND slip_index = ?',
+                                  (str(source), slip_index)).fetchone()
+            if row is not None:
+                self.db.execute('DELETE FROM slip_text WHERE rowid = ?', (row['id'],))
+                self.db.execute('DELETE FROM slips WHERE id = ?', (row['id'],))
+            cursor = self.db.execute(
+                'INSERT INTO slips (source, slip_index, image, fingerprint, bet_type, wager, payout, scanned_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (str(source), slip_index, image, fingerprint, result.get('bet_type'),
+                 result.get('total_wager') or 0.0, payout or 0.0,
+                 scanned_at or datetime.now().isoformat(timespec='seconds')))
+            self.db.execute('INSERT INTO slip_text (rowid, text, players, props) VALUES (?, ?, ?, ?)',
+                            (cursor.lastrowid, fields['text'], fields['players'], fields['props']))
+
+    def search(self, query: str, page: int = 1, per_page: int = PER_PAGE, sort: str = 'recent') -> Dict:
+        """One page of slips matching `query`.
+
+        `total` stops at COUNT_LIMIT; `total_exact` says whether it did not.
+        """
+        page = max(1, page)
+        per_page = min(max(1, per_page), MAX_PER_PAGE)
+        order = SORTS.get(sort, SORTS['recent'])
+        response = {'query': query, 'page': page, 'per_page': per_page, 'total': 0, 'total_exact': True,
+                    'results': []}
+        expression = match_expression(query)
+        if expression is None:
+            return response
+        total = self.db.execute('SELECT COUNT(*) FROM (SELECT 1 FROM slip_text WHERE slip_text MATCH ? LIMIT ?)',
+                                (expression, COUNT_LIMIT + 1)).fetchone()[0]
+        rows = self.db.execute(f'''
+            SELECT slips.*, snippet(slip_text, -1, '[', ']', '...', 12) AS snippet, slip_text.players
+            FROM slip_text JOIN slips ON slips.id = slip_text.rowid
+            WHERE slip_text MATCH ?
+            ORDER BY {order}
+            LIMIT ? OFFSET ?''', (expression, per_page, (page - 1) * per_page)).fetchall()
+        for row in rows:
+            hit = dict(row)
+            # `image` names the slip; the record's path on the server stays private
+            del hit['id'], hit['source']
+            hit['players'] = hit['players'].split('\n') if hit['players'] else []
+            response['results'].append(hit)
+        response['total'] = min(total, COUNT_LIMIT)
+        response['total_exact'] = total <= COUNT_LIMIT
+        return response
+
+    def optimize(self):
+        """Merge the index's b-trees; worth doing after a bulk rebuild."""
+        self.db.execute("INSERT INTO slip_text (slip_text) VALUES ('optimize')")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
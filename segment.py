@@ -0,0 +1,105 @@
+"""Split screenshots holding several bet cards (e.g. "My Bets") into cards.
+
+Cards are separated by horizontal bands of flat colour that differ from
+the card background (page gaps between cards, or divider lines). Those
+bands are found with a NumPy row projection. Each card's side margins are
+then trimmed with a column projection.
+
+A flat band can also be a section divider inside one slip. So once the
+segments are OCR'd, `join_cards` puts them back together into whole
+cards, each ending with its wager line.
+"""
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+FLAT_TOLERANCE = 10      # max grey-level spread for a row/column to be flat
+BACKGROUND_DELTA = 8     # flat rows this far from the card background are separators
+MIN_SEPARATOR = 12       # thinnest band (px) accepted as a card boundary
+MIN_CARD_HEIGHT = 120    # shorter segments are status bars, headers etc.
+WAGER_LINE = re.compile(r'\$\s?\d')
+
+Box = Tuple[int, int, int, int]
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, end) index pairs of the True runs in a 1-D mask."""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def _separator_mask(gray: np.ndarray, axis: int, background: float) -> np.ndarray:
+    spread = gray.max(axis=axis).astype(np.int16) - gray.min(axis=axis).astype(np.int16)
+    mean = gray.mean(axis=axis)
+    return (spread <= FLAT_TOLERANCE) & (np.abs(mean - background) > BACKGROUND_DELTA)
+
+
+def _page_colour(gray: np.ndarray, background: float):
+    """Grey level of the page around the cards, if flat side margins show it."""
+    edges = np.concatenate((gray[:, 0], gray[:, -1])).astype(np.int16)
+    page = float(np.median(edges))
+    # Mostly flat: full-width dividers and bars may cross the margins
+    if np.mean(np.abs(edges - page) <= FLAT_TOLERANCE) < 0.9:
+        return None
+    return page if abs(page - background) > BACKGROUND_DELTA else None
+
+
+def find_cards(image) -> List[Box]:
+    """Return (left, top, right, bottom) boxes of the cards in `image`.
+
+    Returns a single full-image box when fewer than two cards are found.
+    """
+    gray = np.asarray(image.convert('L'))
+    height, width = gray.shape
+    full = [(0, 0, width, height)]
+
+    # The card background dominates the pixels, whether light or dark mode
+    background = float(np.median(gray))
+
+    separators = _separator_mask(gray, axis=1, background=background)
+    bands = [(start, end) for start, end in _runs(separators) if end - start >= MIN_SEPARATOR]
+    page = _page_colour(gray, background)
+    if page is not None:
+        # Gaps between cards show the page around them; other flat bands
+        # (section dividers) are part of a card
+        bands = [(start, end) for start, end in bands
+                 if abs(float(gray[start:end].mean()) - page) <= BACKGROUND_DELTA]
+    if not bands:
+        return full
+
+    bounds = [0] + [edge for band in bands for edge in band] + [height]
+    segments = [(top, bottom) for top, bottom in zip(bounds[::2], bounds[1::2])
+                if bottom - top >= MIN_CARD_HEIGHT]
+
+    cards = []
+    for top, bottom in segments:
+        block = gray[top:bottom]
+        # Skip segments with no ink at all
+        if int(block.max()) - int(block.min()) <= FLAT_TOLERANCE:
+            continue
+        margins = _separator_mask(block, axis=0, background=background)
+        inside = np.flatnonzero(~margins)
+        left, right = (int(inside[0]), int(inside[-1]) + 1) if inside.size else (0, width)
+        cards.append((left, top, right, bottom))
+
+    return cards if len(cards) > 1 else full
+
+
+def join_cards(boxes: List[Box], texts: List[str]) -> List[Tuple[Box, str]]:
+    """Rejoin OCR'd segments (top to bottom) into complete cards.
+
+    A card ends with its wager/payout footer, so a segment without a wager
+    line is the upper part of the card below it, split off at a divider.
+    Segments after the last wager line (navigation bars, promos) are dropped.
+    """
+    cards = []
+    box, parts = None, []
+    for segment, text in zip(boxes, texts):
+        box = segment if box is None else (min(box[0], segment[0]), box[1], max(box[2], segment[2]), segment[3])
+        parts.append(text)
+        if WAGER_LINE.search(text):
+            cards.append((box, '\n'.join(parts)))
+            box, parts = None, []
+    return cards
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Modules read their data directory at import time; keep test databases out of data/
+os.environ['CAPPING_DATA_DIR'] = tempfile.mkdtemp(prefix='capping-test-')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
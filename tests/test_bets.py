@@ -0,0 +1,69 @@
+import pytest
+
+from bets import BetIndex, fingerprint
+
+
+def slip(finished=False, wager=10.0, details='TO SCORE 25+ POINTS'):
+    return {
+        'bet_type': 'Same Game Parlay',
+        'total_wager': wager,
+        'total_payout': 0.0 if finished else 55.0,
+        'won_amount': 55.0 if finished else 0.0,
+        'bet_finished': finished,
+        'games': [{'game': 'LAL @ DEN', 'positions': [
+            {'position': 'LeBron James', 'details': details},
+            {'position': 'Nikola Jokic', 'details': 'TO RECORD 10+ ASSISTS'},
+        ]}],
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = BetIndex(tmp_path / 'bets.db')
+    yield index
+    index.close()
+
+
+def bet_rows(index):
+    return [dict(row) for row in index.db.execute('SELECT * FROM bets')]
+
+
+def test_fingerprint_ignores_status_formatting_and_leg_order():
+    settled = slip(finished=True)
+    settled['games'][0]['positions'].reverse()
+    settled['games'][0]['positions'][0]['position'] = 'nikola  jokic.'
+    assert fingerprint(slip()) == fingerprint(settled)
+    assert fingerprint(slip()) != fingerprint(slip(wager=20.0))
+    assert fingerprint(slip()) != fingerprint(slip(details='TO SCORE 30+ POINTS'))
+
+
+def test_open_and_settled_scans_merge_into_one_bet(index, tmp_path):
+    fp, is_new = index.ingest(slip(), tmp_path / 'open.png.ocr.json', scanned_at='2026-01-01T20:00:00')
+    assert is_new
+    assert index.ingest(slip(finished=True), tmp_path / 'won.png.ocr.json',
+                        scanned_at='2026-01-02T09:00:00') == (fp, False)
+    [bet] = bet_rows(index)
+    assert bet['fingerprint'] == fp
+    assert (bet['potential_payout'], bet['won_amount'], bet['status'], bet['scans']) == (55.0, 55.0, 'settled', 2)
+    assert (bet['first_seen'], bet['last_seen']) == ('2026-01-01T20:00:00', '2026-01-02T09:00:00')
+
+
+def test_ingesting_the_same_scan_again_is_idempotent(index, tmp_path):
+    source = tmp_path / 'open.png.ocr.json'
+    index.ingest(slip(), source)
+    index.ingest(slip(), source)
+    assert bet_rows(index)[0]['scans'] == 1
+
+
+def test_reparse_moves_a_scan_to_its_new_bet(index, tmp_path):
+    source = tmp_path / 'open.png.ocr.json'
+    old_fp, _ = index.ingest(slip(details='TO SCORE 26+ POINTS'), source)
+    new_fp, _ = index.ingest(slip(), source)
+    assert [bet['fingerprint'] for bet in bet_rows(index)] == [new_fp] != [old_fp]
+
+
+def test_failed_parses_are_not_bets(index, tmp_path):
+    source = tmp_path / 'open.png.ocr.json'
+    index.ingest(slip(), source)
+    assert index.ingest({'bet_type': '', 'games': []}, source) == (None, False)
+    assert bet_rows(index) == []
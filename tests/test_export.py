@@ -0,0 +1,101 @@
+import csv
+import json
+
+import pytest
+
+from export import export_results
+
+
+def slip(wager):
+    return {'bet_type': 'Parlay', 'total_wager': wager, 'games': []}
+
+
+def scan_all_but(failing=(), crash_at=None):
+    scanned = []
+
+    def scan(item):
+        if item == crash_at:
+            raise KeyboardInterrupt
+        scanned.append(item)
+        return item, [] if item in failing else [slip(len(scanned))]
+    return scan, scanned
+
+
+def exported_files(out_path):
+    return [json.loads(line)['file'] for line in out_path.read_text().splitlines()]
+
+
+def test_export_writes_one_row_per_slip(tmp_path):
+    out_path = tmp_path / 'out.jsonl'
+    scan, _ = scan_all_but()
+    stats = export_results(['a.png', 'b.png'], out_path, scan)
+    assert stats == {'scanned': 2, 'skipped': 0, 'failed': 0}
+    assert exported_files(out_path) == ['a.png', 'b.png']
+
+
+def test_resume_skips_checkpointed_items_and_drops_uncommitted_rows(tmp_path):
+    out_path = tmp_path / 'out.jsonl'
+    items = ['a.png', 'b.png', 'c.png', 'd.png', 'e.png']
+    scan, _ = scan_all_but(crash_at='d.png')
+    with pytest.raises(KeyboardInterrupt):
+        export_results(items, out_path, scan, checkpoint_every=2)
+    # c.png was written after the last checkpoint
+    assert exported_files(out_path) == ['a.png', 'b.png', 'c.png']
+
+    scan, scanned = scan_all_but()
+    stats = export_results(items, out_path, scan, checkpoint_every=2)
+    assert scanned == ['c.png', 'd.png', 'e.png']
+    assert stats == {'scanned': 3, 'skipped': 2, 'failed': 0}
+    assert exported_files(out_path) == items
+
+
+def test_failed_items_are_retried_on_resume(tmp_path):
+    out_path = tmp_path / 'out.jsonl'
+    scan, _ = scan_all_but(failing={'b.png'})
+    assert export_results(['a.png', 'b.png'], out_path, scan)['failed'] == 1
+
+    scan, scanned = scan_all_but()
+    export_results(['a.png', 'b.png'], out_path, scan)
+    assert scanned == ['b.png']
+    assert exported_files(out_path) == ['a.png', 'b.png']
+
+
+def test_restart_discards_checkpoint(tmp_path):
+    out_path = tmp_path / 'out.jsonl'
+    export_results(['a.png'], out_path, scan_all_but()[0])
+    scan, scanned = scan_all_but()
+    export_results(['a.png'], out_path, scan, resume=False)
+    assert scanned == ['a.png']
+    assert exported_files(out_path) == ['a.png']
+
+
+def test_resume_rejects_a_different_format(tmp_path):
+    out_path = tmp_path / 'out.jsonl'
+    export_results(['a.png'], out_path, scan_all_but()[0])
+    with pytest.raises(ValueError):
+        export_results(['a.png'], out_path, scan_all_but()[0], legs=True)
+
+
+def test_csv_header_is_written_once_across_resumes(tmp_path):
+    out_path = tmp_path / 'out.csv'
+    export_results(['a.png'], out_path, scan_all_but()[0])
+    export_results(['a.png', 'b.png'], out_path, scan_all_but()[0])
+    with open(out_path, newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0][0] == 'file'
+    assert [row[0] for row in rows[1:]] == ['a.png', 'b.png']
+
+
+def test_scan_all_receives_only_remaining_items(tmp_path):
+    out_path = tmp_path / 'out.jsonl'
+    export_results(['a.png'], out_path, scan_all_but()[0])
+    seen = []
+
+    def scan_all(items):
+        for item in items:
+            seen.append(item)
+            yield item, [slip(1)]
+
+    stats = export_results(['a.png', 'b.png', 'c.png'], out_path, scan_all=scan_all)
+    assert seen == ['b.png', 'c.png']
+    assert stats['skipped'] == 1
@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+
+import jobqueue
+from jobqueue import JobQueue, SqliteQueue, retry_delay, scan_queued, work
+from scheduler import BULK, INTERACTIVE
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobqueue.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SqliteQueue(tmp_path / 'queue.db')
+    yield queue
+    queue.close()
+
+
+def test_job_queue_is_abstract():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+
+def test_lease_takes_the_oldest_job_of_the_first_class_with_one(queue, clock):
+    first = queue.enqueue({'n': 1}, priority=BULK)
+    clock.now += 1
+    second = queue.enqueue({'n': 2}, priority=INTERACTIVE)
+    clock.now += 1
+    third = queue.enqueue({'n': 3}, priority=BULK)
+    assert queue.lease('w', priorities=[INTERACTIVE, BULK]).id == second
+    assert queue.lease('w', priorities=[INTERACTIVE, BULK]).id == first
+    assert queue.lease('w', priorities=[INTERACTIVE]) is None
+    job = queue.lease('w', priorities=[BULK])
+    assert (job.id, job.payload, job.attempts, job.priority) == (third, {'n': 3}, 1, BULK)
+    assert queue.lease('w') is None
+
+
+def test_enqueue_rejects_unknown_classes(queue):
+    with pytest.raises(ValueError):
+        queue.enqueue({}, priority='urgent')
+
+
+def test_an_expired_lease_is_handed_out_again(queue, clock):
+    job_id = queue.enqueue({})
+    queue.lease('dead worker', visibility_timeout=10)
+    clock.now += 5
+    assert queue.lease('w', visibility_timeout=10) is None
+    queue.extend(job_id, visibility_timeout=10)
+    clock.now += 9
+    assert queue.lease('w', visibility_timeout=10) is None
+    clock.now += 2
+    job = queue.lease('w', visibility_timeout=10)
+    assert (job.id, job.attempts) == (job_id, 2)
+
+
+def test_failed_jobs_back_off_then_give_up(queue, clock):
+    job_id = queue.enqueue({}, max_attempts=3)
+    for attempt in (1, 2):
+        assert queue.lease('w').attempts == attempt
+        assert queue.fail(job_id, 'boom') is True
+        assert queue.status(job_id)['status'] == 'queued'
+        clock.now += retry_delay(attempt) - 0.1
+        assert queue.lease('w') is None
+        clock.now += 0.2
+    queue.lease('w')
+    assert queue.fail(job_id, 'boom') is False
+    assert queue.status(job_id) == {'status': 'failed', 'attempts': 3, 'result': None, 'error': 'boom'}
+
+
+def test_retry_delay_doubles():
+    assert [retry_delay(n) for n in (1, 2, 3)] == [jobqueue.RETRY_BACKOFF * k for k in (1, 2, 4)]
+
+
+def test_complete_stores_the_result(queue):
+    job_id = queue.enqueue({})
+    queue.lease('w')
+    queue.complete(job_id, [{'total_wager': 10.0}])
+    assert queue.wait(job_id, timeout=0) == {'status': 'done', 'attempts': 1,
+                                             'result': [{'total_wager': 10.0}], 'error': None}
+
+
+def test_wait_treats_a_vanished_job_as_failed(queue):
+    assert queue.wait('missing', timeout=0)['status'] == 'failed'
+    job_id = queue.enqueue({})
+    assert queue.wait(job_id, timeout=0) is None
+
+
+def test_stats_count_jobs_per_class(queue):
+    queue.enqueue({}, priority=BULK)
+    queue.enqueue({}, priority=BULK)
+    queue.enqueue({})
+    queue.lease('w', priorities=[BULK])
+    stats = queue.stats()
+    assert (stats['queued'], stats['leased']) == (2, 1)
+    assert stats['classes'][BULK]['queued'] == 1
+    assert stats['classes'][BULK]['wait']['count'] == 1
+    assert stats['classes'][INTERACTIVE]['queued'] == 1
+
+
+def test_work_completes_and_fails_jobs(queue, monkeypatch):
+    monkeypatch.setattr(jobqueue, 'RETRY_BACKOFF', 0)
+    ok = queue.enqueue({'ok': True})
+    bad = queue.enqueue({'ok': False}, max_attempts=1)
+
+    def handler(payload):
+        if not payload['ok']:
+            raise RuntimeError('unreadable')
+        return ['slip']
+
+    assert work(queue, handler, max_jobs=2) == 2
+    assert queue.status(ok)['result'] == ['slip']
+    assert queue.status(bad)['error'] == 'RuntimeError: unreadable'
+
+
+def test_scan_queued_keeps_a_window_of_jobs_and_yields_in_order(queue, tmp_path):
+    paths = [tmp_path / f'{i}.png' for i in range(7)]
+    peak = []
+    stop = threading.Event()
+
+    def handler(payload):
+        peak.append(queue.stats()['classes'][BULK]['queued'] + 1)
+        return [{'image': payload['image']}] if not payload['image'].endswith('3.png') else []
+
+    worker = threading.Thread(target=work, args=(queue, handler), kwargs={'stop': stop})
+    worker.start()
+    try:
+        results = list(scan_queued(queue, paths, {'sportsbook': 'fanduel'}, window=3))
+    finally:
+        stop.set()
+        worker.join()
+    assert [path for path, _ in results] == paths
+    assert [len(slips) for _, slips in results] == [1, 1, 1, 0, 1, 1, 1]
+    assert max(peak) <= 3
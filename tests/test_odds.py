@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from odds import (MISSING_AMOUNTS, OK, PAYOUT_MISMATCH, UNVERIFIABLE, american_to_decimal, check_payouts,
+                  decimal_to_american, implied_probability, parlay_decimal, slip_odds, validate_batch)
+
+
+def row(wager, payout, odds=None, leg_odds=()):
+    return {'image': 'slip.png', 'slip_index': 1, 'wager': wager, 'payout': payout,
+            'odds': odds, 'leg_odds': list(leg_odds)}
+
+
+def test_odds_conversions():
+    assert american_to_decimal([150, -200]) == pytest.approx([2.5, 1.5])
+    assert implied_probability([100, -300, 300]) == pytest.approx([0.5, 0.75, 0.25])
+    assert decimal_to_american([2.5, 1.5]) == pytest.approx([150, -200])
+
+
+def test_parlay_decimal_multiplies_legs_and_ignores_padding():
+    decimal = parlay_decimal([[-110, 120, np.nan], [100, 100, 100], [np.nan, np.nan, np.nan]])
+    assert decimal[:2] == pytest.approx([(1 + 100 / 110) * 2.2, 8.0])
+    assert np.isnan(decimal[2])
+
+
+def test_check_payouts_codes():
+    expected, codes = check_payouts([10, 10, 10, 0], [25, 30, 25, 25], [150, 150, np.nan, 150])
+    assert expected[0] == pytest.approx(25)
+    assert list(codes) == [OK, PAYOUT_MISMATCH, UNVERIFIABLE, MISSING_AMOUNTS]
+
+
+def test_check_payouts_tolerates_cent_rounding():
+    _, codes = check_payouts([10], [19.09], [-110])
+    assert codes[0] == OK
+
+
+def test_slip_odds_reads_total_and_leg_odds():
+    text = 'Same Game Parlay\n+264\nLeBron James\n-110\nNikola Jokic\n+120\n$10.00'
+    assert slip_odds(text, legs=2) == (264, [-110, 120])
+    # Only the legs' odds were read
+    assert slip_odds('A\n-110\nB\n+120', legs=2) == (None, [-110, 120])
+    assert slip_odds('Moneyline\n-150\n$15.00', legs=1) == (-150, [])
+    assert slip_odds('no odds here $10.00', legs=1) == (None, [])
+
+
+def test_validate_batch_reports_only_suspect_slips():
+    suspects = validate_batch([
+        row(10, 25, odds=150),
+        row(10, 52, odds=150),     # misread payout
+        row(10, 25),               # no odds: cannot be checked
+        row(0, 25, odds=150),
+    ])
+    assert [(suspect['payout'], suspect['reason']) for suspect in suspects] == [
+        (52, 'payout_mismatch'), (25, 'missing_amounts')]
+    mismatch = suspects[0]
+    assert mismatch['expected_payout'] == 25.0
+    assert mismatch['odds_from'] == 'slip'
+    assert mismatch['implied_probability'] == 0.4
+
+
+def test_validate_batch_uses_the_parlay_of_leg_odds_without_a_total():
+    ok, wrong = row(10, 42, leg_odds=[-110, 120]), row(10, 60, leg_odds=[-110, 120])
+    suspects = validate_batch([ok, wrong])
+    assert len(suspects) == 1
+    suspect = suspects[0]
+    assert suspect['odds_from'] == 'legs'
+    assert suspect['odds'] == 320
+    assert suspect['expected_payout'] == 42.0
+
+
+def test_validate_batch_empty():
+    assert validate_batch([]) == []
@@ -0,0 +1,65 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from phash import DUPLICATE_DISTANCE, PhashIndex, dhash, hamming, neighbours
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_neighbours_enumerates_the_radius():
+    assert sorted(neighbours(0, 1)) == [0] + [1 << bit for bit in range(16)]
+    assert len(set(neighbours(0xABCD, 2))) == 1 + 16 + 16 * 15 // 2
+
+
+def test_search_finds_hashes_within_the_threshold(tmp_path):
+    index = PhashIndex(tmp_path / 'phash.db')
+    base = 0xF0F0_1234_8000_FFFF      # high bit set: stored as a negative SQLite integer
+    index.add(base, tmp_path / 'a.png.ocr.json', 'a.png')
+    index.add(flip(base, 0, 17, 40, 63), tmp_path / 'b.png.ocr.json', 'b.png')
+    index.add(flip(base, 0, 1, 2, 3, 4), tmp_path / 'c.png.ocr.json', 'c.png')
+    assert [(distance, image) for distance, _, image in index.search(flip(base, 5))] == [(1, 'a.png')]
+    assert [(distance, image) for distance, _, image in index.search(base)] == [(0, 'a.png'), (4, 'b.png')]
+    index.close()
+
+
+def test_search_agrees_with_a_linear_scan(tmp_path):
+    rng = random.Random(7)
+    index = PhashIndex(tmp_path / 'phash.db')
+    stored = {}
+    base = rng.getrandbits(64)
+    for i in range(300):
+        # Mostly near the base so some fall inside the threshold
+        value = flip(base, *rng.sample(range(64), rng.randint(0, 8))) if i % 2 else rng.getrandbits(64)
+        stored[f'{i}.png'] = value
+        index.add(value, tmp_path / f'{i}.png.ocr.json', f'{i}.png')
+    for query in [base, flip(base, 3, 33), rng.getrandbits(64)]:
+        expected = sorted((hamming(query, value), image) for image, value in stored.items()
+                          if hamming(query, value) <= DUPLICATE_DISTANCE)
+        assert [(distance, image) for distance, _, image in index.search(query)] == expected
+    index.close()
+
+
+def test_re_adding_a_record_replaces_its_hash(tmp_path):
+    index = PhashIndex(tmp_path / 'phash.db')
+    record = tmp_path / 'a.png.ocr.json'
+    index.add(0, record, 'a.png')
+    index.add((1 << 64) - 1, record, 'a.png')
+    assert index.search(0) == []
+    index.remove(record)
+    assert index.search((1 << 64) - 1) == []
+    index.close()
+
+
+def test_dhash_survives_small_changes():
+    image = Image.new('L', (390, 844), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(60, 800, 48):
+        draw.rectangle((30, y, 30 + (y * 7) % 300, y + 20), fill=0)
+    changed = image.copy()
+    ImageDraw.Draw(changed).text((10, 5), '9:41', fill=0)    # status-bar clock
+    assert hamming(dhash(image), dhash(changed)) <= DUPLICATE_DISTANCE
@@ -0,0 +1,79 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+import rescan
+from archive import archive_path, write_record
+from rescan import BLOCK, RecentScans, block_signature, changed_rows, merge_lines, plan_regions
+
+
+def slip_image(score='101-99'):
+    image = Image.new('L', (320, 320), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 300, 40), fill=0)      # header
+    draw.text((20, 150), score, fill=0)            # live score
+    draw.rectangle((20, 260, 300, 280), fill=0)    # footer
+    return image
+
+
+def test_changed_rows_flags_only_rows_that_differ():
+    old = block_signature(slip_image('101-99'))
+    rows, fraction = changed_rows(old, block_signature(slip_image('104-99')))
+    assert 0 < fraction < 0.1
+    changed = set(np.flatnonzero(rows))
+    assert changed and changed <= {150 // BLOCK, 150 // BLOCK + 1}
+
+
+def test_plan_regions_grows_to_whole_lines_and_merges_neighbours():
+    rows = np.zeros(20, dtype=bool)
+    rows[[3, 5]] = True
+    lines = [[40, 60, 'a'], [70, 100, 'b']]
+    # Rows 3 and 5 each touch a text line; padded to cover them they overlap
+    assert plan_regions(rows, lines, 320) == [(34, 106)]
+    assert plan_regions(np.zeros(20, dtype=bool), lines, 320) == []
+
+
+def test_merge_lines_replaces_lines_inside_regions_in_order():
+    lines = [[10, 20, 'header'], [100, 120, 'Q3 101-99'], [200, 220, 'footer']]
+    merged = merge_lines(lines, [(90, 130)], [[[98, 118, 'Q4 104-99'], [120, 128, 'LIVE']]])
+    assert [text for _, _, text in merged] == ['header', 'Q4 104-99', 'LIVE', 'footer']
+
+
+def test_recent_scans_match_picks_the_closest_same_size_scan(tmp_path):
+    scans = RecentScans()
+    scans.seeded.add(tmp_path)
+    before = block_signature(slip_image('101-99'))
+    other = block_signature(Image.new('L', (320, 320), 128))
+    scans.add(tmp_path / 'other.png.ocr.json', (320, 320), other)
+    scans.add(tmp_path / 'before.png.ocr.json', (320, 320), before)
+    match = scans.match(tmp_path, (320, 320), block_signature(slip_image('104-99')))
+    assert match[0] == tmp_path / 'before.png.ocr.json'
+    assert scans.match(tmp_path, (640, 320), before) is None
+
+
+def test_rescan_cards_only_re_ocrs_changed_regions(tmp_path, monkeypatch):
+    from scanner import BetSlipScanner
+
+    before = slip_image('101-99')
+    record_path = archive_path(tmp_path / 'before.png')
+    write_record(record_path, {'image': 'before.png', 'slips': [{
+        'box': None, 'text': 'SGP\nQ3 101-99\n$10.00',
+        'lines': [[20, 40, 'SGP'], [150, 162, 'Q3 101-99'], [260, 280, '$10.00']]}]})
+    scans = RecentScans()
+    scans.seeded.add(tmp_path)
+    scans.add(record_path, before.size, block_signature(before))
+    monkeypatch.setattr(rescan, 'recent_scans', scans)
+
+    crops = []
+
+    def run_tesseract_lines(crop, config=None, offset=0, deadline=None):
+        crops.append((offset, crop.size[1]))
+        return [[offset + 6, offset + 18, 'Q4 104-99']]
+
+    scanner = BetSlipScanner(verbose=False)
+    monkeypatch.setattr(scanner, 'run_tesseract_lines', run_tesseract_lines)
+    after = slip_image('104-99')
+    cards, extras = scanner.rescan_cards(after, tmp_path / 'after.png', block_signature(after))
+    assert cards[0]['text'] == 'SGP\nQ4 104-99\n$10.00'
+    assert extras['rescan_of'] == 'before.png'
+    # Only a band around the score was read again
+    assert len(crops) == 1 and crops[0][1] < 320 // 4
@@ -0,0 +1,65 @@
+import pytest
+
+import scheduler
+from scheduler import BULK, INTERACTIVE, Scheduler, WaitStats, parse_weights
+
+
+@pytest.fixture(autouse=True)
+def pause_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, 'PAUSE_FILE', tmp_path / 'bulk.paused')
+
+
+def lease(sched, waiting):
+    """Lease one job the way work() does, from the first class in order with jobs waiting."""
+    order = sched.order()
+    name = next((name for name in order if name in waiting), None)
+    if name is not None:
+        sched.charge(name, order)
+    return name
+
+
+def test_busy_classes_share_leases_by_weight():
+    sched = Scheduler({INTERACTIVE: 4, BULK: 1})
+    leased = [lease(sched, {INTERACTIVE, BULK}) for _ in range(50)]
+    assert leased.count(INTERACTIVE) == 40
+    # Never more than four interactive jobs in a row
+    assert BULK in leased[:5]
+
+
+def test_an_idle_class_does_not_catch_up():
+    sched = Scheduler({INTERACTIVE: 4, BULK: 1})
+    for _ in range(20):
+        assert lease(sched, {BULK}) == BULK
+    leased = [lease(sched, {INTERACTIVE, BULK}) for _ in range(50)]
+    # Bulk's head start is not held against it either: it gets its turn within one stride
+    assert BULK in leased[:6]
+    assert 9 <= leased.count(BULK) <= 11
+
+
+def test_interactive_only_workers_never_take_bulk():
+    sched = Scheduler(bulk=False)
+    assert sched.order() == [INTERACTIVE]
+    assert lease(sched, {BULK}) is None
+
+
+def test_pausing_bulk_leaves_it_out_of_the_order():
+    sched = Scheduler()
+    scheduler.pause_bulk()
+    assert scheduler.bulk_paused()
+    assert sched.order() == [INTERACTIVE]
+    scheduler.resume_bulk()
+    scheduler.resume_bulk()    # resuming twice is fine
+    assert set(sched.order()) == {INTERACTIVE, BULK}
+
+
+def test_parse_weights():
+    assert parse_weights('interactive=3, bulk=0.5') == {INTERACTIVE: 3.0, BULK: 0.5}
+    for spec in ('interactive=3', 'interactive=3,bulk=0', 'interactive=1,bulk=1,batch=1'):
+        with pytest.raises(ValueError):
+            parse_weights(spec)
+
+
+def test_wait_stats_percentiles():
+    stats = WaitStats(float(n) for n in range(1, 101)).snapshot()
+    assert stats == {'count': 100, 'mean_s': 50.5, 'p50_s': 50.0, 'p95_s': 95.0, 'max_s': 100.0}
+    assert WaitStats().snapshot()['p95_s'] == 0.0
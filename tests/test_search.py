@@ -0,0 +1,78 @@
+import pytest
+
+from search import SearchIndex, match_expression, player_name, prop_details
+
+
+@pytest.mark.parametrize('query, expression', [
+    ('lebron 3+', '"lebron" AND "3"'),
+    ('"made threes"', '"made threes"'),
+    ('jok*', '"jok"*'),
+    ('player:jok* prop:"made threes"', 'players : "jok"* AND props : "made threes"'),
+    ('TEXT:won', 'text : "won"'),
+    ("o'neal", '"o neal"'),
+    # Not a column: the words are searched like the rest
+    ('foo:bar', '"foo bar"'),
+    ('10:30 lebron', '"10 30" AND "lebron"'),
+    ('"unterminated phrase', '"unterminated phrase"'),
+])
+def test_match_expression(query, expression):
+    assert match_expression(query) == expression
+
+
+@pytest.mark.parametrize('query', ['', '   ', '+ - *', '""'])
+def test_match_expression_without_terms(query):
+    assert match_expression(query) is None
+
+
+def test_field_normalization():
+    assert player_name('MONEYLINE: Denver Nuggets') == 'denver nuggets'
+    assert prop_details('To Record 10+ Assists!') == 'to record 10+ assists'
+
+
+def slip(player, details, wager=10.0):
+    return {'bet_type': 'Parlay', 'total_wager': wager, 'total_payout': wager * 5,
+            'games': [{'game': 'LAL @ DEN', 'positions': [{'position': player, 'details': details}]}]}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(tmp_path / 'search.db')
+    index.add(slip('Nikola Jokic', 'To Record 10+ Assists'), 'Jokic 10+ assists $10.00',
+              tmp_path / 'a.png.ocr.json', scanned_at='2026-01-01T00:00:00')
+    index.add(slip('LeBron James', 'Made Threes 3+'), 'LeBron made threes assists $5.00',
+              tmp_path / 'b.png.ocr.json', scanned_at='2026-01-02T00:00:00')
+    yield index
+    index.close()
+
+
+def images(response):
+    return [hit['image'] for hit in response['results']]
+
+
+def test_search_matches_across_columns_most_recent_first(index):
+    assert images(index.search('assists')) == ['b.png', 'a.png']
+    assert images(index.search('"made threes" lebron')) == ['b.png']
+
+
+def test_column_filters_limit_terms_to_one_column(index):
+    assert images(index.search('prop:assists')) == ['a.png']
+    assert images(index.search('player:jok*')) == ['a.png']
+    assert images(index.search('player:assists')) == []
+
+
+def test_hits_do_not_expose_server_paths(index):
+    hit = index.search('jokic')['results'][0]
+    assert 'source' not in hit
+    assert (hit['image'], hit['players'], hit['wager']) == ('a.png', ['nikola jokic'], 10.0)
+
+
+def test_reindexing_a_slip_replaces_it(index, tmp_path):
+    index.add(slip('Jamal Murray', 'To Score 20+ Points'), 'Murray 20+ points $10.00', tmp_path / 'a.png.ocr.json')
+    assert images(index.search('jokic')) == []
+    assert images(index.search('murray')) == ['a.png']
+
+
+def test_paging(index):
+    page = index.search('assists', page=2, per_page=1)
+    assert images(page) == ['a.png']
+    assert (page['total'], page['total_exact']) == (2, True)
@@ -0,0 +1,55 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from segment import find_cards, join_cards
+
+
+def test_join_cards_rejoins_a_card_split_at_a_divider():
+    boxes = [(10, 0, 90, 200), (5, 220, 95, 400), (10, 420, 90, 600)]
+    texts = ['Same Game Parlay\nLeBron James', 'TO SCORE 25+ POINTS\n$10.00 TOTAL WAGER',
+             'Moneyline\n$5.00 TOTAL WAGER']
+    assert join_cards(boxes, texts) == [
+        ((5, 0, 95, 400), 'Same Game Parlay\nLeBron James\nTO SCORE 25+ POINTS\n$10.00 TOTAL WAGER'),
+        ((10, 420, 90, 600), 'Moneyline\n$5.00 TOTAL WAGER'),
+    ]
+
+
+def test_join_cards_drops_segments_after_the_last_wager():
+    boxes = [(0, 0, 100, 200), (0, 220, 100, 300)]
+    assert join_cards(boxes, ['Parlay\n$10.00', 'Home  Bets  Account']) == [((0, 0, 100, 200), 'Parlay\n$10.00')]
+
+
+def test_join_cards_without_any_wager_line():
+    assert join_cards([(0, 0, 100, 200), (0, 220, 100, 400)], ['Parlay', 'LeBron James']) == []
+
+
+def draw_cards(tops, height=1200, width=400):
+    image = Image.new('RGB', (width, height), (230, 230, 230))
+    draw = ImageDraw.Draw(image)
+    for top, bottom in tops:
+        draw.rectangle((20, top, width - 21, bottom - 1), fill='white')
+        for y in range(top + 20, bottom - 20, 30):
+            draw.line((40, y, width - 60, y), fill='black', width=3)
+    return image
+
+
+def test_find_cards_splits_at_page_gaps():
+    boxes = find_cards(draw_cards([(40, 560), (620, 1160)]))
+    assert [(top, bottom) for _, top, _, bottom in boxes] == [(40, 560), (620, 1160)]
+    assert all(left == 20 and right == 380 for left, _, right, _ in boxes)
+
+
+def test_find_cards_returns_the_whole_image_for_a_single_card():
+    assert find_cards(draw_cards([(40, 1160)])) == [(0, 0, 400, 1200)]
+
+
+def test_ocr_cards_reuses_segment_text_when_segments_form_one_card(monkeypatch):
+    from scanner import BetSlipScanner
+
+    scanner = BetSlipScanner(verbose=False)
+    texts = iter(['Same Game Parlay\nLeBron James', 'TO SCORE 25+ POINTS\n$10.00 TOTAL WAGER'])
+    monkeypatch.setattr(scanner, 'ocr_image', lambda crop, deadline=None: next(texts))
+    monkeypatch.setattr(scanner, 'run_tesseract_lines', lambda *args, **kwargs: pytest.fail('image OCR\'d again'))
+    cards = scanner.ocr_cards(draw_cards([(40, 560), (620, 1160)]))
+    assert cards == [{'box': [20, 40, 380, 1160],
+                      'text': 'Same Game Parlay\nLeBron James\nTO SCORE 25+ POINTS\n$10.00 TOTAL WAGER'}]
@@ -0,0 +1,38 @@
+import numpy as np
+
+from tiling import plan_tiles, stitch
+
+
+def test_stitch_drops_lines_repeated_across_a_seam():
+    top = 'LeBron James\nTO SCORE 25+ POINTS\nNikola Jokic'
+    bottom = 'Nikola Jokic\nTO RECORD 10+ ASSISTS\n$10.00'
+    assert stitch([top, bottom]) == 'LeBron James\nTO SCORE 25+ POINTS\nNikola Jokic\nTO RECORD 10+ ASSISTS\n$10.00'
+
+
+def test_stitch_tolerates_small_ocr_differences_in_the_overlap():
+    top = 'Anthony Davis\nTO RECORD 10+ REBOUNDS'
+    bottom = 'Anthony Davls\nTO RECORD 10+ REBOUMDS\n$5.00'
+    assert stitch([top, bottom]) == 'Anthony Davis\nTO RECORD 10+ REBOUNDS\n$5.00'
+
+
+def test_stitch_keeps_lines_that_differ_only_in_numbers():
+    top = 'TO SCORE 20+ POINTS'
+    bottom = 'TO SCORE 25+ POINTS'
+    assert stitch([top, bottom]) == 'TO SCORE 20+ POINTS\nTO SCORE 25+ POINTS'
+
+
+def test_stitch_skips_blank_lines():
+    assert stitch(['a\n\n  \nb', '\nc']) == 'a\nb\nc'
+
+
+def test_plan_tiles_cover_the_image_and_cut_at_blank_rows():
+    gray = np.full((5000, 100), 255, dtype=np.uint8)
+    # Ink everywhere except a few blank gaps
+    gray[::2] = 0
+    for gap in (1500, 3100):
+        gray[gap:gap + 40] = 255
+    tiles = plan_tiles(gray, tile_height=1600, overlap=150)
+    assert tiles[0][0] == 0 and tiles[-1][1] == 5000
+    for (_, bottom), (top, _) in zip(tiles, tiles[1:]):
+        assert top < bottom    # neighbours overlap
+    assert all(tile_bottom - tile_top < 1600 * 2 for tile_top, tile_bottom in tiles)
@@ -0,0 +1,117 @@
+"""Tiled OCR for tall scrolling screenshots.
+
+Tesseract gets slow, memory hungry and worse at layout analysis on very
+tall images. Oversized images are cut into horizontal tiles at whitespace
+gaps, each tile extended by an overlap that also ends on whitespace, the
+tiles OCR'd in parallel and the texts stitched back together with the
+duplicated overlap lines removed.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+TILE_TRIGGER_HEIGHT = 3000   # images taller than this are tiled
+TILE_HEIGHT = 1600           # target tile height before overlap
+TILE_OVERLAP = 150           # pixels each tile extends into its neighbours
+GAP_SEARCH = 250             # how far from a target cut to look for whitespace
+BLANK_ROW_TOLERANCE = 12     # max grey-level spread for a row to count as blank
+MAX_OVERLAP_LINES = 12       # lines compared when de-duplicating a seam
+
+
+def needs_tiling(image) -> bool:
+    width, height = image.size
+    return height > TILE_TRIGGER_HEIGHT and height > 2 * width
+
+
+def blank_rows(gray: np.ndarray) -> np.ndarray:
+    """Boolean mask of rows with (almost) no ink."""
+    spread = gray.max(axis=1).astype(np.int16) - gray.min(axis=1).astype(np.int16)
+    return spread <= BLANK_ROW_TOLERANCE
+
+
+def nearest_gap(blank: np.ndarray, target: int, search: int = GAP_SEARCH) -> int:
+    """Centre of the widest blank run near `target`, or `target` itself."""
+    lo = max(0, target - search)
+    hi = min(len(blank), target + search)
+    window = blank[lo:hi]
+    if not window.any():
+        return target
+    # Run boundaries of blank stretches inside the window
+    padded = np.concatenate(([False], window, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[::2], edges[1::2]
+    widths = ends - starts
+    # Prefer wide gaps, then gaps close to the target
+    centres = lo + (starts + ends) // 2
+    best = np.lexsort((np.abs(centres - target), -widths))[0]
+    return int(centres[best])
+
+
+def plan_tiles(gray: np.ndarray, tile_height: int = TILE_HEIGHT,
+               overlap: int = TILE_OVERLAP) -> List[Tuple[int, int]]:
+    """Return (top, bottom) row ranges covering the image with overlapping tiles."""
+    height = gray.shape[0]
+    blank = blank_rows(gray)
+
+    cuts = [0]
+    while height - cuts[-1] > tile_height * 1.5:
+        cut = nearest_gap(blank, cuts[-1] + tile_height)
+        if cut <= cuts[-1]:
+            cut = cuts[-1] + tile_height
+        cuts.append(cut)
+    cuts.append(height)
+
+    tiles = []
+    for top, bottom in zip(cuts, cuts[1:]):
+        if top > 0:
+            top = nearest_gap(blank, max(0, top - overlap), search=overlap // 2)
+        if bottom < height:
+            bottom = nearest_gap(blank, min(height, bottom + overlap), search=overlap // 2)
+        tiles.append((top, bottom))
+    return tiles
+
+
+def _normalize(line: str) -> str:
+    return ' '.join(line.split()).upper()
+
+
+def _lines_match(a: str, b: str) -> bool:
+    # Tolerate small OCR differences between tiles, but never across numbers:
+    # "TO SCORE 20+ POINTS" and "TO SCORE 25+ POINTS" are different legs.
+    a, b = _normalize(a), _normalize(b)
+    if a == b:
+        return True
+    digits = lambda line: [c for c in line if c.isdigit()]
+    return digits(a) == digits(b) and SequenceMatcher(None, a, b).ratio() >= 0.9
+
+
+def stitch(texts: List[str], max_overlap: int = MAX_OVERLAP_LINES) -> str:
+    """Join tile texts, dropping lines repeated across each seam."""
+    merged: List[str] = []
+    for text in texts:
+        lines = [line for line in text.split('\n') if line.strip()]
+        overlap = 0
+        for k in range(min(max_overlap, len(merged), len(lines)), 0, -1):
+            if all(_lines_match(a, b) for a, b in zip(merged[-k:], lines[:k])):
+                overlap = k
+                break
+        merged.extend(lines[overlap:])
+    return '\n'.join(merged)
+
+
+def ocr_tiled(image, ocr: Callable, workers: Optional[int] = None) -> str:
+    """OCR `image` tile by tile in parallel with `ocr(tile) -> str`.
+
+    Threads are enough here: each tesseract call runs in its own subprocess.
+    """
+    gray = np.asarray(image.convert('L'))
+    tiles = plan_tiles(gray)
+    width = image.size[0]
+    crops = [image.crop((0, top, width, bottom)) for top, bottom in tiles]
+    workers = workers or min(len(crops), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        texts = list(pool.map(ocr, crops))
+    return stitch(texts)
@@ -0,0 +1,143 @@
+"""Sportsbook vocabulary and pattern files for tesseract.
+
+Tesseract's generic English model misreads prop terms and player names,
+which the parser then has to patch up with regexes. This module builds a
+`--user-words` file (prop vocabulary, sportsbook terms and the roster) and
+a `--user-patterns` file (money, odds, thresholds, game times) for each
+sportsbook. The files are cached under CACHE_DIR, named by a hash of their
+content, so each version is built once and recorded in archived scans via
+the OCR config.
+"""
+import hashlib
+import os
+import re
+import shlex
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from scanner import CACHE_DIR
+
+VOCAB_VERSION = '1'
+VOCAB_DIR = CACHE_DIR / 'vocab'
+ROSTER_FILE = Path(os.environ.get('CAPPING_ROSTER', Path(__file__).parent / 'roster.txt'))
+
+PROP_TERMS = [
+    'MADE THREES', 'TO SCORE', 'POINTS', 'TO RECORD', 'REBOUNDS', 'ASSISTS',
+    'DOUBLE DOUBLE', 'TRIPLE DOUBLE', 'FIRST BASKET', 'PTS + REB + AST',
+    'ALT PASSING YDS', 'ALT RUSHING YDS', 'ALT RECEIVING YDS', 'ALT PASSING TDS',
+    'ALT RUSHING TDS', 'ANYTIME TOUCHDOWN SCORER', 'ANY TIME TOUCHDOWN SCORER',
+    'MONEYLINE', 'SPREAD', 'TOTAL POINTS', 'OVER', 'UNDER',
+    'SAME GAME PARLAY', 'PARLAY', 'LEG', 'SELECTIONS', 'INCLUDES',
+    'TOTAL WAGER', 'TOTAL PAYOUT', 'LIVE', 'Finished', 'ET', 'PM', 'AM',
+]
+
+SPORTSBOOK_TERMS = {
+    'fanduel': ['WON ON FANDUEL', 'FanDuel', 'SAME GAME PARLAY+', 'SGP'],
+    'draftkings': ['DraftKings', 'SGP', 'SGPx', 'WON', 'Cash Out', 'Odds Boost'],
+}
+
+PATTERNS = [
+    # Money: $5.00, $25.00, $100.00, $1,250.00
+    r'$\d.\d\d', r'$\d\d.\d\d', r'$\d\d\d.\d\d', r'$\d,\d\d\d.\d\d', r'$\d\d,\d\d\d.\d\d',
+    # American odds
+    r'+\d\d\d', r'-\d\d\d', r'+\d\d\d\d', r'-\d\d\d\d', r'+\d\d\d\d\d',
+    # Prop thresholds and lines
+    r'\d+', r'\d\d+', r'\d\d\d+', r'\d.\d', r'\d\d.\d', r'\d\d\d.\d',
+    # Game times
+    r'\d:\d\dPM', r'\d\d:\d\dPM', r'\d:\d\dAM', r'\d\d:\d\dAM',
+    # Leg counts
+    r'\d-leg', r'\d\d-leg',
+]
+
+
+def sportsbooks() -> List[str]:
+    return sorted(SPORTSBOOK_TERMS)
+
+
+def load_roster(path: Path = ROSTER_FILE) -> List[str]:
+    """Player names, one per line; '#' starts a comment."""
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return []
+    return [line.split('#', 1)[0].strip() for line in lines if line.split('#', 1)[0].strip()]
+
+
+def build_words(sportsbook: str, roster: Iterable[str]) -> List[str]:
+    """Distinct single words, in the upper/title case variants seen on slips."""
+    words = set()
+    for phrase in PROP_TERMS + SPORTSBOOK_TERMS.get(sportsbook, []):
+        words.update(word for word in phrase.split() if re.search(r'[A-Za-z]', word))
+    for name in roster:
+        for word in name.split():
+            if re.search(r'[A-Za-z]', word):
+                words.add(word)
+                words.add(word.upper())
+    return sorted(words)
+
+
+def _write_if_missing(path: Path, lines: List[str]):
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    tmp_path.write_text('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def _roster_key(path: Path) -> Tuple[str, int]:
+    try:
+        return str(path), path.stat().st_mtime_ns
+    except OSError:
+        return str(path), 0
+
+
+@lru_cache(maxsize=None)
+def _vocabulary_files(sportsbook: str, roster_key: Tuple[str, int]) -> Tuple[Path, Path]:
+    words = build_words(sportsbook, load_roster(Path(roster_key[0])))
+    digest = hashlib.sha1('\n'.join([VOCAB_VERSION] + words + PATTERNS).encode('utf-8')).hexdigest()[:12]
+    words_path = VOCAB_DIR / f'{sportsbook}-{digest}.user-words'
+    patterns_path = VOCAB_DIR / f'{sportsbook}-{digest}.user-patterns'
+    _write_if_missing(words_path, words)
+    _write_if_missing(patterns_path, PATTERNS)
+    return words_path, patterns_path
+
+
+def vocabulary_files(sportsbook: str, roster_path: Path = ROSTER_FILE) -> Tuple[Path, Path]:
+    """(user-words, user-patterns) paths for a sportsbook, built on first use."""
+    if sportsbook not in SPORTSBOOK_TERMS:
+        raise ValueError(f"Unknown sportsbook '{sportsbook}'; expected one of {', '.join(sportsbooks())}")
+    return _vocabulary_files(sportsbook, _roster_key(roster_path))
+
+
+def vocabulary_config(sportsbook: Optional[str]) -> str:
+    """Tesseract command-line options selecting the sportsbook's vocabulary."""
+    if not sportsbook:
+        return ''
+    words_path, patterns_path = vocabulary_files(sportsbook)
+    return f"--user-words {shlex.quote(str(words_path))} --user-patterns {shlex.quote(str(patterns_path))}"
+
+
+def harvest_roster(record_paths: Iterable[Path], roster_path: Path = ROSTER_FILE) -> int:
+    """Add player names from archived scans to the roster; returns how many were new."""
+    from archive import load_record, record_slips
+    known = set(load_roster(roster_path))
+    found = []
+    for record_path in record_paths:
+        try:
+            record = load_record(record_path)
+        except (OSError, ValueError):
+            continue
+        for slip in record_slips(record):
+            for game in (slip.get('result') or {}).get('games', []):
+                for leg in game['positions']:
+                    name = leg['position']
+                    # Only plausible "First Last" names, not moneyline labels or OCR noise
+                    if re.fullmatch(r"[A-Z][a-zA-Z.'-]+(?: [A-Z][a-zA-Z.'-]+){1,2}", name) and name not in known:
+                        known.add(name)
+                        found.append(name)
+    if found:
+        with open(roster_path, 'a') as f:
+            f.write('\n'.join(found) + '\n')
+    return len(found)
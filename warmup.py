@@ -0,0 +1,117 @@
+"""Startup warm-up for the web app and queue workers.
+
+The first upload after a start used to pay for PIL plugin loading, the
+tesseract model load, building the vocabulary files and compiling the
+Jinja templates. `WarmUp` does all of that at startup by rendering the
+built-in sample slip to an image and running it through load, OCR and
+parse, then rendering the result page. OCR pool workers are spawned and
+used for the sample. When scans go to queue workers, the web process
+skips the OCR stage. `/ready` reports 503 until it has
+succeeded, so a load balancer only routes traffic to a warm instance.
+Queue workers run it (without an app, so no templates) before leasing
+their first job.
+"""
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+
+from samples import SAMPLE_SLIP_TEXT
+
+WARMUP_RETRY_S = 30
+
+
+def render_slip(text: str = SAMPLE_SLIP_TEXT, size: int = 40):
+    """Black-on-white image of slip text, legible enough for tesseract."""
+    from PIL import Image, ImageDraw, ImageFont
+    font = ImageFont.load_default(size=size)
+    lines = text.strip().splitlines()
+    line_height = int(size * 1.6)
+    image = Image.new('RGB', (1170, line_height * len(lines) + 2 * size), 'white')
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((size, size + i * line_height), line, fill='black', font=font)
+    return image
+
+
+class WarmUp(threading.Thread):
+    """Warms the scan pipeline and templates; retries until it succeeds.
+
+    With `app=None` only the scan pipeline is warmed.
+    """
+
+    def __init__(self, app, sportsbook: str, ocr: bool = True, ocr_pool=None):
+        super().__init__(name='warmup', daemon=True)
+        self.app = app
+        self.sportsbook = sportsbook
+        self.ocr = ocr
+        self.ocr_pool = ocr_pool
+        self.ready = threading.Event()
+        self.error = None
+        self.timings = {}
+
+    def warm(self) -> Dict[str, float]:
+        from flask import render_template
+        from scanner import BetSlipScanner
+
+        timings = {}
+        scanner = BetSlipScanner(verbose=False, sportsbook=self.sportsbook)
+        if self.ocr_pool is not None:
+            start = time.perf_counter()
+            self.ocr_pool.start()
+            timings['workers'] = time.perf_counter() - start
+        if self.ocr:
+            start = time.perf_counter()
+            with tempfile.TemporaryDirectory() as tmp:
+                image_path = Path(tmp) / 'warmup.png'
+                render_slip().save(image_path)
+                image = scanner.load_image(image_path)
+                timings['decode'] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                if self.ocr_pool is not None:
+                    cards = self.ocr_pool.ocr_cards(scanner, image)
+                else:
+                    cards = scanner.ocr_cards(image)
+                timings['ocr'] = time.perf_counter() - start
+            if not any(card['text'].strip() for card in cards):
+                raise RuntimeError('tesseract returned no text for the sample slip')
+        else:
+            # Scan workers do the OCR; the web process only parses and renders
+            cards = [{'text': SAMPLE_SLIP_TEXT}]
+
+        start = time.perf_counter()
+        results = [scanner.extract_legs(card['text']) for card in cards]
+        for result in results:
+            result['file'] = 'warmup.png'
+        timings['parse'] = time.perf_counter() - start
+        if self.app is None:
+            return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+        start = time.perf_counter()
+        for name in self.app.jinja_env.list_templates():
+            self.app.jinja_env.get_template(name)
+        if self.app.test_client().get('/').status_code != 200:
+            raise RuntimeError('index page failed to render')
+        with self.app.test_request_context():
+            render_template('result.html', results=results, filename='warmup.png', datetime=datetime)
+        timings['templates'] = time.perf_counter() - start
+        return {stage: round(seconds, 3) for stage, seconds in timings.items()}
+
+    def run(self):
+        while not self.ready.is_set():
+            try:
+                self.timings = self.warm()
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"Warm-up failed, retrying in {WARMUP_RETRY_S}s: {self.error}")
+                time.sleep(WARMUP_RETRY_S)
+                continue
+            self.error = None
+            self.ready.set()
+            print(f"Warm-up complete: {self.timings}")
+
+    def status(self) -> Dict:
+        return {'ready': self.ready.is_set(), 'error': self.error, 'timings': self.timings}